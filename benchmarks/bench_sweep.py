@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+# Benchmark suite for the sweep engine and the viewer hot paths.
+#
+# It generates synthetic sweeps of configurable size, and times:
+# - `parameter_sweep` overhead with no-op experiments
+# - `parameter_sweep_parallel` scaling across worker counts
+# - the viewer's `read_resultsCSV` ingestion
+# - the viewer's `draw_graphics`: directory matching (reload_images=True) and result lookup (reload_images=False)
+# The viewer is run headless with the offscreen Qt platform.
+#
+# Results are written to a JSON file so that they can be compared between releases, e.g.:
+#   python benchmarks/bench_sweep.py --params 4 --values 5 --workers 1 2 4 -o bench-0.1.5.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import zlib
+import platform
+import argparse
+import signal
+import tempfile
+import multiprocessing
+
+# Make the benchmark use the sweetsweep of this repository, and not an installed one
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sweetsweep
+
+
+all_benchmarks = ["sweep", "parallel", "csv", "viewer"]
+
+
+# Make a synthetic parameter dictionary with `n_params` parameters having `n_values` values each.
+# Parameter types alternate between int, float and str, like in a real sweep.
+def make_param_dict(n_params, n_values):
+    param_dict = {}
+    for p in range(n_params):
+        if p % 3 == 0:
+            param_dict["p%d"%p] = [i+1 for i in range(n_values)]
+        elif p % 3 == 1:
+            param_dict["p%d"%p] = [0.1*(i+1) for i in range(n_values)]
+        else:
+            param_dict["p%d"%p] = ["v%d"%i for i in range(n_values)]
+    return param_dict
+
+
+# Make a specific_dict where a fraction `density` of the parameters (except the first one)
+# only matter when the first parameter has its first value.
+def make_specific_dict(param_dict, density):
+    keys = list(param_dict.keys())
+    n_specific = int(round(density*(len(keys)-1)))
+    if n_specific == 0:
+        return None
+    first = keys[0]
+    return {k: {first: param_dict[first][0]} for k in keys[1:1+n_specific]}
+
+
+# Make skip_exps conditions that skip a fraction `density` of the values of the last parameter,
+# when the first parameter has its last value.
+def make_skip_exps(param_dict, density):
+    keys = list(param_dict.keys())
+    last_values = param_dict[keys[-1]]
+    n_skip = int(round(density*len(last_values)))
+    if n_skip == 0 or len(keys) < 2:
+        return None
+    return [{keys[0]: param_dict[keys[0]][-1], keys[-1]: last_values[:n_skip]}]
+
+
+# Experiment that does nothing but return `n_results` scalar results
+def make_noop_experiment(n_results):
+    def noop_experiment(exp_id, param_dict, exp_dir):
+        return {"r%d"%i: exp_id*0.5+i for i in range(n_results)}
+    return noop_experiment
+
+
+# Build a valid 1x1 gray PNG file, without depending on an image library
+def tiny_png():
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"\x00\x80")) + chunk(b"IEND", b"")
+
+
+# Experiment that writes a tiny image, to build a sweep that the viewer can display
+def make_image_experiment(n_results):
+    png = tiny_png()
+    def image_experiment(exp_id, param_dict, exp_dir):
+        with open(os.path.join(exp_dir, "image.png"), "wb") as f:
+            f.write(png)
+        return {"r%d"%i: exp_id*0.5+i for i in range(n_results)}
+    return image_experiment
+
+
+# Run `func(*args)` in a forked child process and return its result.
+# This isolates the benchmarks from each other (the sweeps redirect stdout, spawn pools, etc.),
+# and silences the output of the sweep so that it doesn't pollute the benchmark output.
+# If the child doesn't finish within `timeout` seconds, it is killed along with its own children
+# (e.g. pool workers), and TimeoutError is raised.
+def run_isolated(func, *args, timeout=None):
+    ctx = multiprocessing.get_context("fork")
+    recv_end, send_end = ctx.Pipe(duplex=False)
+
+    def target():
+        os.setpgrp()    # So that we can kill the whole process tree on timeout
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.dup2(devnull, sys.stderr.fileno())
+        try:
+            send_end.send(("ok", func(*args)))
+        except Exception as e:
+            send_end.send(("error", repr(e)))
+
+    p = ctx.Process(target=target)
+    p.start()
+    if not recv_end.poll(timeout):
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        p.join()
+        raise TimeoutError("Benchmark didn't finish in %gs" % timeout)
+    status, value = recv_end.recv()
+    p.join()
+    if status != "ok":
+        raise RuntimeError(value)
+    return value
+
+
+# Time a function `repeat` times, calling `setup` before each run (not timed)
+def time_repeat(func, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None: setup()
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-t0)
+    return times
+
+
+# Same as time_repeat(), but each run happens in its own child process.
+# Runs that time out are recorded as None.
+def time_repeat_isolated(func, repeat, setup=None, timeout=None):
+    times = []
+    for _ in range(repeat):
+        try:
+            times += run_isolated(time_repeat, func, 1, setup, timeout=timeout)
+        except TimeoutError:
+            times.append(None)
+    return times
+
+
+def bench_sweep(cfg, work_dir):
+    param_dict = make_param_dict(cfg.params, cfg.values)
+    sweep_dir = os.path.join(work_dir, "sweep")
+
+    def setup():
+        shutil.rmtree(sweep_dir, ignore_errors=True)
+        os.makedirs(sweep_dir)
+
+    def run():
+        sweetsweep.parameter_sweep(param_dict, make_noop_experiment(cfg.results), sweep_dir,
+                                   result_csv_filename="results.csv" if cfg.results else "",
+                                   specific_dict=make_specific_dict(param_dict, cfg.specific_density),
+                                   skip_exps=make_skip_exps(param_dict, cfg.skip_density))
+
+    times = time_repeat_isolated(run, cfg.repeat, setup, cfg.timeout)
+    return [make_record("parameter_sweep", {}, times, sweetsweep.get_num_exp(param_dict))]
+
+
+def bench_parallel(cfg, work_dir):
+    param_dict = make_param_dict(cfg.params, cfg.values)
+    sweep_dir = os.path.join(work_dir, "sweep_parallel")
+
+    def setup():
+        shutil.rmtree(sweep_dir, ignore_errors=True)
+        os.makedirs(sweep_dir)
+
+    records = []
+    for n_workers in cfg.workers:
+        def run():
+            sweetsweep.parameter_sweep_parallel(param_dict, make_noop_experiment(cfg.results), sweep_dir,
+                                                max_workers=n_workers,
+                                                result_csv_filename="results.csv" if cfg.results else "")
+        times = time_repeat_isolated(run, cfg.repeat, setup, cfg.timeout)
+        records.append(make_record("parameter_sweep_parallel", {"workers": n_workers}, times,
+                                   sweetsweep.get_num_exp(param_dict)))
+    return records
+
+
+# Create a sweep with one image per experiment, a results CSV, and a `sweep.txt` for the viewer.
+# The sweep is shared by the viewer benchmarks, so it's only created once.
+def make_viewer_sweep(cfg, sweep_dir, param_dict):
+    if os.path.isdir(sweep_dir):
+        return
+
+    def create():
+        os.makedirs(sweep_dir)
+        params = param_dict.copy()
+        params["viewer_filePattern"] = "image.png"
+        params["viewer_resultsCSV"] = "results.csv"
+        with open(os.path.join(sweep_dir, "sweep.txt"), "w") as f:
+            json.dump(params, f)
+        sweetsweep.parameter_sweep(param_dict, make_image_experiment(max(cfg.results, 1)), sweep_dir,
+                                   result_csv_filename="results.csv",
+                                   specific_dict=make_specific_dict(param_dict, cfg.specific_density),
+                                   skip_exps=make_skip_exps(param_dict, cfg.skip_density))
+    run_isolated(create)
+
+
+# Create a viewer window without showing it on screen, nor parsing the benchmark's arguments
+def make_viewer_window():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    from sweetsweep.viewer import Ui
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([sys.argv[0]])
+    argv = sys.argv
+    sys.argv = [argv[0]]
+    try:
+        window = Ui()
+    finally:
+        sys.argv = argv
+    return app, window
+
+
+def viewer_benchmarks(cfg, sweep_dir, param_dict):
+    app, window = make_viewer_window()
+    window.lineEdit_mainFolder.setText(sweep_dir)
+    keys = list(param_dict.keys())
+    n_exp = sweetsweep.get_num_exp(param_dict)
+    records = []
+
+    # Display a grid of the first two parameters, and the first result
+    window.comboBox_xaxis.setCurrentText(keys[0])
+    if len(keys) > 1: window.comboBox_yaxis.setCurrentText(keys[1])
+    grid = {"x": keys[0], "y": keys[1] if len(keys) > 1 else None}
+
+    times = time_repeat(lambda: window.draw_graphics(reload_images=True), cfg.repeat)
+    records.append(make_record("viewer.draw_graphics.dir_matching", grid, times, n_exp))
+
+    if window.comboBox_result.count() > 2:
+        window.comboBox_result.setCurrentIndex(2)   # The first result after "--None--" and "exp_id"
+        times = time_repeat(lambda: window.draw_graphics(reload_images=False, reset_view=False), cfg.repeat)
+        records.append(make_record("viewer.draw_graphics.result_lookup", grid, times, n_exp))
+
+    window.close()
+    return records
+
+
+def bench_viewer(cfg, work_dir):
+    param_dict = make_param_dict(cfg.params, cfg.values)
+    sweep_dir = os.path.join(work_dir, "sweep_viewer")
+    make_viewer_sweep(cfg, sweep_dir, param_dict)
+    return run_isolated(viewer_benchmarks, cfg, sweep_dir, param_dict)
+
+
+def bench_csv(cfg, work_dir):
+    param_dict = make_param_dict(cfg.params, cfg.values)
+    sweep_dir = os.path.join(work_dir, "sweep_viewer")
+    make_viewer_sweep(cfg, sweep_dir, param_dict)
+
+    def run():
+        app, window = make_viewer_window()
+        csv_path = os.path.join(sweep_dir, "results.csv")
+        # Load the config without the CSV, so that only read_resultsCSV() is timed
+        window.fullParamDict = param_dict
+        window.allParamNames = list(param_dict.keys())
+        times = time_repeat(lambda: window.read_resultsCSV(csv_path), cfg.repeat)
+        window.close()
+        return times
+
+    times = run_isolated(run)
+    return [make_record("viewer.read_resultsCSV", {}, times, sweetsweep.get_num_exp(param_dict))]
+
+
+def make_record(name, params, times, num_exp):
+    done = [t for t in times if t is not None]
+    return {"name": name,
+            "params": params,
+            "num_exp": num_exp,
+            "times": times,
+            "timeouts": len(times)-len(done),
+            "best": min(done) if done else None,
+            "mean": sum(done)/len(done) if done else None,
+            "per_exp": min(done)/num_exp if done else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the sweetsweep engine and viewer")
+    parser.add_argument("--params", type=int, default=3, help="Number of swept parameters")
+    parser.add_argument("--values", type=int, default=5, help="Number of values per parameter")
+    parser.add_argument("--specific-density", type=float, default=0.0,
+                        help="Fraction of the parameters that are in specific_dict (between 0 and 1)")
+    parser.add_argument("--skip-density", type=float, default=0.0,
+                        help="Fraction of the values of the last parameter that are skipped (between 0 and 1)")
+    parser.add_argument("--results", type=int, default=3, help="Number of result columns (0 to disable the CSV)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker counts for the parallel sweep")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each benchmark (the best is kept)")
+    parser.add_argument("--only", type=str, nargs="+", default=all_benchmarks, choices=all_benchmarks,
+                        help="Benchmarks to run")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="Time limit (in seconds) of each run of the sweep benchmarks, after which it's recorded as a timeout")
+    parser.add_argument("-o", "--output", type=str, default="bench_output.json", help="Output JSON file")
+    parser.add_argument("--work-dir", type=str, default="",
+                        help="Directory where to create the sweeps (default: a temporary directory)")
+    cfg = parser.parse_args(argv)
+
+    work_dir = cfg.work_dir or tempfile.mkdtemp(prefix="sweetsweep-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+
+    bench_funcs = {"sweep": bench_sweep, "parallel": bench_parallel, "csv": bench_csv, "viewer": bench_viewer}
+    records = []
+    for name in all_benchmarks:
+        if name not in cfg.only: continue
+        for r in bench_funcs[name](cfg, work_dir):
+            params_str = json.dumps(r["params"]) if r["params"] else ""
+            if r["best"] is None:
+                print("%-40s %-20s timed out" % (r["name"], params_str))
+            else:
+                print("%-40s %-20s best: %.4fs  (%.3g ms/exp)%s" % (r["name"], params_str, r["best"], 1000*r["per_exp"],
+                      "  [%d timeouts]" % r["timeouts"] if r["timeouts"] else ""))
+            records.append(r)
+
+    output = {"sweetsweep_version": sweetsweep.__version__,
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "cpu_count": os.cpu_count(),
+              "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "config": {k: v for k, v in vars(cfg).items() if k not in ("output", "work_dir")},
+              "results": records}
+    with open(cfg.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print("Results written to", cfg.output)
+
+    if not cfg.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
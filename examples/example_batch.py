@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# This example demonstrates how to run a sweep of cheap experiments in batches.
+# Instead of being called once per experiment, the experiment function receives a batch of experiments,
+# with the values of each parameter as NumPy arrays, and returns a column of results for the whole batch.
+
+import os
+import json
+import numpy as np
+
+import sweetsweep
+
+# Create the dictionary of values to sweep for each parameter
+param_sweep = {}
+param_sweep["alpha"] = list(np.linspace(0, 10, 100))
+param_sweep["beta"] = list(np.linspace(0.1, 1, 100))
+param_sweep["gamma"] = ["sin", "cos"]
+
+# Main folder for the sweep
+my_sweep_dir = "./my_sweep_batch"
+os.makedirs(my_sweep_dir, exist_ok=True)
+
+# Name of the csv file to save (one row per experiment)
+csv_filename = "results.csv"
+
+# Save the param_sweep file
+params = param_sweep.copy()
+params["viewer_resultsCSV"] = csv_filename
+json.dump(params, open(os.path.join(my_sweep_dir, "sweep.txt"), "w"))
+
+
+# Create the function for a batch of experiments.
+# The sweep.parameter_sweep_batch() will call it with the following arguments:
+# - exp_ids: the experiment indices (NumPy array)
+# - batch_dict: a dictionary containing, for each parameter, a NumPy array of its values in the batch
+# - exp_dirs: the experiment directories (None here, since we pass make_dirs=False)
+def my_experiments(exp_ids, batch_dict, exp_dirs):
+
+    t = np.linspace(0, 1, 100)
+    phase = batch_dict["beta"][:, None]*t - batch_dict["alpha"][:, None]
+    x = np.where(batch_dict["gamma"][:, None] == "sin", np.sin(phase), np.cos(phase))
+
+    # Return one array of results per CSV column, with one value per experiment
+    return {"sum_x": x.sum(axis=1),
+            "max_x": x.max(axis=1)}
+
+
+# Run the sweep. The experiments don't save files, so we don't need to create their directories.
+sweetsweep.parameter_sweep_batch(param_sweep, my_experiments, my_sweep_dir, batch_size=5000,
+                                 result_csv_filename=csv_filename, make_dirs=False)
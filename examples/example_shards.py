@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# This example demonstrates how to split a sweep into shards, each one running a chunk of experiments on a local
+# process pool. This is useful when running an array job in an HPC cluster with many short experiments: instead of
+# one experiment per job (see example_only_exp_id.py), each job of the array runs one shard and uses all the cores
+# of its node.
+# Get the number of jobs to submit for shards of at most 10 experiments with '--get-num-shards 10', and pass the
+# array job index to each job with '--shard K/N'. '--exp-range A:B' runs the experiments with ids from A to B-1.
+# With '--plan', the script only prints the estimated duration of the sweep, using the durations of a previous run.
+# For example, to run the sweep locally in 3 shards:
+#   python examples/example_shards.py --shard 0/3
+#   python examples/example_shards.py --shard 1/3
+#   python examples/example_shards.py --shard 2/3
+
+import os
+import sys
+import math
+import json
+import time
+
+import sweetsweep
+from sweetsweep.shards import parse_sweep_args
+
+
+# Create the dictionary of values to sweep for each parameter
+# For example:
+param_sweep = {}
+param_sweep["alpha"] = [5, 10, 15, 20]
+param_sweep["beta"] = [0.1, 0.2, 0.5, 1.0]
+param_sweep["gamma"] = ["Red", "Blue"]
+
+## ------------------------------------
+# Process argv parameters
+
+# Don't print anything before this line
+exp_ids = parse_sweep_args(param_sweep)
+
+## ------------------------------------
+
+
+my_sweep_dir = "my_sweep"   # Default output dir
+# Main folder for the sweep
+if '-o' in sys.argv:
+    my_sweep_dir = sys.argv[sys.argv.index('-o')+1]
+os.makedirs(my_sweep_dir, exist_ok=True)
+
+# Name of the csv file to save (one row per experiment)
+csv_filename = "results.csv"
+
+# Save the param_sweep file
+params = param_sweep.copy()
+params["viewer_resultsCSV"] = csv_filename
+json.dump(params, open(os.path.join(my_sweep_dir, "sweep.txt"), "w"))
+
+
+# Create the function for the experiment.
+def my_experiment(exp_id, param_dict, exp_dir):
+
+    print("Experiment #%d:"%exp_id, param_dict)
+
+    t0 = time.time()
+    x = [math.sin(param_dict["beta"]*i-param_dict["alpha"]) for i in range(100000)]
+    total_time = time.time() - t0
+
+    return {"time": "%0.2g"%total_time,
+            "sum_x": "%0.2g"%sum(x),
+            "max_x": "%0.2g"%max(x)}
+
+
+# Run the shard on all cores of the node. All shards append their results to the same CSV.
+# If the sweep was already run, use the recorded durations to run the longest experiments first.
+cost = my_sweep_dir if os.path.exists(os.path.join(my_sweep_dir, "timings.csv")) else None
+sweetsweep.parameter_sweep_parallel(param_sweep, my_experiment, my_sweep_dir, max_workers=os.cpu_count(),
+                                    result_csv_filename=csv_filename, exp_ids=exp_ids, cost=cost,
+                                    dry_run='--plan' in sys.argv)
@@ -1,4 +1,10 @@
-from .sweep import parameter_sweep, parameter_sweep_parallel, get_num_exp
+from .sweep import parameter_sweep, parameter_sweep_parallel, parameter_sweep_batch, parameter_sweep_async, get_num_exp
+from .cache import ResultCache
+from .dedup import DedupStore
+from .results import load_array_result, load_results
+from .stages import Stage
+from .shared import SharedArray, mmap_array
+from .commands import parameter_sweep_command
 
 # Define version here
 __version__ = '0.1.5'
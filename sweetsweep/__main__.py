@@ -1,5 +1,54 @@
-from .viewer import start_viewer
+import sys
+
+# Subcommands: python -m sweetsweep <command> ...
+# Without a command, start the viewer: python -m sweetsweep [sweep_dir]
 
 if __name__ == "__main__":
 
-    start_viewer()
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        import argparse
+        from .worker import run_worker
+        parser = argparse.ArgumentParser(prog="python -m sweetsweep worker",
+                                         description="Run experiments of a distributed sweep, until all of them are done.")
+        parser.add_argument("sweep_dir", help="Sweep folder, prepared with prepare_distributed_sweep()")
+        parser.add_argument("--experiment", help="'module:function' or 'file.py:function' of the experiment function, "
+                                                 "to override the one saved in the sweep folder")
+        parser.add_argument("--max-exps", type=int, help="Maximum number of experiments to run with this worker")
+        args = parser.parse_args(sys.argv[2:])
+        run_worker(args.sweep_dir, args.experiment, args.max_exps)
+
+    elif len(sys.argv) > 1 and sys.argv[1] in ("pack", "unpack"):
+        import argparse
+        from .pack import pack_sweep, unpack_sweep
+        parser = argparse.ArgumentParser(prog="python -m sweetsweep " + sys.argv[1],
+                                         description="Pack the files of the experiment folders into indexed archives, "
+                                                     "or extract them back.")
+        parser.add_argument("sweep_dir", help="Sweep folder")
+        if sys.argv[1] == "pack":
+            parser.add_argument("--compress", action="store_true", help="Compress the files (useful for text files)")
+            parser.add_argument("--remove", action="store_true", help="Remove the files once they're packed")
+            parser.add_argument("--archive-size", type=float, default=1024, help="Maximum size of an archive in MB")
+        args = parser.parse_args(sys.argv[2:])
+        if sys.argv[1] == "pack":
+            pack_sweep(args.sweep_dir, int(args.archive_size*2**20), args.compress, args.remove)
+        else:
+            unpack_sweep(args.sweep_dir)
+
+    elif len(sys.argv) > 1 and sys.argv[1] == "stats":
+        import argparse
+        from .stats import sweep_stats, print_stats
+        parser = argparse.ArgumentParser(prog="python -m sweetsweep stats",
+                                         description="Statistics of the results of a sweep, computed by streaming its CSV.")
+        parser.add_argument("sweep_dir", help="Sweep folder")
+        parser.add_argument("--csv", help="CSV file of the results, in the sweep folder (default: the one in sweep.txt)")
+        parser.add_argument("--metric", nargs="+", help="Results to compute statistics of (default: all numeric results)")
+        parser.add_argument("--by", nargs="+", help="Parameters whose combinations define the groups")
+        parser.add_argument("--top", type=int, default=0, help="Show the best experiments for the first metric")
+        parser.add_argument("--max", action="store_true", help="Best is the maximum value instead of the minimum")
+        parser.add_argument("--chunk-size", type=int, default=100000, help="Number of rows processed at once")
+        args = parser.parse_args(sys.argv[2:])
+        print_stats(sweep_stats(args.sweep_dir, args.metric, args.by, args.top, args.max, args.csv, args.chunk_size))
+
+    else:
+        from .viewer import start_viewer
+        start_viewer()
@@ -0,0 +1,180 @@
+# Content-addressed cache of experiment results, that can be shared across sweeps.
+#
+# An experiment is identified by a hash of its parameter dictionary and of the identity of the experiment
+# function (its module and name, plus a user-provided version string). When a sweep runs an experiment that
+# is already in the cache (e.g. a previous sweep with the same parameters but fewer values, or a different
+# `start_index`), its results are read from the cache, and the files of its directory are restored by copying,
+# hardlinking or symlinking them from the cache, instead of calling the experiment function.
+#
+# Layout of the cache folder:
+#   cache_dir/<key[:2]>/<key>/result.json   results, parameters and metadata of the experiment
+#   cache_dir/<key[:2]>/<key>/files/        copy of the experiment directory (if store_dirs=True)
+# The modification time of 'result.json' is updated at each hit, and used for the eviction policy.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+
+class ResultCache(object):
+
+    # - cache_dir: folder of the cache. It can be shared by several sweeps, and by the workers of a parallel sweep.
+    # - version: version of the experiment function. Change it when the code of the experiment changes its
+    #            results, so that the old results are not used anymore.
+    # - store_dirs: whether to also store the files of the experiment directories.
+    # - link: how to restore the files of a cached experiment: "copy", "hardlink" or "symlink".
+    #         Hardlinks and symlinks save space, but modifying the restored files also modifies the cache.
+    # - max_bytes: if > 0, evict() removes the least recently used experiments until the cache is smaller than that.
+    # - max_age: if > 0, evict() removes the experiments that haven't been used for more than `max_age` seconds.
+    def __init__(self, cache_dir, version="", store_dirs=True, link="copy", max_bytes=0, max_age=0):
+        if link not in ("copy", "hardlink", "symlink"):
+            print("ERROR: link must be 'copy', 'hardlink' or 'symlink', not '%s'." % link)
+            exit(-1)
+        self.cache_dir = cache_dir
+        self.version = version
+        self.store_dirs = store_dirs
+        self.link = link
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Stable hash of the experiment function identity and of the parameter dictionary
+    def key(self, experiment_func, current_dict):
+        func_id = getattr(experiment_func, "__module__", "") + "." + \
+                  getattr(experiment_func, "__qualname__", type(experiment_func).__name__)
+        description = json.dumps({"func": func_id, "version": self.version, "params": canonical_value(current_dict)},
+                                  sort_keys=True, default=repr)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    # Look for an experiment in the cache. If it's there, restore its files in `exp_dir`,
+    # and return (True, result_dict). Otherwise, return (False, None).
+    def get(self, experiment_func, current_dict, exp_dir):
+        entry = self.entry_dir(self.key(experiment_func, current_dict))
+        result_file = os.path.join(entry, "result.json")
+        try:
+            with open(result_file) as f:
+                result_dict = json.load(f)["result"]
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return False, None
+        files_dir = os.path.join(entry, "files")
+        if os.path.isdir(files_dir):
+            self.restore_files(files_dir, exp_dir)
+        os.utime(result_file)   # Mark as recently used
+        self.hits += 1
+        return True, result_dict
+
+    # Store the results and the files of an experiment in the cache
+    def put(self, experiment_func, current_dict, exp_dir, result_dict):
+        key = self.key(experiment_func, current_dict)
+        entry = self.entry_dir(key)
+        if os.path.exists(entry):
+            return
+        # Write everything in a temporary folder first, and rename it at the end, so that other processes
+        # never see an incomplete entry.
+        tmp_entry = "%s.tmp-%d-%d" % (entry, os.getpid(), threading.get_ident())
+        os.makedirs(tmp_entry, exist_ok=True)
+        size = 0
+        if self.store_dirs and exp_dir and os.path.isdir(exp_dir):
+            shutil.copytree(exp_dir, os.path.join(tmp_entry, "files"), symlinks=True)
+            size = get_dir_size(os.path.join(tmp_entry, "files"))
+        with open(os.path.join(tmp_entry, "result.json"), "w") as f:
+            json.dump({"result": result_dict, "params": current_dict, "key": key,
+                       "size": size, "created": time.time()}, f, default=json_default)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another process stored the same experiment in the meantime
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+    def restore_files(self, files_dir, exp_dir):
+        for root, dirs, files in os.walk(files_dir):
+            dst_root = os.path.join(exp_dir, os.path.relpath(root, files_dir))
+            os.makedirs(dst_root, exist_ok=True)
+            for name in files:
+                src = os.path.join(root, name)
+                dst = os.path.join(dst_root, name)
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                if self.link == "hardlink":
+                    os.link(src, dst)
+                elif self.link == "symlink":
+                    os.symlink(os.path.abspath(src), dst)
+                else:
+                    shutil.copy2(src, dst)
+
+    # Remove the experiments that are too old, and then the least recently used ones until the cache is small enough
+    def evict(self):
+        if not self.max_bytes and not self.max_age:
+            return 0
+        entries = []
+        for prefix in os.scandir(self.cache_dir):
+            if not prefix.is_dir(): continue
+            for entry in os.scandir(prefix.path):
+                result_file = os.path.join(entry.path, "result.json")
+                try:
+                    last_used = os.path.getmtime(result_file)
+                    with open(result_file) as f:
+                        size = json.load(f).get("size", 0)
+                except (FileNotFoundError, ValueError):
+                    continue    # Entry being written by another process
+                entries.append((last_used, size, entry.path))
+
+        entries.sort()
+        total_size = sum(e[1] for e in entries)
+        now = time.time()
+        num_removed = 0
+        for last_used, size, path in entries:
+            too_old = self.max_age and now - last_used > self.max_age
+            too_big = self.max_bytes and total_size > self.max_bytes
+            if not too_old and not too_big:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+            num_removed += 1
+        return num_removed
+
+    def stats_str(self):
+        total = self.hits + self.misses
+        return "Cache: %d hits, %d misses (%.0f%% hit rate)" % (self.hits, self.misses, 100*self.hits/total if total else 0)
+
+    def print_stats(self):
+        print(self.stats_str())
+
+
+def get_dir_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size += os.lstat(os.path.join(root, name)).st_size
+    return size
+
+
+# Convert a parameter value to plain Python types, so that equal values get the same key whatever their type (e.g.
+# np.int64(3) and 3, or a tuple and a list), and whatever the version of NumPy (its repr of scalars changed in 2.0).
+# Other objects are identified by their repr().
+def canonical_value(value):
+    if hasattr(value, "dtype") and hasattr(value, "tolist"):
+        return canonical_value(value.tolist())  # NumPy scalars and arrays
+    if isinstance(value, dict):
+        return {str(k): canonical_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical_value(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((canonical_value(v) for v in value), key=repr)
+    return value
+
+
+# Convert NumPy scalars (and other objects) so that they can be written in JSON
+def json_default(o):
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
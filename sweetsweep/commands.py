@@ -0,0 +1,100 @@
+# Experiments that run an external program, defined by a command template.
+#
+# The command is formatted with the parameters of each experiment, and with `exp_id` and `exp_dir`, e.g.
+#   "./solver --alpha {alpha} --beta {beta} --out {exp_dir}"
+# The experiments are subprocesses scheduled by parameter_sweep_async(), so up to `max_processes` of them run at the
+# same time without a Python worker process per experiment. The output of each one (stdout and stderr) is written
+# to a file in its directory, and its exit code and running time are written to the CSV, with the results returned
+# by an optional parser.
+
+import os
+import time
+import shlex
+import signal
+import subprocess
+
+from .sweep import parameter_sweep_async
+
+
+# Create an `async def` experiment function that runs a command (see parameter_sweep_command())
+def command_experiment(command, parser=None, output_filename="output.txt", cwd=None, env=None, result_names=None):
+
+    import asyncio
+
+    # Split the command before formatting it, so that parameter values with spaces are passed as one argument
+    args_template = shlex.split(command) if isinstance(command, str) else list(command)
+    # Result names returned by the parser, to have the same columns when a command fails
+    parser_keys = list(result_names) if result_names is not None else []
+
+    async def experiment(exp_id, param_dict, exp_dir):
+        args = [arg.format(exp_id=exp_id, exp_dir=exp_dir, **param_dict) for arg in args_template]
+        t0 = time.time()
+        with open(os.path.join(exp_dir, output_filename), "wb") as f_output:
+            # In its own session, so that the processes it starts can be killed with it
+            process = await asyncio.create_subprocess_exec(*args, stdout=f_output, stderr=subprocess.STDOUT,
+                                                           cwd=cwd, env=env, start_new_session=(os.name == "posix"))
+            try:
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                # The experiment timed out, or the sweep was interrupted
+                kill_process_tree(process)
+                await process.wait()
+                raise
+        result_dict = {"returncode": returncode, "time": time.time()-t0}
+        if returncode != 0:
+            print("WARNING: Experiment %d - the command exited with code %d, see '%s'."
+                  % (exp_id, returncode, os.path.join(exp_dir, output_filename)))
+
+        if parser is not None:
+            if returncode == 0:
+                parsed = parser(exp_dir)
+                if not parser_keys:
+                    parser_keys.extend(parsed.keys())
+                # In the order of the columns
+                result_dict.update({k: "" for k in parser_keys})
+                result_dict.update(parsed)
+            else:
+                if not parser_keys:
+                    print("WARNING: Experiment %d - the command failed before the results of the parser are known, "
+                          "so the CSV won't have their columns. Pass `result_names` to declare them." % exp_id)
+                result_dict.update({k: "" for k in parser_keys})
+        return result_dict
+
+    return experiment
+
+
+def kill_process_tree(process):
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+# Run a parameter sweep where each experiment is a command (see command_experiment()).
+# - command: command template, as a string or a list of arguments. The parameter values, `exp_id` and `exp_dir` can be
+#            used with the format syntax, e.g. "./solver --alpha {alpha} --out {exp_dir}". The command is not run
+#            in a shell.
+# - max_processes: maximum number of commands running at the same time (default: number of CPUs)
+# - parser: an optional function `parser(exp_dir)` called when a command succeeds, which returns a dictionary of
+#           results (e.g. read from the files written by the command) to write to the CSV.
+# - result_names: names of the results returned by `parser`. The columns of the CSV are those of the first experiment
+#                 that finishes, so without them, the parsed results are missing from the CSV if it's a failed command.
+# - output_filename: name of the file where the output of the command is written, in the experiment directory.
+# - timeout: if set, commands running for more than `timeout` seconds are killed.
+# - cwd, env: working directory and environment variables of the commands.
+# - dir_layout, dir_names: see parameter_sweep().
+# The CSV contains the exit code ('returncode') and running time ('time') of each command, followed by the parsed
+# results.
+def parameter_sweep_command(param_dict, command, sweep_dir, max_processes=None, start_index=0, result_csv_filename="",
+                            skip_exps=None, parser=None, output_filename="output.txt", timeout=None, cwd=None,
+                            env=None, dir_layout=None, dir_names="params", result_names=None):
+
+    if max_processes is None:
+        max_processes = os.cpu_count() or 1
+    experiment = command_experiment(command, parser, output_filename, cwd, env, result_names)
+    parameter_sweep_async(param_dict, experiment, sweep_dir, max_concurrency=max_processes, start_index=start_index,
+                          result_csv_filename=result_csv_filename, skip_exps=skip_exps, timeout=timeout,
+                          dir_layout=dir_layout, dir_names=dir_names)
@@ -1,5 +1,156 @@
 # Functions that are common to the sweeper, and the sweep viewer
 
+import os
+import json
+import itertools
+import numpy as np
+from collections import OrderedDict
+
 # Display format for parameter values
 def val2str(v):
     return str(v) if isinstance(v,(str,bool)) else "%0.4g"%v
+
+
+# Layout of the experiment folders in the sweep folder. By default, all experiment folders are directly in the sweep
+# folder, which gets slow to list on network filesystems for huge sweeps. The `dir_layout` argument of the sweep
+# functions can instead group them in subfolders:
+# - None or "flat": all experiment folders are in the sweep folder (default)
+# - "id" or "id:N": by blocks of N consecutive ids (default: 1000), in folders named after the id divided by N,
+#                   e.g. 'exp_0012/exp_001234__alpha5_beta0.1' with N=100.
+# - "param" or "param:name": by value of a parameter (default: the first one), e.g. 'alpha5/exp_1234__alpha5_beta0.1'
+# The `dir_names` argument sets the names of the experiment folders:
+# - "params": the exp_id followed by all parameter names and values, e.g. 'exp_1234__alpha5_beta0.1' (default)
+# - "id": only the exp_id, e.g. 'exp_1234'
+# - "hash": a hash of the parameters, e.g. 'exp_3f2a9c0d41b7e865'
+# With 30+ parameters, the default names can exceed the maximum length of file names. With "id" or "hash" names, the
+# sweep writes an index of the folders (see write_dir_index()), which the viewer uses to find them.
+# The layout is recorded in 'sweep.txt' as "viewer_dirLayout", for the viewer to find the folders.
+
+# Get the layout as a dictionary from the `dir_layout` and `dir_names` arguments (None for the default layout)
+def parse_dir_layout(dir_layout, param_dict, start_index=0, dir_names="params"):
+    if isinstance(dir_layout, dict):
+        return dir_layout
+    if dir_names not in ("params", "id", "hash"):
+        print("ERROR: dir_names must be 'params', 'id' or 'hash', not '%s'." % dir_names)
+        exit(-1)
+    kind, _, arg = (dir_layout or "flat").partition(":")
+    if kind == "flat":
+        layout = {"type": "flat"}
+    elif kind == "id":
+        if arg and not (arg.isdigit() and int(arg) > 0):
+            print("ERROR: The block size of the 'id' layout must be a positive integer, not '%s'." % arg)
+            exit(-1)
+        layout = {"type": "id", "group_size": int(arg) if arg else 1000, "start_index": start_index}
+    elif kind == "param":
+        param = arg if arg else next(iter(param_dict))
+        if param not in param_dict:
+            print("ERROR: The parameter of the 'param' layout ('%s') is not in the sweep." % param)
+            exit(-1)
+        layout = {"type": "param", "param": param}
+    else:
+        print("ERROR: dir_layout must be 'flat', 'id[:N]' or 'param[:name]', not '%s'." % dir_layout)
+        exit(-1)
+    if dir_names != "params":
+        layout["names"] = dir_names
+    return layout if layout != {"type": "flat"} else None
+
+
+# Whether the folder names of a layout don't contain the parameters, so that the viewer needs the index to find them
+def has_dir_index(layout):
+    return layout is not None and layout.get("names", "params") != "params"
+
+
+# Subfolder of the sweep folder that contains the folder of an experiment ("" for the flat layout)
+def get_layout_subdir(layout, n_exp, exp_id, current_dict):
+    if layout is None or layout["type"] == "flat":
+        return ""
+    if layout["type"] == "id":
+        n_digits = len(str(n_exp // layout["group_size"]))
+        return ("exp_%0" + str(n_digits) + "d") % (exp_id // layout["group_size"])
+    param = layout["param"]
+    return param + val2str(current_dict[param])
+
+
+# Record the layout in the 'sweep.txt' file of the sweep folder. If that file doesn't exist yet, it's created with
+# the parameter dictionary. Nothing is written for the flat layout.
+def write_dir_layout(sweep_dir, param_dict, layout):
+    if layout is None:
+        return
+    config_path = os.path.join(sweep_dir, "sweep.txt")
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config = json.load(f, object_pairs_hook=OrderedDict)
+    else:
+        config = OrderedDict(param_dict)
+    config["viewer_dirLayout"] = layout
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+
+
+# Paths (relative to the sweep folder) of the experiment folders that can contain the combinations of the given
+# parameter values, listing only the subfolders that can contain them when the layout allows it.
+# - full_param_dict: all values of each parameter in the sweep
+# - param_values: the values of each parameter to look for
+def list_exp_dirs(sweep_dir, layout, full_param_dict, param_values):
+
+    def list_dirs(subdir):
+        path = os.path.join(sweep_dir, subdir)
+        if not os.path.isdir(path):
+            return []
+        return [os.path.join(subdir, f.name) for f in os.scandir(path) if f.is_dir()]
+
+    if layout is None or layout["type"] == "flat":
+        return list_dirs("")
+    if layout["type"] == "param":
+        param = layout["param"]
+        return [d for v in param_values[param] for d in list_dirs(param + val2str(v))]
+
+    # "id" layout: the block of a combination is given by its exp_id, except when ids were assigned by a manifest
+    # (stable_ids), in which case all blocks are listed
+    blocks = {int(f.name[4:]): f.name for f in os.scandir(sweep_dir)
+              if f.is_dir() and f.name.startswith("exp_") and f.name[4:].isdigit()}
+    if os.path.exists(os.path.join(sweep_dir, "manifest.jsonl")):
+        needed = set(blocks.keys())
+    else:
+        names = list(full_param_dict.keys())
+        needed = set()
+        for values in itertools.product(*[param_values[k] for k in names]):
+            index = 0
+            for k, v in zip(names, values):
+                index = index*len(full_param_dict[k]) + list(full_param_dict[k]).index(v)
+            needed.add((layout["start_index"] + index) // layout["group_size"])
+    return [d for b in sorted(needed) if b in blocks for d in list_dirs(blocks[b])]
+
+
+# Index of the experiment folders: a 1D array of fixed-size byte strings, with the path of the folder (relative to the
+# sweep folder) of each parameter combination, at the index of the combination in the sweep (see get_exp_id()), or an
+# empty string if it wasn't given a folder yet. It's saved as a '.npy' file, which the viewer memory-maps to get the
+# folder of any combination in constant time, without listing folders.
+DIR_INDEX_FILENAME = "dir_index.npy"
+
+
+# Save the index, given the list of folder paths of all combinations.
+# The file is replaced atomically, so that several processes can write it, and the viewer can read it at any time.
+def save_dir_index(sweep_dir, dir_names):
+    path = os.path.join(sweep_dir, DIR_INDEX_FILENAME)
+    tmp_path = "%s.tmp-%d" % (path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.array([name.encode() for name in dir_names], dtype=bytes))
+    os.replace(tmp_path, path)
+
+
+# Memory-map the index of a sweep folder, or return None if there is none
+def load_dir_index(sweep_dir):
+    path = os.path.join(sweep_dir, DIR_INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+# Folder of a combination of parameter values in the index ("" if there is none)
+# - full_param_dict: all values of each parameter in the sweep, in the order of the sweep
+def lookup_dir_index(dir_index, full_param_dict, current_dict):
+    index = 0
+    for k, values in full_param_dict.items():
+        index = index*len(values) + list(values).index(current_dict[k])
+    return dir_index[index].decode()
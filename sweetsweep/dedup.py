@@ -0,0 +1,114 @@
+# Deduplication of identical files across the experiment folders of a sweep.
+#
+# Experiments often write byte-identical files: copies of the same inputs or configuration, plots that don't depend
+# on the swept parameters, or outputs of parameters that turn out not to matter. `specific_dict` only avoids the
+# redundant experiments that are declared in advance. With a DedupStore, the files of each experiment are hashed
+# when it finishes, and the files whose content was already seen are replaced by hardlinks to a single copy.
+#
+# The store is a folder of files named by the hash of their content, which serves as the index: each new file costs
+# one hash and one lookup (creating a hardlink to it in the store, which fails if the content is already there).
+#   store_dir/<hash[:2]>/<hash>
+# The store must be on the same filesystem as the sweep folder (e.g. 'sweep_dir/.store'), for hardlinks to work.
+# It can be shared by several sweeps, and by the workers of parameter_sweep_parallel().
+#
+# Hardlinked files share their content, and also their permissions and modification time, which are those of the
+# first file stored. Experiments must not modify their files after they finish, since that would modify all the
+# copies. Files that already have several hardlinks (e.g. restored from a ResultCache with link="hardlink") and
+# symlinks are left as they are.
+
+import os
+import hashlib
+import threading
+
+
+class DedupStore(object):
+
+    # - store_dir: folder of the store
+    # - min_size: files smaller than that (in bytes) are not deduplicated
+    def __init__(self, store_dir, min_size=0):
+        self.store_dir = store_dir
+        self.min_size = min_size
+        self.enabled = True
+        os.makedirs(store_dir, exist_ok=True)
+
+    def store_path(self, digest):
+        return os.path.join(self.store_dir, digest[:2], digest)
+
+    # Replace the files of an experiment folder that are already in the store by hardlinks to it, and add the others
+    # to the store. Returns the number of files that were replaced.
+    def dedup(self, exp_dir):
+        num_replaced = 0
+        if not self.enabled:
+            return num_replaced
+        for root, dirs, filenames in os.walk(exp_dir):
+            for name in filenames:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.lstat(path)
+                except FileNotFoundError:
+                    continue
+                if os.path.islink(path) or stat.st_nlink > 1 or stat.st_size < self.min_size:
+                    continue
+                if self.dedup_file(path):
+                    num_replaced += 1
+                if not self.enabled:
+                    return num_replaced
+        return num_replaced
+
+    # Returns True if the file was replaced by a hardlink to the store
+    def dedup_file(self, path):
+        digest = hash_file(path)
+        store_path = self.store_path(digest)
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        try:
+            os.link(path, store_path)
+            return False    # New content
+        except FileExistsError:
+            pass
+        except OSError as e:
+            print("WARNING: Deduplication is disabled, hardlinks can't be created in '%s' (%s)." % (self.store_dir, e))
+            self.enabled = False
+            return False
+        # Atomically replace the file, so that it's never missing
+        tmp_path = "%s.dedup-%d-%d" % (path, os.getpid(), threading.get_ident())
+        os.link(store_path, tmp_path)
+        os.replace(tmp_path, path)
+        return True
+
+    # Remove the files of the store that aren't used by any experiment anymore (e.g. after deleting experiment
+    # folders, or packing them). Returns the number of bytes freed.
+    def clean(self):
+        freed = 0
+        for entry in self.iter_entries():
+            stat = entry.stat()
+            if stat.st_nlink == 1:
+                os.remove(entry.path)
+                freed += stat.st_size
+        return freed
+
+    def iter_entries(self):
+        for subdir in os.scandir(self.store_dir):
+            if subdir.is_dir():
+                yield from os.scandir(subdir.path)
+
+    # The statistics are computed from the number of hardlinks of the files of the store, so they include the files
+    # deduplicated by all processes. A file of the store with n links saves n-2 copies (the store itself is a link).
+    def stats_str(self):
+        num_unique, num_saved, bytes_saved = 0, 0, 0
+        for entry in self.iter_entries():
+            stat = entry.stat()
+            num_unique += 1
+            num_saved += max(0, stat.st_nlink - 2)
+            bytes_saved += max(0, stat.st_nlink - 2) * stat.st_size
+        return "Deduplication: %d unique files, %d duplicates replaced by hardlinks (%.1f MB saved)" \
+               % (num_unique, num_saved, bytes_saved/2**20)
+
+
+def hash_file(path, chunk_size=2**20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        chunk = f.read(chunk_size)
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(chunk_size)
+    return h.hexdigest()
@@ -0,0 +1,239 @@
+# In-process logger that duplicates the terminal output of a sweep to log files.
+#
+# sys.stdout and sys.stderr are replaced by streams that write to the terminal as usual, and push a copy
+# of the text to a bounded queue. A background thread consumes that queue and writes it to the log files
+# with buffered writes, so the experiment code doesn't wait on the disk, unless it prints faster than the disk
+# can follow: then, the queue is full, and printing waits for the writer thread, so that no output is lost.
+# With block=False, the text is instead dropped from the log files (not from the terminal): a line in the log file
+# reports how many messages were dropped, and a warning is printed when the logger is closed.
+#
+# Note that only output that goes through sys.stdout and sys.stderr is logged. Output written directly
+# to the file descriptors (e.g. by subprocesses or C extensions) still reaches the terminal, but not the logs.
+
+import os
+import sys
+import gzip
+import queue
+import atexit
+import threading
+import contextlib
+
+
+# A log file, optionally gzip-compressed, and optionally rotated when it exceeds `max_bytes`
+# (like logging.handlers.RotatingFileHandler: 'output.txt' is moved to 'output.txt.1', which is moved to
+# 'output.txt.2', etc. and only `backup_count` of them are kept).
+class LogFile(object):
+
+    def __init__(self, path, compress=False, max_bytes=0, backup_count=5, mode="a"):
+        self.path = path + ".gz" if compress and not path.endswith(".gz") else path
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file = self.open(mode)
+        self.size = self.file.tell() if mode == "a" and not compress else 0
+
+    def open(self, mode):
+        if self.compress:
+            return gzip.open(self.path, mode + "t")
+        return open(self.path, mode, buffering=1 << 16)
+
+    def write(self, text):
+        if self.max_bytes and self.size + len(text) > self.max_bytes and self.size > 0:
+            self.rotate()
+        self.file.write(text)
+        self.size += len(text)
+
+    def rotate(self):
+        self.file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count-1, 0, -1):
+                src = "%s.%d" % (self.path, i)
+                if os.path.exists(src):
+                    os.replace(src, "%s.%d" % (self.path, i+1))
+            os.replace(self.path, self.path + ".1")
+        self.file = self.open("w")
+        self.size = 0
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Stream that replaces sys.stdout or sys.stderr: it writes to the original stream, and sends a copy
+# to the logger. Everything else (fileno(), isatty(), encoding, etc.) is forwarded to the original stream.
+class TeeStream(object):
+
+    def __init__(self, stream, logger):
+        self.stream = stream
+        self.logger = logger
+
+    def write(self, text):
+        self.logger.log(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+# Stream that replaces sys.stdout or sys.stderr while threads run experiments: each thread can redirect its own
+# output with redirect(), e.g. to the log file of its experiment, while the other threads write to the original stream.
+class ThreadLocalStream(object):
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def target(self):
+        return getattr(self.local, "target", None) or self.stream
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextlib.contextmanager
+    def redirect(self, file):
+        previous = getattr(self.local, "target", None)
+        self.local.target = file
+        try:
+            yield
+        finally:
+            self.local.target = previous
+
+
+# Replace sys.stdout and sys.stderr by ThreadLocalStreams, and restore them afterwards
+@contextlib.contextmanager
+def thread_local_output():
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = ThreadLocalStream(stdout), ThreadLocalStream(stderr)
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+# Redirect stdout and stderr to `file`. If they're ThreadLocalStreams, only the output of the current thread is.
+@contextlib.contextmanager
+def redirect_output(file):
+    with contextlib.ExitStack() as stack:
+        for stream, redirect in [(sys.stdout, contextlib.redirect_stdout), (sys.stderr, contextlib.redirect_stderr)]:
+            stack.enter_context(stream.redirect(file) if isinstance(stream, ThreadLocalStream) else redirect(file))
+        yield
+
+
+# Logger that duplicates output to terminal and to file.
+# - logfile: path of the main log file
+# - compress: gzip-compress the log files (the '.gz' extension is added to their names)
+# - max_bytes: if > 0, rotate the log files when they reach this size
+# - backup_count: number of rotated log files to keep
+# - max_queue: maximum number of messages waiting to be written to the log files
+# - block: if True, printing waits when the queue is full. If False, the messages are dropped from the log files.
+# Use set_exp_logfile() to additionally write the output to a per-experiment log file,
+# and close() (or a `with` statement) to restore the terminal streams and flush the logs.
+class Logger(object):
+
+    def __init__(self, logfile, compress=False, max_bytes=0, backup_count=5, max_queue=10000, block=True):
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.main_file = LogFile(logfile, compress, max_bytes, backup_count)
+        self.exp_file = None
+        self.block = block
+        self.num_dropped = 0
+        self.total_dropped = 0
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self.writer_loop, name="sweetsweep-logger", daemon=True)
+        self.thread.start()
+        self.closed = False
+
+        # Replace the terminal streams
+        self.stdout = sys.stdout
+        self.stderr = sys.stderr
+        sys.stdout = TeeStream(self.stdout, self)
+        sys.stderr = TeeStream(self.stderr, self)
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Send text to the log files. If the queue is full, waits for the writer thread, or drops the text if
+    # block=False (or if the writer thread stopped).
+    def log(self, text):
+        while True:
+            try:
+                self.queue.put(("text", text), block=self.block, timeout=1)
+                return
+            except queue.Full:
+                if not self.block or not self.thread.is_alive():
+                    self.num_dropped += 1
+                    self.total_dropped += 1
+                    return
+
+    # Write the subsequent output to the log file `path` as well (or stop doing it if `path` is None).
+    # The log file of the previous experiment is closed.
+    def set_exp_logfile(self, path):
+        # Control messages must not be dropped, so this one is allowed to wait for the writer thread
+        self.queue.put(("exp_file", path))
+
+    def writer_loop(self):
+        while True:
+            # Process all waiting messages before flushing the files
+            items = [self.queue.get()]
+            try:
+                while len(items) < 1000:
+                    items.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            for kind, value in items:
+                if kind == "text":
+                    self.main_file.write(value)
+                    if self.exp_file is not None:
+                        self.exp_file.write(value)
+                elif kind == "exp_file":
+                    if self.exp_file is not None:
+                        self.exp_file.close()
+                    self.exp_file = None
+                    if value is not None:
+                        self.exp_file = LogFile(value, self.compress, self.max_bytes, self.backup_count)
+                elif kind == "close":
+                    if self.exp_file is not None:
+                        self.exp_file.close()
+                    self.main_file.close()
+                    return
+
+            if self.num_dropped:
+                n, self.num_dropped = self.num_dropped, 0
+                self.main_file.write("\n[sweetsweep: %d messages were dropped from the log file]\n" % n)
+            self.main_file.flush()
+            if self.exp_file is not None:
+                self.exp_file.flush()
+
+    # Restore the terminal streams, and wait for the log files to be written
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        if isinstance(sys.stdout, TeeStream) and sys.stdout.logger is self:
+            sys.stdout = self.stdout
+        if isinstance(sys.stderr, TeeStream) and sys.stderr.logger is self:
+            sys.stderr = self.stderr
+        if self.thread.is_alive():
+            self.queue.put(("close", None))
+            self.thread.join()
+        if self.total_dropped:
+            print("WARNING: %d messages were dropped from the log file '%s', because the output was produced faster "
+                  "than it could be written." % (self.total_dropped, self.main_file.path), file=self.stderr)
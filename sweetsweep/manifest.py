@@ -0,0 +1,91 @@
+# Manifest of a sweep, that assigns permanent experiment ids to parameter combinations.
+#
+# By default, experiment ids are the index of the parameter combination in the sweep (see get_exp_id()), so adding
+# a value to a parameter renumbers (and renames the folders of) all experiments. With a manifest, an experiment keeps
+# the id and the folder it was given the first time it was run, and new combinations get new ids, after the existing
+# ones. Extending `param_dict` then only runs the new combinations, and the existing folders and CSV rows stay valid.
+#
+# The manifest is the file 'manifest.jsonl' in the sweep folder. It's append-only, with one JSON object per line:
+#   {"exp_id": 12, "params": {...}, "dir": "exp_12__alpha5_beta0.1"}    a combination was given an id
+#   {"done": 12}                                                        experiment 12 finished
+# Note that the combinations are identified by their parameter names and values, so adding a new parameter to the
+# sweep makes all combinations new.
+
+import os
+import json
+import threading
+
+
+class Manifest(object):
+
+    filename = "manifest.jsonl"
+
+    # - n_exp: number of experiments of the sweep when the manifest is created. It only sets the number of digits
+    #          of the ids in the folder names, and is kept when the sweep is extended, so that names stay consistent.
+    # - start_index: id of the first experiment when the manifest is created.
+    # - layout: layout of the folders of the new experiments (see common.parse_dir_layout())
+    def __init__(self, sweep_dir, n_exp=1, start_index=0, layout=None):
+        self.path = os.path.join(sweep_dir, self.filename)
+        self.entries = {}   # combination key -> entry
+        self.by_id = {}     # exp_id -> entry
+        self.n_exp = n_exp
+        self.layout = layout
+        self.next_id = start_index
+        self.lock = threading.Lock()    # parameter_sweep_parallel() assigns ids and marks experiments done in two threads
+        if os.path.exists(self.path):
+            self.load()
+        else:
+            self.append({"n_exp": n_exp, "start_index": start_index})
+
+    def load(self):
+        with open(self.path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "n_exp" in item:
+                    self.n_exp = item["n_exp"]
+                    self.next_id = max(self.next_id, item["start_index"])
+                elif "done" in item:
+                    self.by_id[item["done"]]["done"] = True
+                else:
+                    entry = {"exp_id": item["exp_id"], "params": item["params"], "dir": item["dir"], "done": False}
+                    self.entries[combination_key(item["params"])] = entry
+                    self.by_id[entry["exp_id"]] = entry
+                    self.next_id = max(self.next_id, entry["exp_id"]+1)
+
+    def append(self, item):
+        with self.lock, open(self.path, "a") as f:
+            f.write(json.dumps(item) + "\n")
+
+    # Get the entry of a parameter combination: {"exp_id":..., "params":..., "dir":..., "done":...}
+    # If the combination is new, give it the next id.
+    def get_entry(self, current_dict):
+        key = combination_key(current_dict)
+        entry = self.entries.get(key)
+        if entry is None:
+            exp_id = self.next_id
+            self.next_id += 1
+            entry = {"exp_id": exp_id, "params": dict(current_dict), "dir": self.build_dir_name(exp_id, current_dict),
+                     "done": False}
+            self.append({"exp_id": exp_id, "params": entry["params"], "dir": entry["dir"]})
+            self.entries[key] = entry
+            self.by_id[exp_id] = entry
+        return entry
+
+    def build_dir_name(self, exp_id, current_dict):
+        from .sweep import build_dir_name
+        return build_dir_name(self.n_exp, exp_id, current_dict, self.layout)
+
+    def set_done(self, exp_id):
+        if not self.by_id[exp_id]["done"]:
+            self.by_id[exp_id]["done"] = True
+            self.append({"done": exp_id})
+
+    def num_done(self):
+        return sum(1 for e in self.by_id.values() if e["done"])
+
+
+# Key that identifies a parameter combination, independently of the order of the parameters
+def combination_key(current_dict):
+    return json.dumps(current_dict, sort_keys=True, default=repr)
@@ -0,0 +1,211 @@
+# Pack the files of the experiment folders of a sweep into a few archives.
+#
+# Each experiment writes a few small files in its own folder, so large sweeps leave millions of files, which hits
+# quotas on clusters, and makes copying the sweep or viewing it over a network mount slow. pack_sweep() moves these
+# files into zip archives 'pack_000.zip', 'pack_001.zip', etc. of at most `archive_size` bytes each (uncompressed by
+# default, since images are already compressed), and writes an index 'pack_index.json' with the archive, offset and
+# size of each file. Any file can then be read with one seek and one read (see PackedSweep), without parsing the
+# archives, and the viewer reads images directly from them.
+# The archives are regular zip files, which can also be opened with any zip tool.
+#
+# Files directly in the sweep folder (sweep.txt, CSV, logs, etc.) and hidden folders are not packed. Symlinks to
+# experiment folders (redundant experiments, see `specific_dict`) are kept, and recorded in the index.
+# Packing is incremental: files that are already in the index are skipped, and new files go to new archives. Only pack
+# experiments that are finished, e.g. run it after the sweep, or after each part of a sweep run in several times.
+#
+# From the command line:
+#   python -m sweetsweep pack sweep_dir [--compress] [--remove] [--archive-size MB]
+#   python -m sweetsweep unpack sweep_dir
+
+import os
+import json
+import zlib
+import struct
+import fnmatch
+import zipfile
+
+PACK_INDEX_FILENAME = "pack_index.json"
+ARCHIVE_FORMAT = "pack_%03d.zip"
+
+
+# Offset of the data of a file in a zip archive, after its local header
+def get_data_offset(f, header_offset):
+    f.seek(header_offset)
+    header = f.read(30)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    return header_offset + 30 + name_length + extra_length
+
+
+def load_pack_index(sweep_dir):
+    path = os.path.join(sweep_dir, PACK_INDEX_FILENAME)
+    if not os.path.exists(path):
+        return {"archives": [], "files": {}, "links": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_pack_index(sweep_dir, index):
+    path = os.path.join(sweep_dir, PACK_INDEX_FILENAME)
+    tmp_path = "%s.tmp-%d" % (path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+# Files of the experiment folders, and symlinks to folders, as paths relative to the sweep folder (with '/')
+def list_sweep_files(sweep_dir):
+    files, links = [], {}
+    for root, dirs, filenames in os.walk(sweep_dir):
+        rel_root = os.path.relpath(root, sweep_dir)
+        if rel_root == ".":
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            filenames = []  # Files of the sweep itself
+        for d in dirs:
+            path = os.path.join(root, d)
+            if os.path.islink(path):
+                target = os.path.normpath(os.path.join(root, os.readlink(path)))
+                links[os.path.relpath(path, sweep_dir).replace(os.sep, "/")] = \
+                    os.path.relpath(target, sweep_dir).replace(os.sep, "/")
+        files += [os.path.join(rel_root, name).replace(os.sep, "/") for name in filenames]
+    return sorted(files), links
+
+
+# Pack the files of the experiment folders of a sweep into archives (see the top of this file).
+# - archive_size: maximum size of an archive in bytes (an archive can be larger if it contains a single larger file)
+# - compress: if True, compress the files (deflate). Useful for text files, but not for images.
+# - remove: if True, remove the files (and the folders left empty) once they're in an archive.
+# Returns the number of files packed.
+def pack_sweep(sweep_dir, archive_size=2**30, compress=False, remove=False):
+    if not os.path.isdir(sweep_dir):
+        print("ERROR: The sweep folder '%s' doesn't exist." % sweep_dir)
+        exit(-1)
+    index = load_pack_index(sweep_dir)
+    files, links = list_sweep_files(sweep_dir)
+    index["links"].update(links)
+    files = [rel for rel in files if rel not in index["files"]]
+
+    num_bytes = 0
+    num_archives = 0
+    i = 0
+    while i < len(files):
+        # Fill a new archive
+        archive_name = ARCHIVE_FORMAT % len(index["archives"])
+        archive_path = os.path.join(sweep_dir, archive_name)
+        compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        size = 0
+        with zipfile.ZipFile(archive_path, "w", compression=compression) as zf:
+            while i < len(files) and (size == 0 or size < archive_size):
+                zf.write(os.path.join(sweep_dir, files[i]), arcname=files[i])
+                size += zf.getinfo(files[i]).compress_size
+                i += 1
+            infos = zf.infolist()
+        # Record where the data of each file is
+        with open(archive_path, "rb") as f:
+            for info in infos:
+                index["files"][info.filename] = [len(index["archives"]), get_data_offset(f, info.header_offset),
+                                                 info.file_size, info.compress_size,
+                                                 info.compress_type == zipfile.ZIP_DEFLATED]
+        index["archives"].append(archive_name)
+        num_bytes += size
+        num_archives += 1
+        # The index is saved after each archive, so that it's consistent if packing is interrupted
+        save_pack_index(sweep_dir, index)
+    save_pack_index(sweep_dir, index)
+
+    if remove:
+        for rel in files:
+            os.remove(os.path.join(sweep_dir, rel))
+        remove_empty_dirs(sweep_dir)
+    print("Packed %d files (%.1f MB) into %d new archive(s), %d archive(s) in total."
+          % (len(files), num_bytes/2**20, num_archives, len(index["archives"])))
+    return len(files)
+
+
+# Remove the folders left empty in the sweep folder (but not the symlinks, nor hidden folders)
+def remove_empty_dirs(sweep_dir):
+    for root, dirs, filenames in os.walk(sweep_dir, topdown=False):
+        if root == sweep_dir or os.path.relpath(root, sweep_dir).startswith("."):
+            continue
+        if not os.listdir(root):
+            os.rmdir(root)
+
+
+# Extract the packed files back into the experiment folders, and remove the archives and their index
+def unpack_sweep(sweep_dir):
+    index = load_pack_index(sweep_dir)
+    for archive_name in index["archives"]:
+        with zipfile.ZipFile(os.path.join(sweep_dir, archive_name)) as zf:
+            zf.extractall(sweep_dir)
+    for archive_name in index["archives"]:
+        os.remove(os.path.join(sweep_dir, archive_name))
+    if os.path.exists(os.path.join(sweep_dir, PACK_INDEX_FILENAME)):
+        os.remove(os.path.join(sweep_dir, PACK_INDEX_FILENAME))
+    print("Unpacked %d files." % len(index["files"]))
+
+
+# Read access to the files of a packed sweep, with paths relative to the sweep folder
+class PackedSweep(object):
+
+    def __init__(self, sweep_dir):
+        self.sweep_dir = sweep_dir
+        index = load_pack_index(sweep_dir)
+        self.archives = index["archives"]
+        self.files = index["files"]
+        self.links = index["links"]
+        self.handles = {}   # Open archives
+        self.dirs = None    # Folder -> names of its files, built on the first call to glob()
+        self.folders = {}   # Depth -> folders, see list_dirs()
+
+    # Path of a file in the index, following the symlinks to experiment folders
+    def resolve(self, rel):
+        rel = os.path.normpath(rel).replace(os.sep, "/")
+        parts = rel.split("/")
+        for k in range(len(parts)-1, 0, -1):
+            prefix = "/".join(parts[:k])
+            if prefix in self.links:
+                return "/".join([self.links[prefix]] + parts[k:])
+        return rel
+
+    def exists(self, rel):
+        return self.resolve(rel) in self.files
+
+    def read(self, rel):
+        archive, offset, size, compress_size, compressed = self.files[self.resolve(rel)]
+        f = self.handles.get(archive)
+        if f is None:
+            f = self.handles[archive] = open(os.path.join(self.sweep_dir, self.archives[archive]), "rb")
+        f.seek(offset)
+        data = f.read(compress_size)
+        return zlib.decompress(data, -15) if compressed else data
+
+    # Folders at the given depth (1 for the experiment folders of the flat layout, 2 for the other layouts) that
+    # contain packed files, including the symlinks to experiment folders
+    def list_dirs(self, depth):
+        if depth not in self.folders:
+            folders = set(os.path.join(*rel.split("/")[:depth]) for rel in self.files if rel.count("/") >= depth)
+            folders.update(os.path.join(*rel.split("/")) for rel in self.links if rel.count("/") == depth-1)
+            self.folders[depth] = sorted(folders)
+        return self.folders[depth]
+
+    # Paths matching a pattern with wildcards in the file name (not in the folders)
+    def glob(self, pattern):
+        if self.dirs is None:
+            self.dirs = {}
+            for rel in self.files:
+                folder, _, name = rel.rpartition("/")
+                self.dirs.setdefault(folder, []).append(name)
+        folder, name_pattern = os.path.split(os.path.normpath(pattern))
+        names = self.dirs.get(self.resolve(folder + "/x").rpartition("/")[0], [])
+        return [os.path.join(folder, name) for name in fnmatch.filter(names, name_pattern)]
+
+    def close(self):
+        for f in self.handles.values():
+            f.close()
+        self.handles = {}
+
+
+# Open the packed files of a sweep folder, or return None if it wasn't packed
+def load_packed_sweep(sweep_dir):
+    if not os.path.exists(os.path.join(sweep_dir, PACK_INDEX_FILENAME)):
+        return None
+    return PackedSweep(sweep_dir)
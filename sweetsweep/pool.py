@@ -0,0 +1,320 @@
+# Process pool used by parameter_sweep_parallel(), that survives misbehaving experiments.
+#
+# Unlike multiprocessing.Pool, it supervises each worker process individually:
+# - timeout: a worker running the same task for more than `timeout` seconds is killed and replaced.
+# - a worker that dies (crash, OOM killer, etc.) is replaced, and its task is reported as failed.
+# - retries: failed tasks are run again, up to `retries` times, after a delay that doubles at each attempt.
+# - max_tasks_per_worker / max_worker_rss: workers are replaced after running that many tasks, or when their memory
+#   usage (resident set size, in bytes) gets above that, to contain memory leaks.
+#
+# Each worker has its own pipe. Tasks are sent in chunks of `chunksize` tasks, and each worker has at most two chunks
+# assigned, so that it never waits for the parent process, while a worker that was replaced only loses a few tasks
+# (the ones that weren't started are sent to another worker).
+#
+# ThreadWorkerPool, at the end of this file, has the same interface with threads instead of processes.
+
+import os
+import time
+import heapq
+import pickle
+import traceback
+import collections
+import concurrent.futures
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+
+# Resident set size of the current process in bytes
+def get_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        # No /proc (e.g. macOS): use the peak RSS instead (in bytes on macOS, in kilobytes elsewhere)
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if os.uname().sysname == "Darwin" else rss*1024
+
+
+def _pool_worker_main(conn, func, initializer, initargs, slot_initializer, slot):
+    if slot_initializer is not None:
+        slot_initializer(slot)
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            chunk = conn.recv()
+        except EOFError:
+            return
+        if chunk is None:
+            return
+        for task in chunk:
+            try:
+                message = (True, func(task))
+            except Exception as e:
+                # Send the exception itself if possible, so that it can be raised again in the parent process
+                try:
+                    pickle.dumps(e)
+                except Exception:
+                    e = RuntimeError(repr(e))
+                message = (False, (e, traceback.format_exc()))
+            conn.send(message + (get_rss(),))
+
+
+# Tasks waiting to be sent to a worker: tasks that were assigned to a worker that was replaced, failed tasks
+# waiting to be retried, and new tasks, taken from the iterable `tasks` only when needed.
+class _TaskQueue(object):
+
+    def __init__(self, tasks, retries, retry_backoff):
+        self.tasks = iter(tasks)
+        self.exhausted = False
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.requeued = collections.deque()     # (task, attempt)
+        self.retry_heap = []                    # (time when it can be retried, counter, task, attempt)
+        self.counter = 0
+
+    # Next (task, attempt) to run, or None if there is none for now
+    def next(self):
+        if self.requeued:
+            return self.requeued.popleft()
+        if self.retry_heap and self.retry_heap[0][0] <= time.time():
+            return heapq.heappop(self.retry_heap)[2:]
+        if not self.exhausted:
+            try:
+                return next(self.tasks), 0
+            except StopIteration:
+                self.exhausted = True
+        return None
+
+    # Returns the final outcome of a failed task, or None if it will be retried
+    def fail(self, task, attempt, status, error):
+        if attempt < self.retries:
+            self.counter += 1
+            heapq.heappush(self.retry_heap, (time.time() + self.retry_backoff*2**attempt, self.counter, task, attempt+1))
+            return None
+        return task, status, error, attempt+1
+
+
+class _Worker(object):
+
+    def __init__(self, ctx, slot, func, initializer, initargs, slot_initializer):
+        self.slot = slot
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_pool_worker_main, daemon=True,
+                                   args=(child_conn, func, initializer, initargs, slot_initializer, slot))
+        self.process.start()
+        child_conn.close()
+        self.assigned = collections.deque()     # (task, attempt) sent to the worker, in order
+        self.last_event = time.time()           # When the current task started
+        self.num_tasks = 0
+        self.retiring = False
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool(object):
+
+    # - func: function called in the workers, with one task as argument
+    # - initializer, initargs: function called once in each worker when it starts
+    # - max_in_flight: maximum number of tasks sent to workers and whose result hasn't been received yet
+    # - slot_initializer: function called first in each worker with the index of its slot (from 0 to num_workers-1),
+    #                     e.g. to pin it to some cores. A worker that replaces another one gets the same slot.
+    # See the top of this file for the other arguments.
+    def __init__(self, num_workers, func, initializer=None, initargs=(), chunksize=1, max_in_flight=None, timeout=None,
+                 retries=0, retry_backoff=1.0, max_tasks_per_worker=None, max_worker_rss=None, slot_initializer=None):
+        self.ctx = mp.get_context()
+        self.num_workers = num_workers
+        self.func = func
+        self.initializer = initializer
+        self.initargs = initargs
+        self.chunksize = chunksize
+        self.max_in_flight = max_in_flight if max_in_flight else 2*num_workers*chunksize
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_worker_rss = max_worker_rss
+        self.slot_initializer = slot_initializer
+        self.workers = []
+
+    def __enter__(self):
+        self.workers = [self.new_worker(slot) for slot in range(self.num_workers)]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for w in self.workers:
+            if exc_type is None:
+                w.stop()
+            else:
+                w.kill()
+        self.workers = []
+
+    def new_worker(self, slot):
+        return _Worker(self.ctx, slot, self.func, self.initializer, self.initargs, self.slot_initializer)
+
+    def replace_worker(self, w, kill):
+        if kill:
+            w.kill()
+        else:
+            w.stop()
+        self.workers[self.workers.index(w)] = self.new_worker(w.slot)
+
+    # Run the tasks, and yield (task, status, value, number of attempts) as soon as each task is finished, where:
+    # - status is "ok", and value is the return value of `func`
+    # - or status is "failed" or "timeout", and value is (exception, traceback string)
+    # Tasks are taken from the iterable `tasks` only when a worker can take them.
+    def imap_unordered(self, tasks):
+        queue = _TaskQueue(tasks, self.retries, self.retry_backoff)
+
+        while True:
+            # Send tasks to the workers that can take them
+            in_flight = sum(len(w.assigned) for w in self.workers)
+            for w in self.workers:
+                while not w.retiring and len(w.assigned) < 2*self.chunksize and in_flight < self.max_in_flight:
+                    chunk_size = min(self.chunksize, self.max_in_flight-in_flight)
+                    # A worker that will be recycled doesn't get more tasks than it has left to run
+                    if self.max_tasks_per_worker:
+                        chunk_size = min(chunk_size, self.max_tasks_per_worker - w.num_tasks - len(w.assigned))
+                    chunk = []
+                    while len(chunk) < chunk_size:
+                        item = queue.next()
+                        if item is None:
+                            break
+                        chunk.append(item)
+                    if not chunk:
+                        break
+                    if not w.assigned:
+                        w.last_event = time.time()
+                    w.conn.send([task for task, attempt in chunk])
+                    w.assigned.extend(chunk)
+                    in_flight += len(chunk)
+                    if self.max_tasks_per_worker and w.num_tasks + len(w.assigned) >= self.max_tasks_per_worker:
+                        w.retiring = True
+
+            if in_flight == 0 and not queue.requeued:
+                if not queue.retry_heap and queue.exhausted:
+                    return
+                if not queue.retry_heap:
+                    continue
+
+            # Wait for a result, a worker that dies, a timeout, or a task to retry
+            now = time.time()
+            deadlines = [w.last_event + self.timeout for w in self.workers if w.assigned and self.timeout]
+            if queue.retry_heap:
+                deadlines.append(queue.retry_heap[0][0])
+            wait_time = max(0, min(deadlines) - now) if deadlines else None
+            ready = wait([w.conn for w in self.workers] + [w.process.sentinel for w in self.workers], wait_time)
+
+            for w in list(self.workers):
+                # Results
+                dead = w.process.sentinel in ready
+                if w.conn in ready or dead:
+                    try:
+                        while w.conn.poll():
+                            ok, value, rss = w.conn.recv()
+                            task, attempt = w.assigned.popleft()
+                            w.last_event = time.time()
+                            w.num_tasks += 1
+                            outcome = (task, "ok", value, attempt+1) if ok else queue.fail(task, attempt, "failed", value)
+                            if outcome is not None:
+                                yield outcome
+                            if self.max_worker_rss and rss > self.max_worker_rss:
+                                w.retiring = True
+                    except (EOFError, OSError):
+                        dead = True
+                # Worker that died while running a task
+                if dead and not w.process.is_alive():
+                    if w.assigned:
+                        task, attempt = w.assigned.popleft()
+                        error = RuntimeError("The worker running the task exited with code %s" % w.process.exitcode)
+                        outcome = queue.fail(task, attempt, "failed", (error, str(error)))
+                        if outcome is not None:
+                            yield outcome
+                    queue.requeued.extend(w.assigned)
+                    self.replace_worker(w, kill=True)
+                    continue
+                # Worker running the same task for too long
+                if self.timeout and w.assigned and time.time() - w.last_event > self.timeout:
+                    task, attempt = w.assigned.popleft()
+                    queue.requeued.extend(w.assigned)
+                    self.replace_worker(w, kill=True)
+                    error = TimeoutError("The task didn't finish within %g seconds" % self.timeout)
+                    outcome = queue.fail(task, attempt, "timeout", (error, str(error)))
+                    if outcome is not None:
+                        yield outcome
+                    continue
+                # Worker to recycle, once it's done with its tasks
+                if w.retiring and not w.assigned:
+                    self.replace_worker(w, kill=False)
+
+
+# Same interface as WorkerPool, but with threads, for experiments that spend their time in code that releases the
+# GIL (e.g. NumPy). Threads share the memory of the process: `initializer` is called only once, and there is nothing
+# to pickle. Threads can't be killed, so there are no timeouts, and workers are never replaced.
+class ThreadWorkerPool(object):
+
+    def __init__(self, num_workers, func, initializer=None, initargs=(), max_in_flight=None, retries=0,
+                 retry_backoff=1.0):
+        self.num_workers = num_workers
+        self.func = func
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_in_flight = max_in_flight if max_in_flight else 2*num_workers
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.executor = None
+
+    def __enter__(self):
+        if self.initializer is not None:
+            self.initializer(*self.initargs)
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.num_workers, thread_name_prefix="sweetsweep-worker")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # On error, don't start the tasks that are waiting, but running ones can't be stopped
+        self.executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+
+    def run(self, task):
+        try:
+            return True, self.func(task)
+        except Exception as e:
+            return False, (e, traceback.format_exc())
+
+    # See WorkerPool.imap_unordered()
+    def imap_unordered(self, tasks):
+        queue = _TaskQueue(tasks, self.retries, self.retry_backoff)
+        pending = {}    # future -> (task, attempt)
+        while True:
+            while len(pending) < self.max_in_flight:
+                item = queue.next()
+                if item is None:
+                    break
+                pending[self.executor.submit(self.run, item[0])] = item
+
+            if not pending and not queue.retry_heap and queue.exhausted:
+                return
+            # Wait for a result, or for a task to retry
+            wait_time = max(0, queue.retry_heap[0][0] - time.time()) if queue.retry_heap else None
+            if not pending:
+                time.sleep(wait_time)
+                continue
+            done, _ = concurrent.futures.wait(pending, timeout=wait_time,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                task, attempt = pending.pop(future)
+                ok, value = future.result()
+                outcome = (task, "ok", value, attempt+1) if ok else queue.fail(task, attempt, "failed", value)
+                if outcome is not None:
+                    yield outcome
@@ -0,0 +1,401 @@
+# Results of the experiments of a sweep, as written in its CSV.
+#
+# Experiments can return NumPy arrays as results (loss curves, per-iteration metrics, etc.), in addition to scalars.
+# Each array is saved in the folder of its experiment, as 'result_<name>.npy', and the CSV holds the path of that
+# file, relative to the sweep folder, instead of the values. load_array_result() then gives access to the arrays of
+# all experiments, memory-mapping each file only when it's accessed:
+#   losses = load_array_result(sweep_dir, "loss")
+#   losses[12][-1]          # Last loss of experiment 12
+#   losses.stack()          # All losses in one array, if they have the same shape
+
+import os
+import re
+import csv
+import json
+import warnings
+import numpy as np
+
+ARRAY_RESULT_FORMAT = "result_%s.npy"
+
+
+# Name of the file of an array result (characters that can't be in file names are replaced by '_')
+def array_result_filename(name):
+    return ARRAY_RESULT_FORMAT % re.sub(r"[^\w.-]", "_", name)
+
+
+# Save the array results of an experiment in its folder, and return the results with the arrays replaced by the path
+# of their file, relative to the sweep folder. 0-d arrays are replaced by their value.
+# Results that are already paths to array results (e.g. restored from a ResultCache, in another folder) are updated
+# to the file in `exp_dir`.
+def save_array_results(result_dict, sweep_dir, exp_dir):
+    if not result_dict:
+        return result_dict
+    saved_dict = {}
+    for name, value in result_dict.items():
+        filename = array_result_filename(name)
+        path = os.path.join(exp_dir, filename)
+        if isinstance(value, np.ndarray):
+            if value.ndim == 0:
+                value = value.item()
+            else:
+                np.save(path, value)
+                value = os.path.relpath(path, sweep_dir).replace(os.sep, "/")
+        elif isinstance(value, str) and value.rpartition("/")[2] == filename and os.path.exists(path):
+            value = os.path.relpath(path, sweep_dir).replace(os.sep, "/")
+        saved_dict[name] = value
+    return saved_dict
+
+
+# Path of the CSV of a sweep: `result_csv_filename` if it's set, otherwise the one recorded in 'sweep.txt' for the
+# viewer ("viewer_resultsCSV"), otherwise the only CSV of the sweep folder (other than 'timings.csv')
+def get_results_csv_path(sweep_dir, result_csv_filename=None):
+    if not result_csv_filename:
+        config_path = os.path.join(sweep_dir, "sweep.txt")
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                result_csv_filename = json.load(f).get("viewer_resultsCSV")
+    if not result_csv_filename:
+        csv_files = [f for f in sorted(os.listdir(sweep_dir)) if f.endswith(".csv") and f != "timings.csv"]
+        if len(csv_files) != 1:
+            print("ERROR: Can't tell which CSV of '%s' has the results, pass result_csv_filename." % sweep_dir)
+            exit(-1)
+        result_csv_filename = csv_files[0]
+    return os.path.join(sweep_dir, result_csv_filename)
+
+
+# Arrays of one result of all experiments, indexed by exp_id. Each array is memory-mapped when it's accessed.
+class ArrayResult(object):
+
+    # - paths: dictionary of the path of the array of each exp_id, relative to the sweep folder
+    def __init__(self, sweep_dir, name, paths):
+        self.sweep_dir = sweep_dir
+        self.name = name
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, exp_id):
+        return exp_id in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def exp_ids(self):
+        return list(self.paths.keys())
+
+    def __getitem__(self, exp_id):
+        return np.load(os.path.join(self.sweep_dir, self.paths[exp_id]), mmap_mode="r")
+
+    def items(self):
+        for exp_id in self.paths:
+            yield exp_id, self[exp_id]
+
+    # Arrays of the given experiments (default: all) in a single array, with the experiments along the first axis.
+    # They must all have the same shape.
+    def stack(self, exp_ids=None):
+        return np.stack([self[exp_id] for exp_id in (self.paths if exp_ids is None else exp_ids)])
+
+
+# Load an array result of all the experiments of a sweep, from the paths in its CSV (see get_results_csv_path()).
+# Redundant experiments (see `specific_dict`) get the array of their source experiment.
+def load_array_result(sweep_dir, name, result_csv_filename=None):
+    with open(get_results_csv_path(sweep_dir, result_csv_filename), newline='') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        header = next(csv_reader)
+        if name not in header:
+            print("ERROR: There is no result '%s' in the CSV of '%s'." % (name, sweep_dir))
+            exit(-1)
+        column = header.index(name)
+        src_column = header.index("src_exp_id") if "src_exp_id" in header else None
+        paths = {}
+        redundant = {}
+        for row in csv_reader:
+            if not row:
+                continue
+            exp_id = int(row[0])
+            if len(row) > column and row[column]:
+                paths[exp_id] = row[column]
+            elif src_column is not None and row[src_column] != "-1":
+                redundant[exp_id] = int(row[src_column])
+    for exp_id, src_exp_id in redundant.items():
+        if src_exp_id in paths:
+            paths[exp_id] = paths[src_exp_id]
+    return ArrayResult(sweep_dir, name, dict(sorted(paths.items())))
+
+
+# Results of a sweep as an N-dimensional array over the parameters of the sweep, read lazily from its CSV.
+#
+#   results = load_results(sweep_dir)
+#   results.dims, results.shape, results.names      # Parameters (axes), number of values of each, result names
+#   loss = results["loss"]                          # LabeledArray of the 'loss' of all experiments
+#   loss.sel(alpha=0.1).mean("seed")                # Selection by parameter values, and reduction over parameters
+#   loss.argmin("lr")                               # Best learning rate for each value of the other parameters
+#   results.sel(alpha=[0.1, 1])["loss"].values      # NumPy array
+#
+# The parameters and their values are read from 'sweep.txt'. The CSV is read once to find the cell of each
+# experiment, its result columns are parsed the first time one of them is used, and each one is converted to an
+# array the first time it's used. Redundant experiments (see `specific_dict`) get the results of their source
+# experiment, and cells without results (experiments that weren't run, or failed) are NaN.
+class Results(object):
+
+    def __init__(self, table, params, index):
+        self.table = table
+        self.params = params    # Values of each parameter in this view
+        self.index = index      # Indices of these values in the sweep
+
+    @property
+    def dims(self):
+        return list(self.params.keys())
+
+    @property
+    def shape(self):
+        return tuple(len(v) for v in self.params.values())
+
+    @property
+    def names(self):
+        return self.table.names
+
+    def __getitem__(self, name):
+        return LabeledArray(take(self.table.column(name), self.index.values()), self.params)
+
+    # View on a subset of the parameter values, e.g. sel(alpha=0.1, beta=[1, 2]). A parameter with a single value
+    # (not in a list) is removed from the axes.
+    def sel(self, **selection):
+        params, index = select(self.params, self.index, selection)
+        return Results(self.table, params, index)
+
+    def __repr__(self):
+        return "Results(%s, results: %s)" % (", ".join("%s: %d" % (k, len(v)) for k, v in self.params.items()),
+                                             ", ".join(self.names))
+
+
+# Index of the values of a selection in the values of each parameter, and the selected values
+def select(params, index, selection):
+    params = dict(params)
+    index = dict(index)
+    for param, value in selection.items():
+        if param not in params:
+            print("ERROR: '%s' is not a parameter of the results (%s)." % (param, ", ".join(params)))
+            exit(-1)
+        values = list(params[param])
+        squeeze = not isinstance(value, (list, tuple, np.ndarray))
+        positions = []
+        for v in ([value] if squeeze else value):
+            if v not in values:
+                print("ERROR: %s=%s is not in the values of the results: %s" % (param, v, values))
+                exit(-1)
+            positions.append(values.index(v))
+        index[param] = np.asarray(index[param])[positions]
+        params[param] = [values[p] for p in positions]
+        if squeeze:
+            index[param] = index[param][0]
+            del params[param]
+    return params, index
+
+
+# Select the given indices along each axis of an array: an integer removes the axis, an array of indices keeps it
+def take(values, indices):
+    axis = 0
+    for index in indices:
+        values = np.take(values, index, axis=axis)
+        if np.ndim(index) > 0:
+            axis += 1
+    return values
+
+
+# NumPy array with a parameter for each axis
+class LabeledArray(object):
+
+    def __init__(self, values, params):
+        self.values = values
+        self.params = dict(params)
+
+    @property
+    def dims(self):
+        return list(self.params.keys())
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def sel(self, **selection):
+        params, index = select(self.params, {k: np.arange(len(v)) for k, v in self.params.items()}, selection)
+        return LabeledArray(take(self.values, index.values()), params)
+
+    # Reduce the array over some parameters (default: all) with a NumPy function, ignoring NaN
+    def reduce(self, func, dims=None):
+        dims = self.dims if dims is None else [dims] if isinstance(dims, str) else list(dims)
+        axes = tuple(self.dims.index(d) for d in dims)
+        with warnings.catch_warnings():
+            # Cells without results are expected, e.g. the mean of a slice with only NaN is NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            values = func(self.values, axis=axes)
+        params = {k: v for k, v in self.params.items() if k not in dims}
+        return LabeledArray(values, params) if params else values
+
+    def mean(self, dims=None):
+        return self.reduce(np.nanmean, dims)
+
+    def min(self, dims=None):
+        return self.reduce(np.nanmin, dims)
+
+    def max(self, dims=None):
+        return self.reduce(np.nanmax, dims)
+
+    def sum(self, dims=None):
+        return self.reduce(np.nansum, dims)
+
+    def std(self, dims=None):
+        return self.reduce(np.nanstd, dims)
+
+    # Number of cells that have a result
+    def count(self, dims=None):
+        return self.reduce(lambda values, axis: np.sum(~np.isnan(values), axis=axis), dims)
+
+    # Values of a parameter for which the result is minimal (or maximal), for each value of the other parameters
+    def argmin(self, dim):
+        return self.arg_best(dim, np.inf, np.argmin)
+
+    def argmax(self, dim):
+        return self.arg_best(dim, -np.inf, np.argmax)
+
+    def arg_best(self, dim, nan_value, func):
+        axis = self.dims.index(dim)
+        positions = func(np.where(np.isnan(self.values), nan_value, self.values), axis=axis)
+        values = make_array(self.params[dim])[positions]
+        params = {k: v for k, v in self.params.items() if k != dim}
+        return LabeledArray(values, params) if params else values
+
+    def __repr__(self):
+        return "LabeledArray(%s)\n%s" % (", ".join("%s: %s" % (k, list(v)) for k, v in self.params.items()),
+                                         self.values)
+
+
+def make_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array if len(set(type(v) for v in values)) > 1 else np.asarray(values)
+
+
+# Reads the CSV of a sweep, and keeps the columns that were read. The CSV is parsed by NumPy (np.loadtxt()), column by
+# column, without creating a Python object per row: the columns of the experiment ids and of the parameters when the
+# table is created, and the result columns all at once, the first time one of them is used.
+class ResultsTable(object):
+
+    def __init__(self, csv_path, params):
+        self.csv_path = csv_path
+        self.params = params
+        self.shape = tuple(len(v) for v in params.values())
+        self.columns = {}
+        with open(csv_path) as csv_file:
+            self.header = next(csv.reader(csv_file))
+            lines = np.array(csv_file.read().split("\n"), dtype=object)
+        self.lines = lines[lines != ""]
+        missing = [p for p in params if p not in self.header]
+        if missing:
+            print("ERROR: The parameters %s are not in the CSV '%s'." % (missing, csv_path))
+            exit(-1)
+        param_columns = [self.header.index(p) for p in params]
+        src_column = self.header.index("src_exp_id") if "src_exp_id" in self.header else None
+        # Columns of the ids and parameters, that all rows have (the rows of redundant experiments have no results)
+        self.num_key_columns = max(param_columns + [src_column or 0]) + 1
+        keys = self.parse(self.lines, range(self.num_key_columns))
+
+        # Flat index of the cell of each row (-1 if a value isn't in the parameters)
+        self.cells = np.zeros(len(self.lines), dtype=np.int64)
+        for column, values, n in zip(param_columns, params.values(), self.shape):
+            # Position of each value of the parameter, from its string in the CSV
+            position = {}
+            for i, v in enumerate(values):
+                position[str(v)] = i
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    position[repr(float(v))] = i
+            strings, inverse = np.unique(keys[:, column], return_inverse=True)
+            positions = np.array([position.get(string, position.get(float_repr(string), -1)) for string in strings],
+                                 dtype=np.int64)[inverse.ravel()]
+            self.cells = np.where((self.cells < 0) | (positions < 0), -1, self.cells*n + positions)
+
+        # Row of the source experiment of each row (its own row if it's not redundant). If an experiment has several
+        # rows, its last one is used.
+        rows = np.arange(len(self.lines))
+        self.src_rows = rows
+        self.result_rows = rows
+        if src_column is not None and len(rows):
+            exp_ids = keys[:, 0].astype(np.int64)
+            src_exp_ids = keys[:, src_column].astype(np.int64)
+            redundant = np.flatnonzero(src_exp_ids != -1)
+            order = np.argsort(exp_ids, kind="stable")
+            found = np.searchsorted(exp_ids[order], src_exp_ids[redundant], side="right") - 1
+            found_src = (found >= 0) & (exp_ids[order][np.maximum(found, 0)] == src_exp_ids[redundant])
+            self.src_rows = rows.copy()
+            self.src_rows[redundant[found_src]] = order[found[found_src]]
+            self.result_rows = np.flatnonzero(src_exp_ids == -1)
+        self.names = [name for name in self.header if name not in params and name not in ("exp_id", "src_exp_id")]
+        self.results = None
+
+    # Strings of some columns of CSV lines, as a 2D array
+    def parse(self, lines, columns):
+        columns = list(columns)
+        if not len(lines) or not columns:
+            return np.empty((len(lines), len(columns)), dtype=str)
+        try:
+            return np.loadtxt(lines, dtype=str, delimiter=",", quotechar='"', usecols=columns, comments=None,
+                              ndmin=2)
+        except ValueError:
+            # Rows with different numbers of fields, e.g. rows without results written by an older version
+            rows = [row + [""]*(len(self.header)-len(row)) for row in csv.reader(lines)]
+            return np.array([[row[c] for c in columns] for row in rows], dtype=str).reshape(len(lines), len(columns))
+
+    # Array of a column with the shape of the sweep
+    def column(self, name):
+        if name in self.columns:
+            return self.columns[name]
+        if name not in self.header:
+            print("ERROR: There is no result '%s' in '%s'." % (name, self.csv_path))
+            exit(-1)
+        if self.results is None:
+            # Rows that have results, i.e. that are not redundant
+            results = self.parse(self.lines[self.result_rows], range(self.num_key_columns, len(self.header)))
+            self.results = np.full((len(self.lines), results.shape[1]), "", dtype=results.dtype)
+            self.results[self.result_rows] = results
+        c = self.header.index(name)
+        if c < self.num_key_columns:
+            values = self.parse(self.lines, [c])[:, 0]
+        else:
+            values = self.results[:, c - self.num_key_columns]
+        values = values[self.src_rows]
+        missing = values == ""
+        try:
+            values = np.where(missing, "nan", values).astype(float)
+            data = np.full(int(np.prod(self.shape)), np.nan)
+        except ValueError:
+            values = values.astype(object)
+            values[missing] = None
+            data = np.full(int(np.prod(self.shape)), None, dtype=object)
+        valid = self.cells >= 0
+        data[self.cells[valid]] = values[valid]
+        self.columns[name] = data.reshape(self.shape)
+        return self.columns[name]
+
+
+# repr() of the float of a string, to find numeric parameter values written differently (e.g. "1" and "1.0")
+def float_repr(string):
+    try:
+        return repr(float(string))
+    except ValueError:
+        return None
+
+
+# Load the results of a sweep (see Results). The parameters are read from 'sweep.txt', and the CSV is found with
+# get_results_csv_path().
+def load_results(sweep_dir, result_csv_filename=None):
+    config_path = os.path.join(sweep_dir, "sweep.txt")
+    if not os.path.exists(config_path):
+        print("ERROR: There is no 'sweep.txt' in '%s' to get the parameters of the sweep." % sweep_dir)
+        exit(-1)
+    with open(config_path) as f:
+        config = json.load(f)
+    params = {k: v for k, v in config.items() if not k.startswith("viewer_")}
+    table = ResultsTable(get_results_csv_path(sweep_dir, result_csv_filename), params)
+    return Results(table, params, {k: np.arange(len(v)) for k, v in params.items()})
@@ -0,0 +1,70 @@
+# Longest-processing-time-first scheduling of the experiments of a parallel sweep.
+#
+# parameter_sweep_parallel() runs the experiments in exp_id order by default. If the expensive ones come last
+# (e.g. the largest value of a size parameter), one worker keeps running them at the end while the others are idle.
+# Starting with the longest experiments shortens the total time of the sweep (the makespan).
+# The cost of the experiments is estimated either by a function of the parameter dictionary, or from the durations
+# recorded in the 'timings.csv' file of a previous sweep with the same parameters.
+
+import os
+import csv
+import heapq
+
+TIMINGS_FILENAME = "timings.csv"
+
+
+# Read the durations recorded by parameter_sweep_parallel() in 'timings.csv' (in `path` if it's a folder).
+# Returns a dictionary: tuple of parameter values as strings -> mean duration, and the list of parameter names.
+def load_timings(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, TIMINGS_FILENAME)
+    sums = {}
+    with open(path) as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        param_names = header[:-1]
+        for row in reader:
+            if len(row) != len(header) or row == header:
+                continue
+            key = tuple(row[:-1])
+            total, count = sums.get(key, (0.0, 0))
+            sums[key] = (total + float(row[-1]), count + 1)
+    return {k: total/count for k, (total, count) in sums.items()}, param_names
+
+
+# Estimated cost of the experiments of the given parameter dictionaries
+# - cost: a function of the parameter dictionary, or the path of the 'timings.csv' of a previous sweep (or of its
+#         folder). With timings, the experiments that weren't run before get the mean duration of the others.
+def get_costs(param_dicts, cost):
+    if callable(cost):
+        return [float(cost(d)) for d in param_dicts]
+    timings, param_names = load_timings(cost)
+    default = sum(timings.values())/len(timings) if timings else 0.0
+    # Values are compared as they're written in the CSV
+    return [timings.get(tuple(str(d.get(k, "")) for k in param_names), default) for d in param_dicts]
+
+
+# Order of the experiments, from the most expensive to the least expensive
+def lpt_order(costs):
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+# Estimated makespan of running experiments of costs `costs` in this order, each one starting on the first
+# free worker among `num_workers` (which is what the pool does with chunksize=1).
+def estimate_makespan(costs, num_workers):
+    workers = [0.0]*min(num_workers, max(1, len(costs)))
+    for c in costs:
+        heapq.heapreplace(workers, workers[0] + c)
+    return max(workers)
+
+
+# Print the estimated makespan of a sweep, in exp_id order and in longest-first order
+def print_plan(costs, num_workers):
+    total = sum(costs)
+    in_order = estimate_makespan(costs, num_workers)
+    longest_first = estimate_makespan(sorted(costs, reverse=True), num_workers)
+    print("Plan for %d experiments on %d workers:" % (len(costs), num_workers))
+    print("  Total cost:                  %g" % total)
+    print("  Lower bound of the makespan: %g" % max(total/num_workers, max(costs) if costs else 0))
+    print("  Makespan in exp_id order:    %g" % in_order)
+    print("  Makespan longest-first:      %g" % longest_first)
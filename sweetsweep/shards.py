@@ -0,0 +1,104 @@
+# Split a sweep into shards, to run it as an array job on an HPC cluster.
+#
+# With `only_exp_id`, each task of an array job runs a single experiment, so for short experiments, the scheduler
+# overhead and the Python startup dominate, and the maximum size of array jobs limits the size of the sweep.
+# Instead, each task can run a shard (a chunk of consecutive experiment ids) over a local process pool with
+# parameter_sweep_parallel(..., exp_ids=...), so that one task fills a whole node.
+#
+# Command-line arguments handled by parse_sweep_args(), for the script that runs the sweep:
+#   --get-num-exp               print the number of experiments and exit
+#   --get-num-shards N          print the number of shards of at most N experiments and exit (to size the array job)
+#   --shard K/N                 run the K-th shard out of N (K from 0 to N-1)
+#   --strided                   with --shard, the K-th shard is the experiments K, K+N, K+2N, ... instead of a chunk
+#                               of consecutive ones. This balances the load if the cost depends on the parameters.
+#   --exp-range A:B             run the experiments with ids from A (included) to B (excluded)
+#   --only-exp-id I             run only experiment I
+#   --plan                      (not handled by parse_sweep_args()) for the script to pass `dry_run=True` to
+#                               parameter_sweep_parallel(), to print the estimated duration of the sweep
+# For example, with SLURM:
+#   sbatch --array=0-$(($(python my_sweep.py --get-num-shards 100)-1)) job.sh
+# where job.sh runs `python my_sweep.py --shard $SLURM_ARRAY_TASK_ID/<number of shards>`.
+
+import sys
+import argparse
+
+from .sweep import get_num_exp
+
+
+# Number of shards needed for `num_exp` experiments, with at most `shard_size` experiments per shard
+def get_num_shards(num_exp, shard_size):
+    return max(1, -(-num_exp // shard_size))
+
+
+# Ids of the experiments of shard `shard` (from 0 to num_shards-1), as a range.
+# Contiguous shards have sizes that differ by at most 1.
+def get_shard_exp_ids(num_exp, shard, num_shards, start_index=0, strided=False):
+    if not 0 <= shard < num_shards:
+        print("ERROR: The shard index (%d) must be between 0 and %d" % (shard, num_shards-1))
+        exit(-1)
+    if strided:
+        return range(start_index+shard, start_index+num_exp, num_shards)
+    size, remainder = divmod(num_exp, num_shards)
+    first = shard*size + min(shard, remainder)
+    last = first + size + (1 if shard < remainder else 0)
+    return range(start_index+first, start_index+last)
+
+
+# Parse "K/N"
+def parse_shard(string):
+    try:
+        shard, num_shards = (int(x) for x in string.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' is not of the form K/N" % string)
+    return shard, num_shards
+
+
+# Parse "A:B"
+def parse_exp_range(string):
+    try:
+        first, last = (int(x) for x in string.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' is not of the form A:B" % string)
+    return first, last
+
+
+def add_sweep_arguments(parser):
+    group = parser.add_argument_group("sweep sharding")
+    group.add_argument("--get-num-exp", action="store_true", help="Print the number of experiments and exit")
+    group.add_argument("--get-num-shards", type=int, metavar="N",
+                       help="Print the number of shards of at most N experiments and exit")
+    group.add_argument("--shard", type=parse_shard, metavar="K/N", help="Run the K-th shard out of N (K from 0 to N-1)")
+    group.add_argument("--strided", action="store_true", help="Use strided shards instead of contiguous ones")
+    group.add_argument("--exp-range", type=parse_exp_range, metavar="A:B", help="Run experiments A (included) to B (excluded)")
+    group.add_argument("--only-exp-id", type=int, metavar="I", help="Run only experiment I")
+    group.add_argument("--plan", action="store_true", help="Print the estimated duration of the sweep and exit")
+
+
+# Get the ids of the experiments to run from the arguments added by add_sweep_arguments().
+# Returns a range of exp_ids, or None to run all of them.
+# With --get-num-exp or --get-num-shards, prints the answer and exits. Don't print anything before calling this.
+def get_sweep_exp_ids(args, param_dict, start_index=0):
+    num_exp = get_num_exp(param_dict)
+    if args.get_num_exp:
+        print(num_exp)
+        exit()
+    if args.get_num_shards is not None:
+        print(get_num_shards(num_exp, args.get_num_shards))
+        exit()
+    if args.shard is not None:
+        return get_shard_exp_ids(num_exp, args.shard[0], args.shard[1], start_index, args.strided)
+    if args.exp_range is not None:
+        first, last = args.exp_range
+        return range(max(first, start_index), min(last, start_index+num_exp))
+    if args.only_exp_id is not None:
+        return range(args.only_exp_id, args.only_exp_id+1)
+    return None
+
+
+# Parse the sharding arguments of the command line (see add_sweep_arguments()), ignoring the other ones,
+# and return the ids of the experiments to run (see get_sweep_exp_ids()).
+def parse_sweep_args(param_dict, start_index=0, argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    add_sweep_arguments(parser)
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    return get_sweep_exp_ids(args, param_dict, start_index)
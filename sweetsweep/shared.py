@@ -0,0 +1,84 @@
+# Read-only NumPy arrays shared between the worker processes of a parallel sweep, without copying them.
+#
+# Each worker of parameter_sweep_parallel() is a separate process, so by default each one holds its own copy of the
+# data it loads, and the memory used grows with the number of workers. There are two ways to share arrays instead:
+# - SharedArray: copies an array once into shared memory (multiprocessing.shared_memory). Only a small descriptor
+#   is pickled when it's sent to the workers, which map the same memory.
+# - mmap_array(): saves an array to a '.npy' file, and memory-maps it. The pages are shared between all processes
+#   that map the same file through the OS page cache, and the file can be reused by later sweeps.
+#
+# Example:
+#   data = SharedArray(load_big_dataset())
+#   def setup():
+#       return data.get()
+#   def my_experiment(exp_id, param_dict, exp_dir, data):
+#       ...
+#   parameter_sweep_parallel(param_dict, my_experiment, sweep_dir, worker_setup=setup)
+#   data.close()
+
+import os
+
+import numpy as np
+
+
+class SharedArray(object):
+
+    def __init__(self, array):
+        from multiprocessing import shared_memory
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        self.name = self.shm.name
+        # Only the object that created the memory frees it (not its copies, even in a forked process)
+        self.owner_pid = os.getpid()
+        self.owner = True
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)[...] = array
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Only the descriptor is pickled, the workers attach to the shared memory in get()
+    def __getstate__(self):
+        return {"name": self.name, "shape": self.shape, "dtype": self.dtype, "owner_pid": self.owner_pid}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = None
+        self.owner = False
+
+    # Get the array (read-only), mapped on the shared memory
+    def get(self):
+        if self.shm is None:
+            from multiprocessing import shared_memory
+            try:
+                # Don't let the resource tracker of this process free memory it doesn't own (Python >= 3.13)
+                self.shm = shared_memory.SharedMemory(name=self.name, track=False)
+            except TypeError:
+                self.shm = shared_memory.SharedMemory(name=self.name)
+        array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        array.flags.writeable = False
+        return array
+
+    # Unmap the shared memory, and free it if this is the object that created it.
+    # Arrays returned by get() must not be used anymore after that.
+    def close(self):
+        if self.shm is None:
+            return
+        self.shm.close()
+        if self.owner and os.getpid() == self.owner_pid:
+            self.shm.unlink()
+        self.shm = None
+
+
+# Memory-map the array saved in the '.npy' file `path` (read-only).
+# If `array` is given and the file doesn't exist yet, the array is saved to it first.
+def mmap_array(path, array=None):
+    if array is not None and not os.path.exists(path):
+        tmp_path = "%s.tmp-%d.npy" % (path, os.getpid())
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r")
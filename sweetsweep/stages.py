@@ -0,0 +1,242 @@
+# Memoization of the stages of an experiment.
+#
+# Experiments often start with an expensive stage that only depends on a few of the swept parameters (e.g. loading
+# and preprocessing a dataset at a given resolution), followed by cheaper stages that depend on the others.
+# `specific_dict` only avoids redundant *whole* experiments. With a Stage, the output of each stage is computed once
+# per distinct value of the parameters it depends on, and reused by all the experiments that share these values.
+#
+# Example:
+#   preprocess = Stage(load_and_resize, depends_on=["dataset", "resolution"], cache_dir="stage_cache")
+#   features = Stage(extract_features, depends_on=["method"], inputs=[preprocess])
+#   def my_experiment(exp_id, param_dict, exp_dir):
+#       feats = features.get(param_dict)    # Calls load_and_resize() only if needed
+#       ...
+# The stage function is called with a dictionary of the parameters it depends on, followed by the outputs of its
+# input stages: load_and_resize({"dataset": ..., "resolution": ...}), extract_features({"method": ...}, images).
+#
+# Outputs are kept in memory (the `max_items` most recently used ones), and, if `cache_dir` is set, pickled on disk.
+# The disk cache is shared by the workers of parameter_sweep_parallel() and by later sweeps: when several processes
+# need the same output, only one computes it while the others wait for it.
+
+import os
+import json
+import time
+import pickle
+import socket
+import hashlib
+import threading
+import collections
+
+
+class Stage(object):
+
+    # - func: function computing the output of the stage: func(stage_params, *input_outputs)
+    # - depends_on: names of the swept parameters the stage depends on
+    # - inputs: list of the stages whose outputs are passed to `func` (the stage then also depends on their parameters)
+    # - name: name of the stage in the cache (default: name of `func`)
+    # - version: change it when the code of the stage changes, so that the outputs cached on disk are not used anymore
+    # - cache_dir: folder where the outputs are pickled. If None, they are only kept in memory, in each process.
+    # - max_items: number of outputs kept in memory
+    # - max_bytes: if > 0, the least recently used outputs are removed from `cache_dir` when it gets bigger than that
+    # - lock_timeout: the process computing an output refreshes its lock every `lock_timeout/4` seconds. If it hasn't
+    #                 for more than `lock_timeout` seconds (e.g. it was killed on another machine), it's considered dead
+    #                 and another process computes the output. On the same machine, the lock of a process that doesn't
+    #                 exist anymore is reclaimed right away.
+    def __init__(self, func, depends_on, inputs=None, name=None, version="", cache_dir=None, max_items=8, max_bytes=0,
+                 lock_timeout=60):
+        self.func = func
+        self.depends_on = list(depends_on)
+        self.inputs = list(inputs) if inputs else []
+        self.name = name if name else getattr(func, "__qualname__", type(func).__name__)
+        self.version = version
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self.memory = collections.OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    # Parameters the output of the stage depends on, including through its inputs
+    def all_depends_on(self):
+        params = list(self.depends_on)
+        for stage in self.inputs:
+            params += [p for p in stage.all_depends_on() if p not in params]
+        return params
+
+    def key(self, param_dict):
+        missing = [p for p in self.all_depends_on() if p not in param_dict]
+        if missing:
+            print("ERROR: Stage '%s' depends on parameters that are not in the sweep: %s" % (self.name, missing))
+            exit(-1)
+        description = json.dumps({"name": self.name, "version": self.version,
+                                  "params": {p: param_dict[p] for p in self.all_depends_on()}},
+                                 sort_keys=True, default=repr)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    # Get the output of the stage for the parameters of an experiment, computing it only if needed
+    def get(self, param_dict):
+        key = self.key(param_dict)
+        # Another thread can evict the output at any time, so don't check whether it's there first
+        try:
+            self.memory.move_to_end(key)
+            output = self.memory[key]
+        except KeyError:
+            pass
+        else:
+            self.memory_hits += 1
+            return output
+
+        if self.cache_dir:
+            output = self.get_from_disk(key, param_dict)
+        else:
+            output = self.compute(param_dict)
+
+        self.memory[key] = output
+        if len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+        return output
+
+    def compute(self, param_dict):
+        self.misses += 1
+        input_outputs = [stage.get(param_dict) for stage in self.inputs]
+        return self.func({p: param_dict[p] for p in self.depends_on}, *input_outputs)
+
+    def get_from_disk(self, key, param_dict):
+        path = os.path.join(self.cache_dir, "%s-%s.pkl" % (self.name, key[:32]))
+        lock_path = path + ".lock"
+        while True:
+            output = self.load(path)
+            if output is not None:
+                self.disk_hits += 1
+                return output[0]
+            # Only the process that creates the lock file computes the output
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                owner = self.dead_lock_owner(lock_path)
+                if owner is not None:
+                    self.reclaim_lock(lock_path, owner)
+                    continue
+                time.sleep(0.1)
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(get_lock_owner())
+            stop_event = threading.Event()
+            heartbeat = threading.Thread(target=refresh_lock, args=(lock_path, self.lock_timeout/4, stop_event),
+                                         daemon=True)
+            heartbeat.start()
+            try:
+                # The output may have been written between our first check and the creation of the lock
+                output = self.load(path)
+                if output is not None:
+                    self.disk_hits += 1
+                    return output[0]
+                output = self.compute(param_dict)
+                tmp_path = "%s.tmp-%d-%d" % (path, os.getpid(), threading.get_ident())
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            finally:
+                stop_event.set()
+                heartbeat.join()
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+            self.evict()
+            return output
+
+    # If the process holding a lock is dead, returns the content of the lock, None otherwise. It's dead if it's on
+    # this machine and doesn't exist anymore, or if it hasn't refreshed the lock for more than `lock_timeout` seconds.
+    def dead_lock_owner(self, lock_path):
+        try:
+            with open(lock_path) as f:
+                owner = f.read()
+            mtime = os.path.getmtime(lock_path)
+        except FileNotFoundError:
+            return None
+        host, _, pid = owner.rpartition(":")
+        if host == socket.gethostname() and pid.isdigit() and not process_exists(int(pid)):
+            return owner
+        return owner if time.time() - mtime > self.lock_timeout else None
+
+    # Remove a dead lock. Only one of the processes that see it manages to rename it, and if the lock was taken again
+    # in the meantime, it's put back.
+    def reclaim_lock(self, lock_path, owner):
+        stale_path = "%s.stale-%d-%d" % (lock_path, os.getpid(), threading.get_ident())
+        try:
+            os.rename(lock_path, stale_path)
+        except FileNotFoundError:
+            return
+        with open(stale_path) as f:
+            if f.read() != owner:
+                try:
+                    os.link(stale_path, lock_path)
+                except (FileExistsError, OSError):
+                    pass
+        os.remove(stale_path)
+
+    # Returns (output,) if the output is on disk, None otherwise
+    def load(self, path):
+        try:
+            with open(path, "rb") as f:
+                output = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # Mark as recently used
+        return (output,)
+
+    # Remove the least recently used outputs of this stage from the disk, until they take less than `max_bytes`
+    def evict(self):
+        if not self.max_bytes:
+            return
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(self.name + "-") and entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total_size = sum(f[1] for f in files)
+        for mtime, size, path in files[:-1]:    # Never remove the output that was just computed
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def stats_str(self):
+        return "Stage '%s': %d computed, %d from memory, %d from disk" % (self.name, self.misses, self.memory_hits,
+                                                                        self.disk_hits)
+
+
+# Content of the lock files: the host and pid of the process holding the lock
+def get_lock_owner():
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        pass    # It exists, but belongs to another user (or we can't tell, e.g. on Windows)
+    return True
+
+
+# Update the modification time of a lock while its output is computed, to show that its process is alive
+def refresh_lock(lock_path, interval, stop_event):
+    while not stop_event.wait(interval):
+        try:
+            os.utime(lock_path)
+        except FileNotFoundError:
+            return
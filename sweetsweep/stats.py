@@ -0,0 +1,249 @@
+# Statistics of the results of a sweep, computed by streaming its CSV in chunks, so that the memory doesn't grow with
+# the number of experiments. This is for sweeps whose CSV is too big to be loaded at once (see results.py otherwise).
+#
+# From the command line:
+#   python -m sweetsweep stats sweep_dir [--metric loss acc] [--by alpha beta] [--top 10] [--max]
+# prints, for each metric, the number of experiments with and without a value, and its mean, min, max, and the
+# experiment with the min (or max) value, over all experiments or for each combination of the `--by` parameters,
+# followed by the `--top` best experiments.
+#
+# Redundant experiments (see `specific_dict`) count in their own groups with the results of their source experiment,
+# but their rows are not copied: each source experiment gets a weight in the groups of its redundant experiments, and
+# its results are added once to each of these groups, with that weight. This only needs a second pass over the CSV
+# if there are redundant experiments. The best experiment of a group is then given by the id of the experiment that
+# was run. The memory grows with the number of groups, and with the number of source experiments.
+
+import os
+import csv
+import json
+import heapq
+import collections
+import numpy as np
+
+from .results import get_results_csv_path
+
+# Separator of the parameter values in the keys of the groups
+KEY_SEPARATOR = "\x1f"
+
+
+# Statistics of the metrics of each group. For each group and metric:
+# [number of values (weighted), sum (weighted), min, max, exp_id of the best value, best value]
+class GroupStats(object):
+
+    def __init__(self, metrics, maximize=False):
+        self.metrics = metrics
+        self.maximize = maximize
+        self.groups = collections.OrderedDict()
+
+    # Add the values of a chunk of rows
+    # - keys: list of the group of each row
+    # - values: dictionary of an array of floats for each metric (NaN for missing values)
+    # - weights: array of the weight of each row
+    # - exp_ids: list of the exp_id of each row
+    def update(self, keys, values, weights, exp_ids):
+        if not keys:
+            return
+        unique_keys, inverse = np.unique(np.asarray(keys, dtype=object).astype(str), return_inverse=True)
+        num_groups = len(unique_keys)
+        for metric in self.metrics:
+            x = values[metric]
+            valid = ~np.isnan(x)
+            count = np.bincount(inverse, weights=np.where(valid, weights, 0), minlength=num_groups)
+            total = np.bincount(inverse, weights=np.where(valid, x*weights, 0), minlength=num_groups)
+            minimum = np.full(num_groups, np.inf)
+            np.minimum.at(minimum, inverse[valid], x[valid])
+            maximum = np.full(num_groups, -np.inf)
+            np.maximum.at(maximum, inverse[valid], x[valid])
+            # Best row of each group: the first of the group once sorted by group and value
+            rows = np.flatnonzero(valid)
+            order = rows[np.lexsort((-x[rows] if self.maximize else x[rows], inverse[rows]))]
+            first = order[np.r_[True, inverse[order][1:] != inverse[order][:-1]]] if len(order) else order
+            best_rows = dict(zip(inverse[first].tolist(), first.tolist()))
+            for g, key in enumerate(unique_keys.tolist()):
+                stats = self.groups.setdefault(key, {m: [0.0, 0.0, np.inf, -np.inf, None, np.nan]
+                                                     for m in self.metrics})[metric]
+                stats[0] += count[g]
+                stats[1] += total[g]
+                stats[2] = min(stats[2], minimum[g])
+                stats[3] = max(stats[3], maximum[g])
+                if g in best_rows:
+                    r = best_rows[g]
+                    if stats[4] is None or (x[r] > stats[5] if self.maximize else x[r] < stats[5]):
+                        stats[4], stats[5] = exp_ids[r], x[r]
+
+
+# Best `k` experiments for a metric, kept while reading the chunks
+class TopK(object):
+
+    def __init__(self, k, maximize=False):
+        self.k = k
+        self.maximize = maximize
+        self.best = []  # (value, exp_id, parameter values)
+
+    def update(self, x, exp_ids, param_values):
+        valid = np.flatnonzero(~np.isnan(x))
+        if self.k <= 0 or len(valid) == 0:
+            return
+        scores = -x[valid] if self.maximize else x[valid]
+        candidates = valid[np.argpartition(scores, min(self.k, len(valid))-1)[:self.k]]
+        self.best = heapq.nsmallest(self.k, self.best + [(x[r], exp_ids[r], param_values[r]) for r in candidates],
+                                    key=lambda item: -item[0] if self.maximize else item[0])
+
+
+# Convert the strings of a column to floats, with NaN for missing values. Returns None if it's not numeric.
+def to_float(column):
+    column = np.asarray(column, dtype=object)
+    try:
+        return np.where(column == "", "nan", column).astype(float)
+    except ValueError:
+        return None
+
+
+# Compute the statistics of the results of a sweep (see the top of this file).
+# - metrics: names of the results to compute statistics of (default: all numeric results)
+# - by: names of the parameters that define the groups (default: a single group with all experiments)
+# - top: number of best experiments to return for the first metric
+# - maximize: if True, the best experiments are those with the maximum value instead of the minimum
+# - chunk_size: number of rows of the CSV processed at once
+# Returns a dictionary with the counts of experiments, the GroupStats, and the TopK.
+def sweep_stats(sweep_dir, metrics=None, by=None, top=0, maximize=False, result_csv_filename=None, chunk_size=100000):
+    csv_path = get_results_csv_path(sweep_dir, result_csv_filename)
+    by = list(by) if by else []
+    params = []
+    num_expected = None
+    config_path = os.path.join(sweep_dir, "sweep.txt")
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config = json.load(f)
+        params = [k for k in config if not k.startswith("viewer_")]
+        num_expected = int(np.prod([len(config[k]) for k in params]))
+
+    with open(csv_path, newline='') as csv_file:
+        header = next(csv.reader(csv_file))
+    missing = [name for name in by + (metrics or []) if name not in header]
+    if missing:
+        print("ERROR: %s are not columns of '%s'." % (missing, csv_path))
+        exit(-1)
+    if metrics is None:
+        metrics = [name for name in header if name not in params + ["exp_id", "src_exp_id", "status", "error"]]
+    by_columns = [header.index(p) for p in by]
+    param_columns = [header.index(p) for p in params if p in header]
+    src_column = header.index("src_exp_id") if "src_exp_id" in header else None
+    status_column = header.index("status") if "status" in header else None
+
+    counts = collections.OrderedDict([("rows", 0), ("run", 0), ("redundant", 0), ("failed", 0)])
+    if num_expected is not None:
+        counts["expected"] = num_expected
+    non_numeric = set()
+    group_stats = None
+    topk = TopK(top, maximize)
+    # Weight of each source experiment in the groups of its redundant experiments
+    aliases = collections.defaultdict(collections.Counter)
+
+    def read_chunks():
+        with open(csv_path, newline='') as csv_file:
+            csv_reader = csv.reader(csv_file)
+            next(csv_reader)
+            chunk = []
+            for row in csv_reader:
+                if row:
+                    chunk.append(row)
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    # Values of the metrics in some rows. Metrics that aren't numeric in the first chunk are ignored, and values
+    # that aren't numbers in the next chunks are counted as missing.
+    def get_values(rows):
+        values = {}
+        for metric in metrics:
+            c = header.index(metric)
+            x = to_float([row[c] if len(row) > c else "" for row in rows])
+            if x is None:
+                non_numeric.add(metric)
+                x = np.full(len(rows), np.nan)
+            values[metric] = x
+        return values
+
+    def get_key(row):
+        return KEY_SEPARATOR.join(row[c] for c in by_columns)
+
+    # First pass: experiments that were run
+    for chunk in read_chunks():
+        counts["rows"] += len(chunk)
+        rows = []
+        for row in chunk:
+            if src_column is not None and row[src_column] != "-1":
+                counts["redundant"] += 1
+                aliases[row[src_column]][get_key(row)] += 1
+            else:
+                rows.append(row)
+        counts["run"] += len(rows)
+        if status_column is not None:
+            counts["failed"] += sum(1 for row in rows if len(row) > status_column and row[status_column] not in ("ok", ""))
+        values = get_values(rows)
+        if group_stats is None:
+            group_stats = GroupStats([m for m in metrics if m not in non_numeric], maximize)
+        values = {m: v for m, v in values.items() if m in group_stats.metrics}
+        exp_ids = [row[0] for row in rows]
+        group_stats.update([get_key(row) for row in rows], values, np.ones(len(rows)), exp_ids)
+        if top and group_stats.metrics:
+            topk.update(values[group_stats.metrics[0]], exp_ids,
+                        [[row[c] for c in param_columns] for row in rows])
+
+    if group_stats is None:
+        group_stats = GroupStats([], maximize)
+
+    # Second pass: results of the source experiments, added to the groups of their redundant experiments
+    if aliases:
+        for chunk in read_chunks():
+            rows = [row for row in chunk if row[0] in aliases
+                    and (src_column is None or row[src_column] == "-1")]
+            if not rows:
+                continue
+            values = get_values(rows)
+            keys, weights, exp_ids, indices = [], [], [], []
+            for i, row in enumerate(rows):
+                for key, weight in aliases[row[0]].items():
+                    keys.append(key)
+                    weights.append(weight)
+                    exp_ids.append(row[0])
+                    indices.append(i)
+            values = {m: values[m][indices] for m in group_stats.metrics}
+            group_stats.update(keys, values, np.array(weights, dtype=float), exp_ids)
+
+    return {"counts": counts, "metrics": group_stats.metrics, "by": by, "groups": group_stats,
+            "top": topk, "params": [header[c] for c in param_columns], "csv_path": csv_path}
+
+
+def print_stats(stats):
+    print("Results of '%s'" % stats["csv_path"])
+    counts = stats["counts"]
+    print(", ".join("%s: %d" % (name, n) for name, n in counts.items()))
+    if "expected" in counts:
+        print("missing: %d" % max(0, counts["expected"] - counts["rows"]))
+    group_stats = stats["groups"]
+    best = "argmax" if group_stats.maximize else "argmin"
+    for metric in stats["metrics"]:
+        print("\n%s" % metric)
+        header = stats["by"] + ["count", "mean", "min", "max", best + " (exp_id)"]
+        lines = [header]
+        for key, group in group_stats.groups.items():
+            n, total, minimum, maximum, best_exp_id, _ = group[metric]
+            lines.append((key.split(KEY_SEPARATOR) if stats["by"] else []) +
+                         ["%g" % n] + (["%g" % (total/n), "%g" % minimum, "%g" % maximum, str(best_exp_id)]
+                                       if n else ["", "", "", ""]))
+        print_table(lines)
+    if stats["top"].best:
+        print("\nTop %d experiments for %s" % (stats["top"].k, stats["metrics"][0]))
+        lines = [["exp_id", stats["metrics"][0]] + stats["params"]]
+        lines += [[exp_id, "%g" % value] + param_values for value, exp_id, param_values in stats["top"].best]
+        print_table(lines)
+
+
+def print_table(lines):
+    widths = [max(len(line[c]) for line in lines) for c in range(len(lines[0]))]
+    for line in lines:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
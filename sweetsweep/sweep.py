@@ -5,8 +5,24 @@ import time
 import csv
 import io
 import sys
+import shutil
+import socket
+import itertools
+import threading
+import hashlib
+import functools
+import contextlib
+
+import numpy as np
 
 from .common import *
+from .logger import Logger, thread_local_output, redirect_output
+from .manifest import Manifest, combination_key
+from .schedule import TIMINGS_FILENAME, get_costs, lpt_order, print_plan
+from .pool import WorkerPool, ThreadWorkerPool
+from .results import save_array_results
+from .threads import choose_workers_threads, get_core_sets, thread_limits_env, thread_limits, configure_worker_threads, \
+    get_thread_limits_warning
 
 # TODO: Make a class instead of just functions, it will make passing arguments internally easier.
 
@@ -26,6 +42,8 @@ from .common import *
 #                        dictionary, with keys being the column names, and values the value of each result for that
 #                        experiment. The results are written individually to the file as soon as they are obtained,
 #                        so that the file is readable during the sweep.
+#                        Results can also be NumPy arrays: each one is saved in the experiment directory as
+#                        'result_<name>.npy', and the CSV holds the path of that file (see results.py).
 # - specific_dict: a dictionary containing the swept parameters that are specific to certain values of other
 #                  swept parameters. This will avoid computing redundant experiments. Example: if your sweep is
 #                  {"alpha":["A","B","C"],"beta":[1,2,3]}, but 'beta' only changes the result of the experiment when
@@ -38,15 +56,62 @@ from .common import *
 # - only_exp_id: an integer indicating an experiment index. Only the experiment corresponding to this id will be run
 #               instead of the whole sweep. This is useful when doing sweeps on a cluster, e.g. for array jobs.
 #               Values must be between 0 and the total number of experiments.
+# - log_per_exp: if True, the output of each experiment is also written to 'output.txt' in its directory.
+# - log_compress: if True, the log files are gzip-compressed ('output.txt.gz').
+# - log_max_bytes: if > 0, the log files are rotated when they reach that size (see logger.LogFile).
+# - cache: an optional cache.ResultCache. Experiments that are already in the cache (e.g. computed by a previous
+#          sweep with overlapping parameters) are not run again: their results and files are taken from the cache.
+# - stable_ids: if True, experiment ids and folders are assigned by the manifest of the sweep (see manifest.Manifest)
+#               instead of being the index of the parameter combination. Running the sweep again with more parameter
+#               values then only runs the new combinations, and keeps the ids and folders of the previous ones.
+#               Note that `only_exp_id` is still the index of the combination in `param_dict`.
+# - worker_setup: a function called once before the first experiment, e.g. to load datasets. Its return value is
+#                 passed to `experiment_func` as a 4th argument: experiment_func(exp_id, param_dict, exp_dir, setup).
+#                 In parameter_sweep_parallel(), it's called once in each worker process.
+# - timeout: if set, experiments running for more than `timeout` seconds are interrupted (on Unix only).
+# - retries: number of times an experiment that raised an exception (or timed out) is run again.
+# - retry_backoff: delay in seconds before the first retry, which doubles at each retry.
+# - on_error: what to do when an experiment still fails after its retries:
+#             - "raise": stop the sweep and raise the exception (default)
+#             - "continue": continue with the next experiments. The CSV then has 2 more columns: 'status' ("ok",
+#                           "failed" or "timeout") and 'error' (the error message), and the failed experiments have
+#                           empty results.
+# - dir_layout: how experiment folders are grouped in subfolders of the sweep folder, for huge sweeps: None (all in
+#               the sweep folder), "id:N" (by blocks of N ids), or "param:name" (by value of a parameter).
+#               See common.py. The layout is recorded in 'sweep.txt', which is created if it doesn't exist.
+# - dir_names: names of the experiment folders: "params" (exp_id and parameter values, default), "id" (only the
+#              exp_id) or "hash" (a hash of the parameter values). Use "id" or "hash" when there are so many
+#              parameters that the names get too long. The viewer then finds the folders with the index written in
+#              'dir_index.npy' (see common.py).
+# - dedup: an optional dedup.DedupStore. When an experiment finishes, its files that are identical to files of
+#          previous experiments are replaced by hardlinks to a single copy, e.g. DedupStore(sweep_dir+"/.store").
 def parameter_sweep(param_dict, experiment_func, sweep_dir, start_index=0, result_csv_filename="", specific_dict=None,
-                    skip_exps=None, only_exp_id=None):
+                    skip_exps=None, only_exp_id=None, log_per_exp=False, log_compress=False, log_max_bytes=0,
+                    cache=None, stable_ids=False, worker_setup=None, timeout=None, retries=0, retry_backoff=1.0,
+                    on_error="raise", dir_layout=None, dir_names="params", dedup=None):
 
     # Logger that duplicates terminal output to file
-    logger = Logger(os.path.join(sweep_dir,"output.txt"))
+    with Logger(os.path.join(sweep_dir,"output.txt"), compress=log_compress, max_bytes=log_max_bytes) as logger:
+        _parameter_sweep(param_dict, experiment_func, sweep_dir, start_index, result_csv_filename, specific_dict,
+                         skip_exps, only_exp_id, logger if log_per_exp else None, cache, stable_ids,
+                         worker_setup, timeout, retries, retry_backoff, on_error, dir_layout, dir_names, dedup)
+        if cache is not None:
+            cache.print_stats()
+            cache.evict()
+        if dedup is not None:
+            print(dedup.stats_str())
+
+
+def _parameter_sweep(param_dict, experiment_func, sweep_dir, start_index, result_csv_filename, specific_dict,
+                     skip_exps, only_exp_id, exp_logger, cache=None, stable_ids=False, worker_setup=None,
+                     timeout=None, retries=0, retry_backoff=1.0, on_error="raise", dir_layout=None,
+                     dir_names="params", dedup=None):
 
     if not param_dict:
         print("The parameter dictionary is empty. Nothing to do.")
         return
+    layout = parse_dir_layout(dir_layout, param_dict, start_index, dir_names)
+    write_dir_layout(sweep_dir, param_dict, layout)
 
     # Set some variables
     csv_path = os.path.join(sweep_dir, result_csv_filename)
@@ -69,6 +134,23 @@ def parameter_sweep(param_dict, experiment_func, sweep_dir, start_index=0, resul
     else:
         print("\nThere are",num_exp,"experiments in total.\n")
 
+    manifest = None
+    if stable_ids:
+        manifest = Manifest(sweep_dir, num_exp, start_index, layout)
+        if manifest.num_done():
+            print("%d experiments are already done according to the manifest.\n" % manifest.num_done())
+    write_dir_index(sweep_dir, param_dict, num_exp, start_index, layout, manifest)
+
+    # Extra arguments of experiment_func
+    setup_args = (worker_setup(),) if worker_setup is not None else ()
+
+    if on_error not in ("raise", "continue"):
+        print("ERROR: on_error must be 'raise' or 'continue', not '%s'." % on_error)
+        exit(-1)
+    # With on_error="continue", the rows of failed experiments have empty results, so they're kept here until the
+    # names of the results are known.
+    failures = {"result_names": None, "rows": [], "count": 0}
+
     # if specific_dict:
     #     num_unique_exp = get_num_unique_exp(param_dict,specific_dict)
     #     print("There are %d unique experiments and %d redundant ones"%(num_unique_exp,num_exp-num_unique_exp))
@@ -89,22 +171,37 @@ def parameter_sweep(param_dict, experiment_func, sweep_dir, start_index=0, resul
                     exp_id = exp_id + 1
                     continue
 
-                # Get folder name for that experiment
-                exp_dir = os.path.join(sweep_dir, build_dir_name(num_exp, exp_id, current_dict))
+                # Get id and folder name for that experiment
+                run_id = exp_id
+                exp_dir = os.path.join(sweep_dir, build_dir_name(num_exp, exp_id, current_dict, layout))
+                if manifest is not None:
+                    entry = manifest.get_entry(current_dict)
+                    if entry["done"]:
+                        exp_id = exp_id + 1
+                        continue
+                    run_id = entry["exp_id"]
+                    exp_dir = os.path.join(sweep_dir, entry["dir"])
 
                 # Check whether this experiment is redundant
                 src_exp_id, src_exp_dict = check_exp_redundancy(param_dict, specific_dict, current_dict, start_index)
+                if manifest is not None and src_exp_id != -1:
+                    src_exp_id = manifest.get_entry(src_exp_dict)["exp_id"]
 
                 # Write the csv row prefix
                 csv_row_prefix = ""
                 if result_csv_filename:
-                    csv_row_prefix = [exp_id, src_exp_id] + list(current_dict.values())
+                    csv_row_prefix = [run_id, src_exp_id] + list(current_dict.values())
 
                 # If it's redundant, make a symlink to the source experiment directory
                 if src_exp_id != -1:
                     # Get the src dir name
-                    src_exp_dir = build_dir_name(num_exp, src_exp_id, src_exp_dict)
-                    # Make the symlink
+                    if manifest is not None:
+                        src_exp_dir = manifest.by_id[src_exp_id]["dir"]
+                    else:
+                        src_exp_dir = build_dir_name(num_exp, src_exp_id, src_exp_dict, layout)
+                    # Make the symlink, relative to the folder that contains it
+                    os.makedirs(os.path.dirname(exp_dir), exist_ok=True)
+                    src_exp_dir = os.path.relpath(os.path.join(sweep_dir, src_exp_dir), os.path.dirname(exp_dir))
                     try:
                         os.symlink(src_exp_dir, exp_dir, target_is_directory=True)
                     except FileExistsError:
@@ -118,12 +215,46 @@ def parameter_sweep(param_dict, experiment_func, sweep_dir, start_index=0, resul
                 else:
                     # Make the directory
                     os.makedirs(exp_dir, exist_ok=True)
-                    # Run the experiment
-                    result_dict = experiment_func(exp_id, current_dict, exp_dir)
+                    # Run the experiment, unless its results are already in the cache
+                    cache_hit = False
+                    if cache is not None:
+                        cache_hit, result_dict = cache.get(experiment_func, current_dict, exp_dir)
+                        if cache_hit:
+                            print("Experiment %d: results restored from the cache" % run_id)
+                            result_dict = save_array_results(result_dict, sweep_dir, exp_dir)
+                    status = "ok"
+                    if not cache_hit:
+                        if exp_logger is not None:
+                            exp_logger.set_exp_logfile(get_exp_log_path(exp_dir))
+                        try:
+                            status, result_dict, error = run_with_retries(experiment_func,
+                                                                          (run_id, current_dict, exp_dir) + setup_args,
+                                                                          timeout, retries, retry_backoff, on_error)
+                        finally:
+                            if exp_logger is not None:
+                                exp_logger.set_exp_logfile(None)
+                        if status == "ok":
+                            result_dict = save_array_results(result_dict, sweep_dir, exp_dir)
+                        if cache is not None and status == "ok":
+                            cache.put(experiment_func, current_dict, exp_dir, result_dict)
+
+                    if status != "ok":
+                        failures["count"] += 1
+                        if result_csv_filename:
+                            failures["rows"].append((csv_row_prefix, {"status": status, "error": error}))
+                        exp_id = exp_id + 1
+                        continue
+
+                    if dedup is not None:
+                        dedup.dedup(exp_dir)
 
                     if not result_dict:
                         print("WARNING: Experiment %d - can't write results to CSV, didn't receive results "
-                                "from experiment_func()." % exp_id)
+                                "from experiment_func()." % run_id)
+                    elif on_error == "continue":
+                        result_dict = dict(result_dict, status="ok", error="")
+                        if failures["result_names"] is None:
+                            failures["result_names"] = list(result_dict.keys())[:-2]
 
                 if result_csv_filename:
                     # Write the header (does nothing if already written)
@@ -132,6 +263,14 @@ def parameter_sweep(param_dict, experiment_func, sweep_dir, start_index=0, resul
                     # Write results to the CSV
                     csv_write_result(csv_path, csv_row_prefix, result_dict)
 
+                    # Rows of failed experiments, with empty results
+                    if failures["rows"] and failures["result_names"] is not None:
+                        csv_write_failed_rows(csv_path, failures["rows"], failures["result_names"])
+                        failures["rows"] = []
+
+                if manifest is not None:
+                    manifest.set_done(run_id)
+
                 exp_id = exp_id + 1
 
         return exp_id
@@ -139,28 +278,78 @@ def parameter_sweep(param_dict, experiment_func, sweep_dir, start_index=0, resul
     # Start experiments
     t0 = time.time()
     recursive_call(start_index, current_dict, 0)
+    if manifest is not None:
+        write_dir_index(sweep_dir, param_dict, num_exp, start_index, layout, manifest)
+    # Rows of the failures after the last success, with empty results. If no experiment succeeded, the CSV only has
+    # the parameters and the status.
+    if failures["rows"]:
+        if failures["result_names"] is None:
+            csv_write_header(csv_path, current_dict, failures["rows"][0][1])
+        csv_write_failed_rows(csv_path, failures["rows"], failures["result_names"] or [])
+    if failures["count"]:
+        print("WARNING: %d experiments failed." % failures["count"])
     print("Total time of all experiments:",time.time()-t0)
 
 
-# Logger that duplicates output to terminal and to file
-# Not portable on Windows though...
-class Logger(object):
-
-    def __init__(self,logfile):
-        # import warnings
-        # warnings.filterwarnings("default")
-
-        # Works but we loose colors in the terminal
-        import subprocess
-        self.tee = subprocess.Popen(["tee", logfile], stdin=subprocess.PIPE)
-        os.dup2(self.tee.stdin.fileno(), sys.stdout.fileno())
-        os.dup2(self.tee.stdin.fileno(), sys.stderr.fileno())
-
-    def __del__(self):
-        self.tee.stdin.close()
-        sys.stdout.close()
-        sys.stderr.close()
-
+class ExperimentTimeout(Exception):
+    pass
+
+
+# Call func(*args), and raise ExperimentTimeout if it takes more than `timeout` seconds.
+# This uses SIGALRM, so it only works on Unix and in the main thread. The exception is raised when the experiment
+# executes Python code, so a long call to a C function is only interrupted when it returns.
+def call_with_timeout(func, args, timeout):
+    import signal
+    import threading
+    if not timeout:
+        return func(*args)
+    if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        print("WARNING: Timeouts are only supported in the main thread on Unix, the experiment runs without timeout.")
+        return func(*args)
+    def handler(signum, frame):
+        raise ExperimentTimeout("The experiment didn't finish within %g seconds" % timeout)
+    previous_handler = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+# Run an experiment, and run it again up to `retries` times if it fails.
+# Returns (status, result_dict, error message), where status is "ok", "failed" or "timeout".
+# With on_error="raise", the exception of the last attempt is raised instead.
+def run_with_retries(experiment_func, args, timeout=None, retries=0, retry_backoff=1.0, on_error="raise"):
+    import traceback
+    for attempt in range(retries+1):
+        if attempt > 0:
+            time.sleep(retry_backoff*2**(attempt-1))
+        try:
+            return "ok", call_with_timeout(experiment_func, args, timeout), ""
+        except Exception as e:
+            if attempt < retries:
+                print("WARNING: Experiment %d - attempt %d failed (%r), retrying." % (args[0], attempt+1, e))
+                continue
+            if on_error != "continue":
+                raise
+            error_traceback = traceback.format_exc()
+            print("ERROR: Experiment %d - failed after %d attempt(s):\n%s" % (args[0], attempt+1, error_traceback))
+            status = "timeout" if isinstance(e, ExperimentTimeout) else "failed"
+            return status, None, traceback_last_line(error_traceback)
+
+
+# Last line of a traceback, i.e. the exception and its message
+def traceback_last_line(error_traceback):
+    lines = [line for line in error_traceback.splitlines() if line.strip()]
+    return lines[-1] if lines else ""
+
+
+# Write the rows of failed experiments in the CSV, with empty results.
+# - rows: list of (csv_row_prefix, {"status": ..., "error": ...})
+def csv_write_failed_rows(csv_path, rows, result_names):
+    for csv_row_prefix, status_dict in rows:
+        csv_write_result(csv_path, csv_row_prefix, dict({k: "" for k in result_names}, **status_dict))
 
 
 # Write results of one experiment in the CSV (one single line)
@@ -172,6 +361,22 @@ def csv_write_result(csv_path, csv_row_prefix, result_dict={}):
         csv_writer.writerow(csv_row)
 
 
+# Open a CSV to append rows to it. If it doesn't exist, it's created with its header atomically, by hard-linking
+# a complete temporary file, so that processes appending to the same CSV (e.g. the shards of a sweep, or distributed
+# workers) write the header only once, and no row before it.
+def csv_open_append(csv_path, header, quoting=csv.QUOTE_NONNUMERIC):
+    if not os.path.exists(csv_path):
+        tmp_path = "%s.tmp-%s-%d-%d" % (csv_path, socket.gethostname(), os.getpid(), threading.get_ident())
+        with open(tmp_path, "w") as f:
+            csv.writer(f, quoting=quoting).writerow(header)
+        try:
+            os.link(tmp_path, csv_path)
+        except FileExistsError:
+            pass
+        os.remove(tmp_path)
+    return open(csv_path, mode='a')
+
+
 # This function writes the header of the CSV file if it's not written yet
 # If the file doesn't exist, it creates it and adds the header
 # If the file exists but doesn't start with the header, it prepends it.
@@ -212,6 +417,11 @@ def csv_write_header(csv_path, current_dict, result_dict):
         file_prepend_line(csv_path, header_str)
 
 
+# Path of the file where the output of an experiment is logged
+def get_exp_log_path(exp_dir):
+    return os.path.join(exp_dir, "output.txt")
+
+
 def file_get_first_line(filename):
     with open(filename) as f:
         return f.readline()
@@ -243,13 +453,37 @@ def get_num_exp(sweep_dict):
 #     return 0
 
 
-def build_dir_name(n_exp, exp_id, current_dict):
-    exp_dir = ("exp_%0" + str(len(str(n_exp))) + "d_") % exp_id
-    for k, v in current_dict.items():
-        exp_dir += "_" + k + val2str(v)
+# Path of the folder of an experiment, relative to the sweep folder
+# - layout: layout of the folders returned by parse_dir_layout() (see common.py), None for all folders in the sweep folder
+def build_dir_name(n_exp, exp_id, current_dict, layout=None):
+    names = layout.get("names", "params") if layout is not None else "params"
+    if names == "hash":
+        exp_dir = "exp_" + hashlib.sha1(combination_key(current_dict).encode()).hexdigest()[:16]
+    elif names == "id":
+        exp_dir = ("exp_%0" + str(len(str(n_exp))) + "d") % exp_id
+    else:
+        exp_dir = ("exp_%0" + str(len(str(n_exp))) + "d_") % exp_id
+        for k, v in current_dict.items():
+            exp_dir += "_" + k + val2str(v)
+    if layout is not None:
+        exp_dir = os.path.join(get_layout_subdir(layout, n_exp, exp_id, current_dict), exp_dir)
     return exp_dir
 
 
+# Write the index of the experiment folders (see common.py), if the layout needs one
+# - manifest: if the ids were assigned by a manifest, the folders are taken from it
+def write_dir_index(sweep_dir, param_dict, n_exp, start_index, layout, manifest=None):
+    if not has_dir_index(layout):
+        return
+    if manifest is not None:
+        dir_names = [manifest.entries[key]["dir"] if key in manifest.entries else ""
+                     for key in map(combination_key, iterate_param_dicts(param_dict))]
+    else:
+        dir_names = [build_dir_name(n_exp, exp_id, current_dict, layout)
+                     for exp_id, current_dict in enumerate(iterate_param_dicts(param_dict), start_index)]
+    save_dir_index(sweep_dir, dir_names)
+
+
 def get_exp_id(sweep_dict, current_dict):
     if sweep_dict.keys() != current_dict.keys():
         print("ERROR: Dictionaries don't have the same keys. Aborting.")
@@ -266,6 +500,16 @@ def get_exp_id(sweep_dict, current_dict):
     return index
 
 
+# Inverse of get_exp_id(): get the parameter dictionary of the experiment with index `index`
+# (with the same ordering as make_param_dict_list())
+def get_exp_dict(sweep_dict, index):
+    exp_dict = {}
+    for k in reversed(list(sweep_dict.keys())):
+        index, v_index = divmod(index, len(sweep_dict[k]))
+        exp_dict[k] = sweep_dict[k][v_index]
+    return {k: exp_dict[k] for k in sweep_dict.keys()}
+
+
 # Check whether an experiment is redundant or not, based on a specificity dictionary
 # If it is, it returns the id and param dictionary of the experiment to copy from
 def check_exp_redundancy(sweep_dict, specific_dict, current_dict, start_index):
@@ -329,6 +573,14 @@ def check_skip_exp(current_dict, skip_exps):
     return False
 
 
+# Iterate over the parameter dictionaries (one for each experiment), in the same order as make_param_dict_list(),
+# but without building the whole list.
+def iterate_param_dicts(param_dict):
+    keys = list(param_dict.keys())
+    for values in itertools.product(*param_dict.values()):
+        yield dict(zip(keys, values))
+
+
 # Make list of parameter dictionaries (one for each experiment)
 def make_param_dict_list(param_dict):
     return make_param_dict_list_recursive(param_dict, {}, 0)
@@ -348,6 +600,252 @@ def make_param_dict_list_recursive(param_dict, current_dict, param_index):
     return param_dict_list
 
 
+###############
+# BATCH SWEEP #
+###############
+
+
+# Same as parameter_sweep(), but `experiment_func` is called on batches of experiments instead of one at a time.
+# This is useful for cheap experiments that can be vectorized with NumPy: sweeps of millions of experiments then
+# run at NumPy speed instead of Python-loop speed.
+# - experiment_func: a functor that takes as argument:
+#                    - exp_ids: a NumPy array of the experiment indices of the batch
+#                    - batch_dict: a dictionary with, for each parameter, a NumPy array of its value in each
+#                      experiment of the batch (same length as exp_ids)
+#                    - exp_dirs: a list of paths to the experiment directories, or None if make_dirs=False
+#                    It returns the results of the batch as a dictionary of columns (arrays or lists with the
+#                    same length as exp_ids), with keys being the column names of the CSV. A column can also hold
+#                    an array result for each experiment (an array with more than 1 dimension, or a list of arrays),
+#                    which are saved in the experiment directories (see parameter_sweep()).
+# - batch_size: maximum number of experiments in a batch
+# - make_dirs: whether to create a directory for each experiment. Disable it if the experiments don't save files,
+#              to avoid creating millions of directories.
+# The other arguments are the same as parameter_sweep(). The CSV has the same format, and since batch sweeps don't
+# handle specific_dict, 'src_exp_id' is always -1.
+def parameter_sweep_batch(param_dict, experiment_func, sweep_dir, batch_size=10000, start_index=0, result_csv_filename="",
+                          skip_exps=None, make_dirs=True, dir_layout=None, dir_names="params", dedup=None):
+
+    # Logger that duplicates terminal output to file
+    with Logger(os.path.join(sweep_dir,"output.txt")):
+
+        if not param_dict:
+            print("The parameter dictionary is empty. Nothing to do.")
+            return
+
+        csv_path = os.path.join(sweep_dir, result_csv_filename)
+        num_exp = get_num_exp(param_dict)
+        print("\nThere are", num_exp, "experiments in total, run in batches of", batch_size, "experiments.\n")
+        layout = parse_dir_layout(dir_layout, param_dict, start_index, dir_names)
+        if make_dirs:
+            write_dir_layout(sweep_dir, param_dict, layout)
+            write_dir_index(sweep_dir, param_dict, num_exp, start_index, layout)
+
+        # Arrays of values of each parameter, and the stride of each parameter in the exp_id numbering
+        value_arrays = {k: make_value_array(v) for k, v in param_dict.items()}
+        strides = {}
+        stride = 1
+        for k in reversed(list(param_dict.keys())):
+            strides[k] = stride
+            stride *= len(param_dict[k])
+
+        t0 = time.time()
+        for batch_start in range(0, num_exp, batch_size):
+            # Parameter values of all experiments of the batch
+            index = np.arange(batch_start, min(batch_start+batch_size, num_exp))
+            batch_dict = {k: value_arrays[k][(index // strides[k]) % len(value_arrays[k])] for k in param_dict.keys()}
+            exp_ids = index + start_index
+
+            # Remove the experiments to skip
+            if skip_exps is not None:
+                keep = ~check_skip_exp_batch(batch_dict, skip_exps)
+                exp_ids = exp_ids[keep]
+                batch_dict = {k: v[keep] for k, v in batch_dict.items()}
+            n = len(exp_ids)
+            if n == 0:
+                continue
+
+            # Make the directories
+            exp_dirs = None
+            if make_dirs:
+                value_lists = [batch_dict[k].tolist() for k in param_dict.keys()]
+                exp_dirs = [os.path.join(sweep_dir, build_dir_name(num_exp, exp_id, dict(zip(param_dict.keys(), values)), layout))
+                            for exp_id, values in zip(exp_ids.tolist(), zip(*value_lists))]
+                if layout is not None:
+                    for subdir in set(os.path.dirname(exp_dir) for exp_dir in exp_dirs):
+                        os.makedirs(subdir, exist_ok=True)
+                for exp_dir in exp_dirs:
+                    try:
+                        os.mkdir(exp_dir)
+                    except FileExistsError:
+                        pass
+
+            # Run the batch
+            result_columns = experiment_func(exp_ids, batch_dict, exp_dirs)
+            if dedup is not None and exp_dirs is not None:
+                for exp_dir in exp_dirs:
+                    dedup.dedup(exp_dir)
+
+            if not result_columns:
+                print("WARNING: Experiments %d to %d - can't write results to CSV, didn't receive results "
+                      "from experiment_func()." % (exp_ids[0], exp_ids[-1]))
+                continue
+            if not result_csv_filename:
+                continue
+            result_lists = [np.asarray(c).tolist() if isinstance(c, np.ndarray) else list(c) for c in result_columns.values()]
+            if any(len(c) != n for c in result_lists):
+                print("ERROR: Experiments %d to %d - the result columns must have one value per experiment (%d)."
+                      % (exp_ids[0], exp_ids[-1], n))
+                continue
+            # Array results are saved in the experiment directories
+            for c, (name, column) in enumerate(result_columns.items()):
+                if (isinstance(column, np.ndarray) and column.ndim > 1) or \
+                        (len(column) and isinstance(column[0], np.ndarray)):
+                    if exp_dirs is None:
+                        print("ERROR: Array results ('%s') need the experiment directories (make_dirs=True)." % name)
+                        exit(-1)
+                    result_lists[c] = [save_array_results({name: np.asarray(array)}, sweep_dir, exp_dir)[name]
+                                       for array, exp_dir in zip(column, exp_dirs)]
+
+            # Write the header (does nothing if already written), and all results of the batch at once
+            csv_write_header(csv_path, param_dict, result_columns)
+            with open(csv_path, mode='a') as csv_file:
+                csv_writer = csv.writer(csv_file,quoting=csv.QUOTE_NONNUMERIC)
+                csv_writer.writerows(zip(exp_ids.tolist(), [-1]*n, *[batch_dict[k].tolist() for k in param_dict.keys()],
+                                         *result_lists))
+
+        print("Total time of all experiments:",time.time()-t0)
+        if dedup is not None:
+            print(dedup.stats_str())
+
+
+# Make a NumPy array of the values of a parameter, keeping their original type if they have different types
+# (np.asarray() would convert them all to strings).
+def make_value_array(values):
+    if len(set(type(v) for v in values)) > 1:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    return np.asarray(values)
+
+
+# Vectorized version of check_skip_exp(): returns a boolean array indicating which experiments of the batch to skip
+def check_skip_exp_batch(batch_dict, skip_exps):
+    if not isinstance(skip_exps, list):
+        skip_exps = [skip_exps]
+    n = len(next(iter(batch_dict.values())))
+    skip = np.zeros(n, dtype=bool)
+    for condition in skip_exps:
+        if not condition: continue
+        skip_condition = np.ones(n, dtype=bool)
+        for k, v in condition.items():
+            if not isinstance(v, list): v = [v]
+            if not k in batch_dict:
+                print("ERROR: parameter '%s' is not in batch_dict." % k)
+                continue
+            if batch_dict[k].dtype == object:
+                skip_condition &= np.array([x in v for x in batch_dict[k]], dtype=bool)
+            else:
+                skip_condition &= np.isin(batch_dict[k], v)
+        skip |= skip_condition
+    return skip
+
+
+###############
+# ASYNC SWEEP #
+###############
+
+
+# Same function as parameter_sweep(), for experiments that spend most of their time waiting (calling services,
+# running subprocesses, etc.). `experiment_func` is an `async def` function with the same arguments as for
+# parameter_sweep(). The experiments run concurrently in a single process with asyncio.
+# - max_concurrency: maximum number of experiments running at the same time
+# - rate_limit: if set, maximum number of experiments started per second
+# - timeout: if set, experiments that take more than `timeout` seconds are cancelled, and have no results in the CSV
+# The CSV has the same format as for parameter_sweep(), with rows in the order in which experiments finish.
+# This function starts its own event loop, so it can't be called from a running one (e.g. in a Jupyter notebook):
+# in that case, use `await parameter_sweep_async_coroutine(...)`, with the same arguments.
+def parameter_sweep_async(param_dict, experiment_func, sweep_dir, max_concurrency=100, start_index=0,
+                          result_csv_filename="", skip_exps=None, rate_limit=None, timeout=None, dir_layout=None,
+                          dir_names="params", dedup=None):
+
+    import asyncio
+
+    # Logger that duplicates terminal output to file
+    with Logger(os.path.join(sweep_dir,"output.txt")):
+        asyncio.run(parameter_sweep_async_coroutine(param_dict, experiment_func, sweep_dir, max_concurrency,
+                                                    start_index, result_csv_filename, skip_exps, rate_limit, timeout,
+                                                    dir_layout, dir_names, dedup))
+
+
+async def parameter_sweep_async_coroutine(param_dict, experiment_func, sweep_dir, max_concurrency=100, start_index=0,
+                                          result_csv_filename="", skip_exps=None, rate_limit=None, timeout=None,
+                                          dir_layout=None, dir_names="params", dedup=None):
+
+    import asyncio
+
+    if not param_dict:
+        print("The parameter dictionary is empty. Nothing to do.")
+        return
+    if not asyncio.iscoroutinefunction(experiment_func):
+        print("ERROR: experiment_func must be an 'async def' function to be used in parameter_sweep_async().")
+        exit(-1)
+
+    csv_path = os.path.join(sweep_dir, result_csv_filename)
+    num_exp = get_num_exp(param_dict)
+    print("\nThere are", num_exp, "experiments in total, with up to", max_concurrency, "running at the same time.\n")
+    layout = parse_dir_layout(dir_layout, param_dict, start_index, dir_names)
+    write_dir_layout(sweep_dir, param_dict, layout)
+    write_dir_index(sweep_dir, param_dict, num_exp, start_index, layout)
+
+    # Experiments are taken from this iterator by `max_concurrency` runners, so there are never more than
+    # `max_concurrency` experiments in memory, whatever the size of the sweep.
+    experiments = enumerate(iterate_param_dicts(param_dict), start_index)
+    loop = asyncio.get_running_loop()
+    next_start_time = loop.time()
+
+    async def wait_rate_limit():
+        nonlocal next_start_time
+        now = loop.time()
+        wait = next_start_time - now
+        next_start_time = max(now, next_start_time) + 1/rate_limit
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def runner():
+        for exp_id, current_dict in experiments:
+            if skip_exps is not None and check_skip_exp(current_dict, skip_exps):
+                continue
+            if rate_limit:
+                await wait_rate_limit()
+
+            exp_dir = os.path.join(sweep_dir, build_dir_name(num_exp, exp_id, current_dict, layout))
+            os.makedirs(exp_dir, exist_ok=True)
+            try:
+                result_dict = await asyncio.wait_for(experiment_func(exp_id, current_dict, exp_dir), timeout)
+            except asyncio.TimeoutError:
+                print("WARNING: Experiment %d - cancelled after a timeout of %g seconds." % (exp_id, timeout))
+                continue
+            result_dict = save_array_results(result_dict, sweep_dir, exp_dir)
+            if dedup is not None:
+                # Hashing files blocks, so it's done in a thread to not stop the other experiments
+                await loop.run_in_executor(None, dedup.dedup, exp_dir)
+
+            if not result_csv_filename:
+                continue
+            if not result_dict:
+                print("WARNING: Experiment %d - can't write results to CSV, didn't receive results "
+                      "from experiment_func()." % exp_id)
+                continue
+            csv_write_header(csv_path, current_dict, result_dict)
+            csv_write_result(csv_path, [exp_id, -1] + list(current_dict.values()), result_dict)
+
+    t0 = time.time()
+    await asyncio.gather(*[runner() for _ in range(max(1, min(max_concurrency, num_exp)))])
+    print("Total time of all experiments:", time.time()-t0)
+    if dedup is not None:
+        print(dedup.stats_str())
+
+
 ##################
 # PARALLEL SWEEP #
 ##################
@@ -355,103 +853,345 @@ def make_param_dict_list_recursive(param_dict, current_dict, param_index):
 
 # Same function as above, except that it runs the sweep with a multiprocessing pool of `max_workers` workers.
 # The results are written individually to the CSV file as they are produced, so that it's always readable
-# during the sweep
-def parameter_sweep_parallel(param_dict, experiment_func, sweep_dir, max_workers=4, start_index=0, result_csv_filename=""):
-
-    import pathos.multiprocessing as mp
-    # import multiprocessing as mp
-    from pathos.helpers import mp as pathos_multiprocess
-    import contextlib
-    
-    # Function to print to file
-    def print_to_file(file,print_str):
-        with open(file, mode='a+') as f:
-            f.write(print_str+"\n")
-
-    # Function to print to stdout and to file
-    def multiple_print(print_str,stdout=True,f_output=True,f_output_ordered=True):
-        if stdout: print(print_str)
-        if f_output: print_to_file(os.path.join(sweep_dir,"output.txt"),print_str)
-        if f_output_ordered: print_to_file(os.path.join(sweep_dir,"output-ordered.txt"),print_str)
+# during the sweep.
+# - max_in_flight: maximum number of experiments that are submitted to the pool and whose results haven't been
+#                  received yet (default: 2*max_workers*chunksize). Tasks are submitted as results come back,
+#                  so the memory usage doesn't grow with the number of experiments.
+# - chunksize: number of experiments sent to a worker at once (default: chosen from the number of experiments
+#              and workers). Larger chunks reduce the dispatch overhead for very short experiments.
+# The pool uses the default multiprocessing start method. With 'fork' (the default on Linux), `experiment_func`
+# can be any function, e.g. a closure. With 'spawn' (the default on Windows and macOS), it must be picklable,
+# i.e. defined at the top level of a module.
+# - cache: an optional cache.ResultCache (see parameter_sweep()). It's shared by all workers.
+# - stable_ids: if True, experiment ids and folders are assigned by the manifest of the sweep (see parameter_sweep()).
+# - worker_setup: a function called once in each worker process, before its first experiment, e.g. to load datasets.
+#                 Its return value is passed to `experiment_func` as a 4th argument (see parameter_sweep()).
+#                 To share large NumPy arrays between the workers without copying them, use shared.SharedArray
+#                 or shared.mmap_array().
+# - exp_ids: if set, a range or a list of the ids of the experiments to run, instead of all of them, e.g. one shard of
+#            the sweep in an array job (see shards.py). Ids go from `start_index` to `start_index+num_exp-1`.
+# - cost: if set, run the experiments from the most expensive to the least expensive, to avoid ending the sweep with
+#         one worker running a long experiment while the others are idle. It's either a function of the parameter
+#         dictionary returning an estimated cost, or the folder of a previous sweep (or its 'timings.csv' file), in
+#         which the duration of each experiment was recorded (see schedule.py).
+# - dry_run: if True, only print the estimated duration of the sweep (using `cost`), without running it.
+# - timeout, retries, retry_backoff, on_error: see parameter_sweep(). An experiment that times out is stopped by
+#                                            killing its worker process, which is then replaced.
+# - max_tasks_per_worker: if set, worker processes are replaced after running that many experiments
+# - max_worker_rss: if set, worker processes are replaced when they use more memory than that (in bytes), e.g. when
+#                   experiments leak memory
+# - max_workers: number of worker processes. If None, it's chosen from the number of cores (see threads.py).
+# - threads_per_worker: maximum number of threads of the BLAS/OpenMP libraries (used by NumPy) in each worker, so that
+#                       the workers don't oversubscribe the cores. By default, the cores are split between the
+#                       workers. Pass 0 to not limit them. With the 'fork' start method (the default on Linux),
+#                       this needs threadpoolctl, since NumPy is already loaded when the workers start (see threads.py).
+# - pin_workers: if True, pin each worker to its own set of `threads_per_worker` cores (Linux only)
+# - backend: "process" (default) to run the experiments in worker processes, or "thread" to run them in threads of
+#            the current process. Threads are better for experiments that spend most of their time in code that
+#            releases the GIL (e.g. NumPy, SciPy): they start instantly, nothing is pickled, and they share the data
+#            in memory (`worker_setup` is called only once, and its return value is shared by all threads).
+#            With threads, `timeout`, `max_tasks_per_worker`, `max_worker_rss` and `pin_workers` aren't supported,
+#            and `threads_per_worker` needs threadpoolctl.
+# - dir_layout, dir_names: see parameter_sweep().
+# - dedup: an optional dedup.DedupStore (see parameter_sweep()). Files are deduplicated by the workers.
+# The duration of each experiment is recorded in 'timings.csv' in the sweep folder.
+def parameter_sweep_parallel(param_dict, experiment_func, sweep_dir, max_workers=4, start_index=0, result_csv_filename="",
+                             max_in_flight=None, chunksize=None, cache=None, stable_ids=False, worker_setup=None,
+                             exp_ids=None, cost=None, dry_run=False, timeout=None, retries=0, retry_backoff=1.0,
+                             on_error="raise", max_tasks_per_worker=None, max_worker_rss=None, threads_per_worker=None,
+                             pin_workers=False, backend="process", dir_layout=None, dir_names="params", dedup=None):
 
     if not param_dict:
         print("The parameter dictionary is empty. Nothing to do.")
         return
+    if on_error not in ("raise", "continue"):
+        print("ERROR: on_error must be 'raise' or 'continue', not '%s'." % on_error)
+        exit(-1)
+    if backend not in ("process", "thread"):
+        print("ERROR: backend must be 'process' or 'thread', not '%s'." % backend)
+        exit(-1)
+    if backend == "thread" and (timeout or max_tasks_per_worker or max_worker_rss or pin_workers):
+        print("WARNING: timeout, max_tasks_per_worker, max_worker_rss and pin_workers are ignored with threads.")
 
-    # Fill the current_dict and count number of experiments
-    current_dict={}
-    num_exp = 1
-    for k in param_dict.keys():
-        current_dict[k] = param_dict[k][0]
-        num_exp *= len(param_dict[k])
+    num_exp = get_num_exp(param_dict)
+    # Indices of the parameter combinations to run
+    if exp_ids is None:
+        indices = range(num_exp)
+    else:
+        indices = range(exp_ids.start-start_index, exp_ids.stop-start_index, exp_ids.step) \
+            if isinstance(exp_ids, range) else [exp_id-start_index for exp_id in exp_ids]
+        if len(indices) and (min(indices) < 0 or max(indices) >= num_exp):
+            print("ERROR: The exp_ids must be between %d and %d" % (start_index, start_index+num_exp-1))
+            exit(-1)
+    num_run = len(indices)
 
-    multiple_print("There are %d experiments in total.\n"%num_exp)
+    # Number of workers, and of threads in each worker
+    max_workers, num_threads = choose_workers_threads(num_run, max_workers, threads_per_worker)
+    core_sets = get_core_sets(max_workers, max(1, num_threads)) if pin_workers and backend == "process" else None
 
-    # Get list of parameter dictionaries (one for each experiment)
-    param_dict_list = make_param_dict_list(param_dict)
+    # Longest-processing-time-first order
+    if cost is not None or dry_run:
+        costs = get_costs([get_exp_dict(param_dict, i) for i in indices], cost) if cost is not None else [1.0]*num_run
+        if dry_run:
+            print_plan(costs, max_workers)
+            return
+        indices = [indices[i] for i in lpt_order(costs)]
+        if chunksize is None:
+            chunksize = 1   # So that each experiment starts on the first free worker, in that order
+    if chunksize is None:
+        chunksize = max(1, min(64, num_run // (8*max_workers)))
+    if max_in_flight is None:
+        max_in_flight = 2*max_workers*chunksize
+    # A chunk is only sent when it's full, so it can't be larger than the window
+    chunksize = min(chunksize, max_in_flight)
+
+    if num_run == num_exp:
+        multiple_print(sweep_dir, "There are %d experiments in total.\n"%num_exp)
+    else:
+        multiple_print(sweep_dir, "Running %d experiments out of %d in total.\n"%(num_run, num_exp))
+    if num_threads:
+        multiple_print(sweep_dir, "Using %d workers with %d threads each.\n"%(max_workers, num_threads))
+        warning = get_thread_limits_warning(num_threads, backend)
+        if warning is not None:
+            multiple_print(sweep_dir, warning + "\n")
+
+    layout = parse_dir_layout(dir_layout, param_dict, start_index, dir_names)
+    write_dir_layout(sweep_dir, param_dict, layout)
+
+    # The number of digits of the ids in the folder names is fixed by the manifest when it's created
+    manifest = None
+    dir_n_exp = num_exp
+    if stable_ids:
+        manifest = Manifest(sweep_dir, num_exp, start_index, layout)
+        dir_n_exp = manifest.n_exp
+        if manifest.num_done():
+            multiple_print(sweep_dir, "%d experiments are already done according to the manifest.\n" % manifest.num_done())
+    write_dir_index(sweep_dir, param_dict, dir_n_exp, start_index, layout, manifest)
+
+    # Tasks are generated lazily, when a worker can take them, so no more than `max_in_flight` of them are waiting
+    # for their result. Each task is only the exp_id and the index of the parameter combination, workers rebuild the
+    # parameters of the experiment from it.
+    def generate_tasks():
+        for index in indices:
+            exp_id = start_index + index
+            if manifest is not None:
+                entry = manifest.get_entry(get_exp_dict(param_dict, index))
+                if entry["done"]:
+                    continue
+                exp_id = entry["exp_id"]
+            yield exp_id, index
 
-    # Experiment worker
-    def worker_run_experiment(exp_id, current_dict, result_queue):
-        # Create a folder for that experiment
-        exp_dir = os.path.join(sweep_dir, build_dir_name(num_exp, exp_id, current_dict))
-        os.makedirs(exp_dir, exist_ok=True)
+    # Run experiments
+    t0 = time.time()
+    # Shards of a sweep run at the same time append to the same files, so they're created with their header
+    # atomically. The result CSV is created when the names of the results are known.
+    csv_path = os.path.join(sweep_dir, result_csv_filename) if result_csv_filename else None
+    csv_file = None
+    csv_writer = None
+    timings_file = csv_open_append(os.path.join(sweep_dir, TIMINGS_FILENAME), list(param_dict.keys()) + ["time"],
+                                   quoting=csv.QUOTE_MINIMAL)
+    timings_writer = csv.writer(timings_file)
+    # With on_error="continue", the CSV has 2 more columns: 'status' and 'error'. The rows of failed experiments
+    # have empty results, so they're kept here until the names of the results are known.
+    status_columns = ["status", "error"] if on_error == "continue" else []
+    result_names = None
+    failed_rows = []
+    num_failed = 0
+    worker_initargs = (experiment_func, param_dict, sweep_dir, dir_n_exp, cache, worker_setup, layout, dedup)
+    if backend == "thread":
+        pool = ThreadWorkerPool(max_workers, _worker_run_experiment, initializer=_worker_init, initargs=worker_initargs,
+                                max_in_flight=max_in_flight, retries=retries, retry_backoff=retry_backoff)
+    else:
+        pool = WorkerPool(max_workers, _worker_run_experiment, initializer=_worker_init, initargs=worker_initargs,
+                          chunksize=chunksize, max_in_flight=max_in_flight, timeout=timeout, retries=retries,
+                          retry_backoff=retry_backoff, max_tasks_per_worker=max_tasks_per_worker,
+                          max_worker_rss=max_worker_rss,
+                          slot_initializer=functools.partial(configure_worker_threads, threads_per_worker=num_threads,
+                                                             core_sets=core_sets))
+    try:
+        with contextlib.ExitStack() as stack:
+            if backend == "thread":
+                # Each thread redirects its own output to the log file of its experiment
+                stack.enter_context(thread_local_output())
+                stack.enter_context(thread_limits(num_threads))
+            else:
+                # Workers started by the pool inherit the thread limits in their environment
+                stack.enter_context(thread_limits_env(num_threads))
+            stack.enter_context(pool)
+            # Results are received as soon as each experiment finishes, which is not necessarily in exp_id order.
+            for (exp_id, index), status, value, attempts in pool.imap_unordered(generate_tasks()):
+
+                if status != "ok":
+                    error, error_traceback = value
+                    multiple_print(sweep_dir, "ERROR: Experiment %d - %s after %d attempt(s):\n%s"
+                                   % (exp_id, status, attempts, error_traceback), f_output_ordered=False)
+                    if on_error != "continue":
+                        raise error
+                    num_failed += 1
+                    if csv_path is not None:
+                        error_str = traceback_last_line(error_traceback) if status == "failed" else str(error)
+                        failed_rows.append([exp_id] + list(get_exp_dict(param_dict, index).values()) + [status, error_str])
+                else:
+                    exp_id, exp_param_dict, result_dict, cache_hit, duration = value
+                    if not cache_hit:
+                        timings_writer.writerow(list(exp_param_dict.values()) + [duration])
+                        timings_file.flush()
+                    if manifest is not None:
+                        manifest.set_done(exp_id)
+                    if cache is not None and backend == "process":
+                        # The workers have their own copy of the cache, so count hits and misses here
+                        if cache_hit:
+                            cache.hits += 1
+                        else:
+                            cache.misses += 1
+                    if not result_csv_filename:
+                        continue
+                    if not result_dict:
+                        multiple_print(sweep_dir, "WARNING: Experiment %d - can't write results to CSV, received 'None' from experiment_func()."%exp_id)
+                        continue
+                    # Only on first result received, write the CSV header, if it's a new file (a sweep extended
+                    # with stable_ids appends to the same CSV)
+                    if result_names is None:
+                        result_names = list(result_dict.keys())
+                        csv_file = csv_open_append(csv_path, ["exp_id"] + list(exp_param_dict.keys()) + result_names
+                                                   + status_columns)
+                        csv_writer = csv.writer(csv_file,quoting=csv.QUOTE_NONNUMERIC)
+                    # Write the result row
+                    csv_row = [exp_id] + list(exp_param_dict.values())  # Write exp_id and current param values
+                    csv_row += list(result_dict.values())  # Write returned data
+                    csv_row += ["ok", ""] if status_columns else []
+                    csv_writer.writerow(csv_row)
+
+                # Rows of failed experiments, with empty results
+                if failed_rows and result_names is not None:
+                    for row in failed_rows:
+                        csv_writer.writerow(row[:-2] + [""]*len(result_names or []) + row[-2:])
+                    failed_rows = []
+                if csv_file is not None:
+                    csv_file.flush()    # So that the CSV is readable during the sweep
+
+        # If no experiment succeeded, the CSV only has the parameters and the status
+        if failed_rows:
+            csv_file = csv_open_append(csv_path, ["exp_id"] + list(param_dict.keys()) + status_columns)
+            csv_writer = csv.writer(csv_file,quoting=csv.QUOTE_NONNUMERIC)
+            for row in failed_rows:
+                csv_writer.writerow(row)
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+        timings_file.close()
+
+    if num_failed:
+        multiple_print(sweep_dir, "WARNING: %d experiments failed." % num_failed)
+    if manifest is not None:
+        write_dir_index(sweep_dir, param_dict, dir_n_exp, start_index, layout, manifest)
+
+    # Write the outputs of all experiments in order, by concatenating their log files
+    for index in sorted(indices):
+        exp_id, exp_param_dict = start_index + index, get_exp_dict(param_dict, index)
+        if manifest is not None:
+            exp_dir_name = manifest.get_entry(exp_param_dict)["dir"]
+        else:
+            exp_dir_name = build_dir_name(num_exp, exp_id, exp_param_dict, layout)
+        exp_log = get_exp_log_path(os.path.join(sweep_dir, exp_dir_name))
+        if not os.path.exists(exp_log):
+            continue    # Restored from a cache entry that has no log
+        multiple_copy(sweep_dir, exp_log, stdout=False, f_output=False, f_output_ordered=True)
+    multiple_print(sweep_dir, "Total time of all experiments: %g"%(time.time()-t0))
+    if cache is not None:
+        multiple_print(sweep_dir, cache.stats_str())
+        cache.evict()
+    if dedup is not None:
+        multiple_print(sweep_dir, dedup.stats_str())
+
+
+# State of a worker process of parameter_sweep_parallel(), set once when the worker starts
+_worker_state = {}
+
+
+# - dir_n_exp: number of experiments used to set the number of digits of the ids in the folder names
+# - dir_layout: layout of the experiment folders (see parse_dir_layout())
+def _worker_init(experiment_func, param_dict, sweep_dir, dir_n_exp, cache=None, worker_setup=None, dir_layout=None,
+                 dedup=None):
+    _worker_state["experiment_func"] = experiment_func
+    _worker_state["cache"] = cache
+    _worker_state["dedup"] = dedup
+    _worker_state["param_dict"] = param_dict
+    _worker_state["sweep_dir"] = sweep_dir
+    _worker_state["dir_n_exp"] = dir_n_exp
+    _worker_state["dir_layout"] = dir_layout
+    # Extra arguments of experiment_func
+    _worker_state["setup_args"] = (worker_setup(),) if worker_setup is not None else ()
+
+
+# Run one experiment in a worker process of parameter_sweep_parallel()
+# - task: (exp_id, index of the parameter combination in the sweep)
+# Returns (exp_id, param_dict, result_dict, whether it was in the cache, duration)
+def _worker_run_experiment(task):
+    exp_id, index = task
+    sweep_dir = _worker_state["sweep_dir"]
+    current_dict = get_exp_dict(_worker_state["param_dict"], index)
+    # Create a folder for that experiment
+    exp_dir = os.path.join(sweep_dir, build_dir_name(_worker_state["dir_n_exp"], exp_id, current_dict,
+                                                      _worker_state["dir_layout"]))
+    os.makedirs(exp_dir, exist_ok=True)
+
+    # If the experiment is in the cache, its files (including its log file) are restored in its folder
+    cache = _worker_state["cache"]
+    if cache is not None:
+        cache_hit, result_dict = cache.get(_worker_state["experiment_func"], current_dict, exp_dir)
+        if cache_hit:
+            print("\nExperiment %d: restored from the cache\n"%exp_id)
+            result_dict = save_array_results(result_dict, sweep_dir, exp_dir)
+            if _worker_state["dedup"] is not None:
+                _worker_state["dedup"].dedup(exp_dir)
+            return exp_id, current_dict, result_dict, True, 0.0
+
+    print("\nExperiment %d: START\n"%exp_id)    # Indicates when each experiment starts
+    t0 = time.time()
+    # Redirect stdout and stderr to the log file of the experiment, so that the output
+    # is written to disk as it's produced, instead of being held in memory.
+    exp_log = get_exp_log_path(exp_dir)
+    with open(exp_log, mode='w') as f_log, redirect_output(f_log):
 
-        print("\nExperiment %d: START\n"%exp_id)    # Indicates when each experiment starts
-        # Redirect stdout and stderr in buffer variable
-        with contextlib.redirect_stdout(io.StringIO()) as buff_out, contextlib.redirect_stderr(sys.stdout):
+        # Run the experiment
+        result_dict = _worker_state["experiment_func"](exp_id, current_dict, exp_dir, *_worker_state["setup_args"])
+    duration = time.time()-t0
 
-            # Run the experiment
-            result_dict = experiment_func(exp_id, current_dict, exp_dir)
-            
-            # Get stdout
-            exp_stdout = buff_out.getvalue()
+    # Experiments are finished when their output is printed
+    multiple_copy(sweep_dir, exp_log, stdout=True, f_output=True, f_output_ordered=False)
 
-        # Experiments are finished when their output is printed
-        multiple_print(exp_stdout,stdout=True,f_output=True,f_output_ordered=False)
+    # Array results are saved here, so that they're not sent back to the main process
+    result_dict = save_array_results(result_dict, sweep_dir, exp_dir)
 
-        # Send to queue to write results
-        if result_csv_filename:
-            if result_dict:
-                result_queue.put((exp_id, current_dict, result_dict))
-            else:
-                multiple_print("WARNING: Experiment %d - can't write results to CSV, received 'None' from experiment_func()."%exp_id)
+    if cache is not None:
+        cache.put(_worker_state["experiment_func"], current_dict, exp_dir, result_dict)
+    if _worker_state["dedup"] is not None:
+        _worker_state["dedup"].dedup(exp_dir)
+    return exp_id, current_dict, result_dict, False, duration
 
-        return result_dict, exp_stdout
 
-    # Result writing listener
-    def write_results_to_csv(result_queue):
+# Function to print to file
+def print_to_file(file,print_str):
+    with open(file, mode='a+') as f:
+        f.write(print_str+"\n")
 
-        write_header = True
-        # Be careful, i doesn't represent the exp_id, they usually don't terminate in order.
-        # It's just because we know we should receive a total of `num_exp` results.
-        for i in range(num_exp):
-            exp_id, exp_param_dict, result_dict = result_queue.get()
 
-            # Save additional results by writing them to the CSV
-            with open(os.path.join(sweep_dir, result_csv_filename), mode='a') as csv_file:
-                csv_writer = csv.writer(csv_file,quoting=csv.QUOTE_NONNUMERIC)
-                # Only on first call received, write the CSV header
-                if write_header:
-                    csv_writer.writerow(["exp_id"] + list(exp_param_dict.keys()) + list(result_dict.keys()))
-                    write_header = False
-                # Write the result row
-                csv_row = [exp_id] + list(exp_param_dict.values())  # Write exp_id and current param values
-                csv_row += list(result_dict.values())  # Write returned data
-                csv_writer.writerow(csv_row)
-
-    # Must use Manager queue here, or will not work
-    manager = pathos_multiprocess.Manager()
-    queue = manager.Queue()
+# Function to print to stdout and to the output files of the sweep
+def multiple_print(sweep_dir,print_str,stdout=True,f_output=True,f_output_ordered=True):
+    if stdout: print(print_str)
+    if f_output: print_to_file(os.path.join(sweep_dir,"output.txt"),print_str)
+    if f_output_ordered: print_to_file(os.path.join(sweep_dir,"output-ordered.txt"),print_str)
 
-    # Run experiments
-    t0 = time.time()
-    with mp.Pool(max_workers) as pool:
-        # Put listener to work first
-        watcher = pool.apply_async(write_results_to_csv, (queue,))
-        # Spawn workers
-        res = pool.starmap(worker_run_experiment, zip(range(start_index,num_exp+start_index), param_dict_list, [queue]*num_exp))
-    
-    # Print outputs
-    multiple_print("".join([r[1] for r in res]),stdout=False,f_output=False,f_output_ordered=True)
-    multiple_print("Total time of all experiments: %g"%(time.time()-t0))
 
+# Same as multiple_print(), but for the content of a file, which is copied by chunks
+def multiple_copy(sweep_dir,file,stdout=True,f_output=True,f_output_ordered=True):
+    for enabled, dst in [(stdout, None), (f_output, "output.txt"), (f_output_ordered, "output-ordered.txt")]:
+        if not enabled: continue
+        with open(file) as f_src:
+            if dst is None:
+                shutil.copyfileobj(f_src, sys.stdout)
+                sys.stdout.flush()
+            else:
+                with open(os.path.join(sweep_dir, dst), mode='a+') as f_dst:
+                    shutil.copyfileobj(f_src, f_dst)
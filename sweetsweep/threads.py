@@ -0,0 +1,133 @@
+# Control of the threads used by the workers of parameter_sweep_parallel().
+#
+# NumPy/SciPy call BLAS and OpenMP libraries that start one thread per core by default. With one such thread pool
+# in each of the `max_workers` worker processes, a sweep on a 64-core node runs thousands of threads fighting over
+# the cores, which can be slower than running the experiments one by one. Instead, each worker is limited to
+# `threads_per_worker` threads, so that workers x threads matches the number of cores, and workers can be pinned
+# to disjoint sets of cores.
+#
+# The BLAS/OpenMP libraries only read their environment variables (OMP_NUM_THREADS, ...) when they're loaded, and
+# `import sweetsweep` already loads NumPy. Workers started with the 'fork' method (the default on Linux) inherit the
+# libraries loaded by the main process, so for them, and for the threads of backend="thread", the limit is applied
+# with threadpoolctl (pip install sweetsweep[threads]). Without it, the limit has no effect and a warning is printed.
+# The environment variables are still set, for the libraries loaded later and the processes started by the
+# experiments, and they're enough for workers started with the 'spawn' or 'forkserver' methods.
+
+import os
+import contextlib
+import multiprocessing as mp
+
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+# threadpoolctl limiter of the current process, kept so that the limit stays active
+_thread_limiter = None
+
+
+# Cores that the current process can run on
+def get_available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+# Choose the number of workers and of threads per worker from the number of cores, for `num_exp` experiments.
+# Arguments that are set are kept. By default, there is one worker per core, because independent experiments
+# scale better with processes than with threads. When there are fewer experiments than cores, the remaining cores
+# are given to the threads of the workers.
+def choose_workers_threads(num_exp, max_workers=None, threads_per_worker=None):
+    num_cpus = len(get_available_cpus())
+    if max_workers is None:
+        max_workers = num_cpus // threads_per_worker if threads_per_worker else num_cpus
+        max_workers = max(1, min(max_workers, num_exp))
+    if threads_per_worker is None:
+        threads_per_worker = max(1, num_cpus // max_workers)
+    return max_workers, threads_per_worker
+
+
+# Disjoint sets of `threads_per_worker` cores for each worker. If there are not enough cores, sets wrap around.
+def get_core_sets(num_workers, threads_per_worker):
+    cpus = get_available_cpus()
+    return [[cpus[(w*threads_per_worker + t) % len(cpus)] for t in range(threads_per_worker)]
+            for w in range(num_workers)]
+
+
+def has_threadpoolctl():
+    try:
+        import threadpoolctl
+    except ImportError:
+        return False
+    return True
+
+
+# Warning to print if the limit of `num_threads` threads can't be applied to the workers of the given backend
+# ("process" or "thread"), see the top of this file. Returns None if it can.
+def get_thread_limits_warning(num_threads, backend="process"):
+    if not num_threads or has_threadpoolctl():
+        return None
+    if backend == "process" and mp.get_start_method() != "fork":
+        return None
+    return ("WARNING: The BLAS/OpenMP libraries of NumPy are already loaded, so they can't be limited to %d threads "
+            "per worker without threadpoolctl. Install it with 'pip install sweetsweep[threads]'." % num_threads)
+
+
+# Set the environment variables of the thread limits in the current process, and restore them afterwards.
+# Processes started in the meantime (e.g. the workers) inherit them. Does nothing if num_threads is 0 or None.
+@contextlib.contextmanager
+def thread_limits_env(num_threads):
+    if not num_threads:
+        yield
+        return
+    previous = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    os.environ.update({var: str(num_threads) for var in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for var, value in previous.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+# Limit the number of threads of the BLAS/OpenMP libraries in the current process
+def limit_threads(num_threads):
+    global _thread_limiter
+    os.environ.update({var: str(num_threads) for var in THREAD_ENV_VARS})
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    _thread_limiter = threadpool_limits(limits=num_threads)
+
+
+# Limit the number of threads of the BLAS/OpenMP libraries already loaded in the current process, and restore it
+# afterwards. Does nothing if num_threads is 0 or None, or if threadpoolctl isn't installed.
+@contextlib.contextmanager
+def thread_limits(num_threads):
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        threadpool_limits = None
+    if not num_threads or threadpool_limits is None:
+        yield
+        return
+    with threadpool_limits(limits=num_threads):
+        yield
+
+
+# Pin the current process to the given cores (Linux only)
+def pin_to_cores(cores):
+    if not hasattr(os, "sched_setaffinity"):
+        print("WARNING: Pinning processes to cores isn't supported on this platform.")
+        return
+    os.sched_setaffinity(0, cores)
+
+
+# Configure the threads of worker `slot` of parameter_sweep_parallel(). Called when it starts.
+# - core_sets: list of the cores of each worker, or None to not pin workers.
+def configure_worker_threads(slot, threads_per_worker, core_sets=None):
+    if core_sets is not None:
+        pin_to_cores(core_sets[slot % len(core_sets)])
+    if threads_per_worker:
+        limit_threads(threads_per_worker)
@@ -25,8 +25,10 @@ from matplotlib.figure import Figure
 
 if __name__ == "__main__":
     from common import *
+    from pack import load_packed_sweep
 else:
     from .common import *
+    from .pack import load_packed_sweep
 
 # TODO
 #  - Prevent users from loading sweep file (and result file) if mainfolder is not valid (grey/hide widgets out?)
@@ -208,6 +210,9 @@ class Ui(QtWidgets.QMainWindow):
         self.paramDict = OrderedDict()     # Holds current values of parameters to display
         self.fullParamDict = OrderedDict()     # Holds all possible values of each parameter
         self.allParamNames = []
+        self.dirLayout = None   # Layout of the experiment folders (see common.py), None if they're all in mainFolder
+        self.dirIndex = None    # Memory-mapped index of the experiment folders, if the layout has one
+        self.packedSweep = None # Archives of the experiment files, if the sweep was packed (see pack.py)
         self.paramControlType = "combobox"   # "slider" or "combobox"
         self.comboBox_noneChoice = "--None--"
         self.xaxis = self.comboBox_noneChoice
@@ -382,11 +387,14 @@ class Ui(QtWidgets.QMainWindow):
         if not os.path.isdir(path):
             self.lineEdit_mainFolder.setStyleSheet("color: red;")
             self.mainFolder = ""
+            self.packedSweep = None
             self.configFile_invalid()
             self.draw_graphics()
             return
         self.lineEdit_mainFolder.setStyleSheet("color: black;")
         self.mainFolder = path
+        # If the sweep was packed, files are read from the archives
+        self.packedSweep = load_packed_sweep(self.mainFolder)
         # Check if there is a config file
         if os.path.isfile(os.path.join(self.mainFolder,self.defaultConfigFile)):
             if os.path.join(self.mainFolder,self.defaultConfigFile) == self.lineEdit_configFile.text():
@@ -472,6 +480,8 @@ class Ui(QtWidgets.QMainWindow):
         self.fullParamDict = {}
         self.paramDict = {}
         self.allParamNames = []
+        self.dirLayout = None
+        self.dirIndex = None
         self.paramControlWidgetList.clear()
         self.allResultNames = []
         self.resultArray = None
@@ -564,6 +574,13 @@ class Ui(QtWidgets.QMainWindow):
         if "viewer_notesFile" in self.fullParamDict:
             self.notesFile = os.path.join(self.mainFolder,self.fullParamDict["viewer_notesFile"])
             del self.fullParamDict["viewer_notesFile"]
+        if "viewer_dirLayout" in self.fullParamDict:
+            self.dirLayout = self.fullParamDict["viewer_dirLayout"]
+            del self.fullParamDict["viewer_dirLayout"]
+            if has_dir_index(self.dirLayout):
+                self.dirIndex = load_dir_index(self.mainFolder)
+                if self.dirIndex is None:
+                    self.print("Error: the experiment folders need the index '%s', which wasn't found" % DIR_INDEX_FILENAME)
 
         # Get the notes file
         self.load_notes_file()
@@ -802,12 +819,17 @@ class Ui(QtWidgets.QMainWindow):
         # TODO: In the long term, I should be able to handle partial results.
         # So I should keep the row and just replace np.genfromtxt with pd.read_csv...
         csv_all = [row for row in csv_all if len(row)==len(header)]
-        # Rewrite CSV file in a string
-        imputed_csv_file = "\n".join([",".join(row) for row in [header] + csv_all])
+        # Rewrite CSV file in a string. np.genfromtxt() doesn't handle quoted fields, so commas and line breaks in
+        # text fields (e.g. the 'error' column of sweeps run with on_error="continue") are replaced.
+        imputed_csv_file = "\n".join([",".join(field.replace(",", ";").replace("\n", " ") for field in row)
+                                      for row in [header] + csv_all])
         try:
             self.resultArray = np.genfromtxt(io.StringIO(imputed_csv_file), delimiter=',', names=True, dtype=None, encoding=None, deletechars="")
             # self.resultArray = np.genfromtxt(csv_path, delimiter=',', names=True, dtype=None, encoding=None)
             self.allResultNames = [name for name in self.resultArray.dtype.names if name not in (self.allParamNames + ["exp_id"])]
+            # Array results are paths to '.npy' files, which can't be displayed
+            self.allResultNames = [name for name in self.allResultNames if not (self.resultArray[name].dtype.kind == "U"
+                                   and np.all(np.char.endswith(self.resultArray[name], ".npy")))]
         except Exception as e:
             self.print("Exception:", e)
             self.print("Unable to read result file '%s'." % self.resultsCSV)
@@ -815,6 +837,27 @@ class Ui(QtWidgets.QMainWindow):
         # Filter resultArray from param values that are not in the parameter list (for custom config files which skip some parameter values)
         self.resultArray = self.resultArray[np.logical_and.reduce([np.isin(self.resultArray[p],self.fullParamDict[p]) for p in self.allParamNames])]
 
+    # Files of the experiments are looked up in the archives first if the sweep was packed, then on disk
+    def file_exists(self, path):
+        if self.packedSweep is not None and self.packedSweep.exists(os.path.relpath(path, self.mainFolder)):
+            return True
+        return os.path.isfile(path)
+
+    def glob_files(self, pattern):
+        files = glob.glob(pattern)
+        if self.packedSweep is not None:
+            files += [os.path.join(self.mainFolder, f)
+                      for f in self.packedSweep.glob(os.path.relpath(pattern, self.mainFolder))]
+        return sorted(set(files))
+
+    def load_image(self, path):
+        relPath = os.path.relpath(path, self.mainFolder)
+        if self.packedSweep is not None and self.packedSweep.exists(relPath):
+            pixmap = QPixmap()
+            pixmap.loadFromData(self.packedSweep.read(relPath))
+            return pixmap
+        return QPixmap(path)
+
     def draw_graphics(self, reload_images=True, reset_view=True):
         """
         Draw the scene
@@ -855,7 +898,15 @@ class Ui(QtWidgets.QMainWindow):
                 self.progressBar.repaint()
 
             t_start = time.time()
-            alldirs = [os.path.basename(f) for f in os.scandir(self.mainFolder) if f.is_dir()]
+            # Only list the subfolders that can contain the displayed experiments, if the layout allows it.
+            # With an index, nothing needs to be listed.
+            alldirs = []
+            if self.dirIndex is None:
+                alldirs = list_exp_dirs(self.mainFolder, self.dirLayout, self.fullParamDict, self.paramDict)
+                # The folders of packed experiments may have been removed
+                if self.packedSweep is not None:
+                    depth = 1 if self.dirLayout is None or self.dirLayout["type"] == "flat" else 2
+                    alldirs = sorted(set(alldirs).union(self.packedSweep.list_dirs(depth)))
             t_end = time.time()
             self.prevTimeScandir = t_end-t_start
             self.progressBar.hide()  # Hide even if it wasn't shown
@@ -871,12 +922,19 @@ class Ui(QtWidgets.QMainWindow):
             for i, ival in enumerate(yrange):
                 for j, jval in enumerate(xrange):
                     # Find the correct folder
-                    dirs = used_dirs.copy()
-                    if ival is not None: dirs = [d for d in dirs if re.search("_"+re.escape(self.yaxis+val2str(ival))+"(_|$)", d)]
-                    if jval is not None: dirs = [d for d in dirs if re.search("_"+re.escape(self.xaxis+val2str(jval))+"(_|$)", d)]
-                    if len(dirs) == 0: self.print("Error: no folder matches the set of parameters"); continue
-                    if len(dirs) > 1: self.print("Error: multiple folders match the set of parameters:", *dirs); continue
-                    currentDir = dirs[0]
+                    if self.dirIndex is not None:
+                        cellDict = {param: value[0] for param, value in self.paramDict.items()}
+                        if ival is not None: cellDict[self.yaxis] = ival
+                        if jval is not None: cellDict[self.xaxis] = jval
+                        currentDir = lookup_dir_index(self.dirIndex, self.fullParamDict, cellDict)
+                        if not currentDir: self.print("Error: no folder matches the set of parameters"); continue
+                    else:
+                        dirs = used_dirs.copy()
+                        if ival is not None: dirs = [d for d in dirs if re.search("_"+re.escape(self.yaxis+val2str(ival))+"(_|$)", d)]
+                        if jval is not None: dirs = [d for d in dirs if re.search("_"+re.escape(self.xaxis+val2str(jval))+"(_|$)", d)]
+                        if len(dirs) == 0: self.print("Error: no folder matches the set of parameters"); continue
+                        if len(dirs) > 1: self.print("Error: multiple folders match the set of parameters:", *dirs); continue
+                        currentDir = dirs[0]
 
                     # Check if file exists
                     # Check if it's a glob pattern
@@ -894,7 +952,7 @@ class Ui(QtWidgets.QMainWindow):
                             self.print("Error: The content of the brackets in the file pattern must be a number.")
                             return
                         fullPattern = os.path.join(self.mainFolder, currentDir, self.filePattern[:bracketMatch.start()] + self.filePattern[bracketMatch.end():])
-                        files = sorted(glob.glob(fullPattern))
+                        files = self.glob_files(fullPattern)
                         if not (-len(files) <= index < len(files)):
                             continue
                         file = files[index]
@@ -904,7 +962,7 @@ class Ui(QtWidgets.QMainWindow):
                             self.matchedPatterns[i,j] = self.matchedPatterns[i,j].replace(f, "")
                     else:
                         file = os.path.join(self.mainFolder, currentDir, self.filePattern)
-                        if not os.path.isfile(file):
+                        if not self.file_exists(file):
                             continue
                     self.currentImagePaths[i,j] = file
 
@@ -1070,7 +1128,7 @@ class Ui(QtWidgets.QMainWindow):
             imIndex = np.argmax(self.currentImagePaths.flatten() != "")
             i,j = np.unravel_index(imIndex,self.currentImagePaths.shape)
             if reload_images:
-                self.currentImages[i,j] = QPixmap(self.currentImagePaths[i,j])
+                self.currentImages[i,j] = self.load_image(self.currentImagePaths[i,j])
             cropRect = self.getImageCroppingRect(self.currentImages[i,j])
             pc = self.currentImages[i,j].copy(cropRect)
             # Get image dimension after cropping
@@ -1116,7 +1174,7 @@ class Ui(QtWidgets.QMainWindow):
                     if self.currentImagePaths[i,j]:
                         # Load the image
                         if reload_images:
-                            self.currentImages[i,j] = QPixmap(self.currentImagePaths[i,j])
+                            self.currentImages[i,j] = self.load_image(self.currentImagePaths[i,j])
                             # print("Loading image",i,j)
                         # This way of drawing assumes all images have the size of the first image
                         # Crop the image
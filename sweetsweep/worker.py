@@ -0,0 +1,317 @@
+# Distributed sweeps: any number of workers, on any number of nodes, take experiments from the same sweep.
+#
+# With static partitioning (only_exp_id, shards), a node that gets the long experiments finishes long after the
+# others. Here, each worker claims the next experiment that nobody has claimed yet, so all nodes stay busy until the
+# end of the sweep. There is no central service: workers coordinate through lease files in the sweep folder, which
+# must be on a filesystem shared by all nodes.
+#
+# 1. Prepare the sweep once, from the script that defines it:
+#       prepare_distributed_sweep(param_dict, my_experiment, sweep_dir, result_csv_filename="results.csv")
+#    The experiment function must be importable by the workers: a function defined at the top level of a module,
+#    or of the script itself (then, put the code that runs the sweep under `if __name__ == "__main__":`).
+# 2. Start any number of workers, on any node, at any time:
+#       python -m sweetsweep worker sweep_dir
+#
+# Each experiment has a lease file '.leases/<exp_id>.lease', created atomically (O_EXCL) by the worker that claims it.
+# The worker touches it regularly while the experiment runs. If a worker crashes, its lease isn't touched anymore,
+# and after `lease_time` seconds, another worker reclaims the experiment. When an experiment is done, its lease is
+# renamed to '.leases/<exp_id>.done'.
+# An experiment that fails (after its retries) is also marked as done, with its status and error in the '.done' file,
+# so that the other workers don't run it again. Each claim of an experiment is counted in '.leases/<exp_id>.attempts',
+# so that an experiment that kills its workers (e.g. by running out of memory) is marked as failed after `retries`+1
+# claims, instead of taking down all workers one after the other.
+# Note that expiry relies on the clocks of the nodes being synchronized (to much less than `lease_time`).
+
+import os
+import sys
+import csv
+import json
+import time
+import socket
+import threading
+import traceback
+import importlib
+import importlib.util
+
+from .sweep import get_num_exp, get_exp_dict, write_dir_index, _worker_init, _worker_run_experiment, multiple_print, \
+    csv_open_append, run_with_retries, traceback_last_line, ExperimentTimeout
+from .common import parse_dir_layout, write_dir_layout
+
+WORKER_FILENAME = "worker.json"
+LEASE_DIRNAME = ".leases"
+
+
+# Get the "module:function" string of a function, to import it in the workers
+def get_function_spec(func):
+    module = func.__module__
+    if module == "__main__":
+        # Defined in the script that was run: import it from its file
+        module = os.path.abspath(sys.modules["__main__"].__file__)
+    return "%s:%s" % (module, func.__qualname__)
+
+
+# Import a function from a "module:function" or "path/to/file.py:function" string
+def load_function(spec):
+    module_name, func_name = spec.rsplit(":", 1)
+    if module_name.endswith(".py"):
+        module_spec = importlib.util.spec_from_file_location("sweetsweep_experiment", module_name)
+        module = importlib.util.module_from_spec(module_spec)
+        sys.path.insert(0, os.path.dirname(module_name))
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    func = module
+    for name in func_name.split("."):
+        func = getattr(func, name)
+    return func
+
+
+# Save what the workers need to run the sweep in 'worker.json' in the sweep folder
+# - experiment_func: the experiment function, or its "module:function" string
+# - lease_time: number of seconds after which an experiment claimed by a worker that stopped responding is reclaimed
+# - timeout, retries, retry_backoff, on_error: see parameter_sweep(). A failed experiment is marked as done, so that
+#   it's not run again by other workers. With on_error="raise", the worker that ran it stops with its exception,
+#   and the other workers go on. An experiment is also failed when `retries`+1 workers stopped while running it.
+# The other arguments are the same as parameter_sweep().
+def prepare_distributed_sweep(param_dict, experiment_func, sweep_dir, result_csv_filename="", start_index=0,
+                              lease_time=600, dir_layout=None, dir_names="params", timeout=None, retries=0,
+                              retry_backoff=1.0, on_error="raise"):
+    os.makedirs(os.path.join(sweep_dir, LEASE_DIRNAME), exist_ok=True)
+    spec = experiment_func if isinstance(experiment_func, str) else get_function_spec(experiment_func)
+    layout = parse_dir_layout(dir_layout, param_dict, start_index, dir_names)
+    write_dir_layout(sweep_dir, param_dict, layout)
+    write_dir_index(sweep_dir, param_dict, get_num_exp(param_dict), start_index, layout)
+    config = {"param_dict": param_dict, "experiment": spec, "result_csv_filename": result_csv_filename,
+              "start_index": start_index, "lease_time": lease_time, "dir_layout": layout, "timeout": timeout,
+              "retries": retries, "retry_backoff": retry_backoff, "on_error": on_error}
+    with open(os.path.join(sweep_dir, WORKER_FILENAME), "w") as f:
+        json.dump(config, f, indent=1)
+    print("Start workers with: python -m sweetsweep worker %s" % sweep_dir)
+
+
+# Lease of one experiment, kept alive by a thread while the experiment runs
+class Lease(object):
+
+    def __init__(self, lease_dir, exp_id, token, lease_time):
+        self.path = os.path.join(lease_dir, "%d.lease" % exp_id)
+        self.done_path = os.path.join(lease_dir, "%d.done" % exp_id)
+        self.attempts_path = os.path.join(lease_dir, "%d.attempts" % exp_id)
+        self.token = token
+        self.lease_time = lease_time
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # Try to claim the experiment. Returns False if it's done, or claimed by a live worker.
+    def acquire(self):
+        if os.path.exists(self.done_path):
+            return False
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self.expired():
+                return False
+            # Only one of the workers that see the expired lease manages to rename it
+            try:
+                os.rename(self.path, "%s.expired-%s" % (self.path, self.token))
+            except FileNotFoundError:
+                return False
+            os.remove("%s.expired-%s" % (self.path, self.token))
+            return self.acquire()
+        with os.fdopen(fd, "w") as f:
+            f.write(self.token)
+        with open(self.attempts_path, "a") as f:
+            f.write(self.token + "\n")
+        self.thread = threading.Thread(target=self.heartbeat, daemon=True)
+        self.thread.start()
+        return True
+
+    def expired(self):
+        try:
+            return time.time() - os.path.getmtime(self.path) > self.lease_time
+        except FileNotFoundError:
+            return False
+
+    def heartbeat(self):
+        while not self.stop_event.wait(self.lease_time/4):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+    # Whether the lease still belongs to this worker (it may have been reclaimed if we were too slow)
+    def owned(self):
+        try:
+            with open(self.path) as f:
+                return f.read() == self.token
+        except FileNotFoundError:
+            return False
+
+    # Number of times the experiment was claimed, including by workers that stopped while running it
+    def num_attempts(self):
+        try:
+            with open(self.attempts_path) as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    # Stop the heartbeat, and mark the experiment as done if it still belongs to this worker.
+    # - failure: for a failed experiment, a dictionary with its 'status' and 'error', written in the '.done' file
+    def release(self, done, failure=None):
+        self.stop_event.set()
+        self.thread.join()
+        if not self.owned():
+            return False
+        if done:
+            if failure is not None:
+                with open(self.path, "w") as f:
+                    json.dump(failure, f)
+            os.rename(self.path, self.done_path)
+            try:
+                os.remove(self.attempts_path)
+            except FileNotFoundError:
+                pass
+        else:
+            os.remove(self.path)
+        return True
+
+
+# Append a row to the CSV shared by all workers. The file is created with its header atomically (see
+# csv_open_append()), so that no worker can append a row before the header.
+def csv_append_row(csv_path, header, row):
+    with csv_open_append(csv_path, header) as f:
+        csv.writer(f, quoting=csv.QUOTE_NONNUMERIC).writerow(row)
+
+
+# Names of the results in the header of the CSV shared by all workers, or None if it doesn't exist yet
+def csv_get_result_names(csv_path, num_params, status_columns):
+    if not os.path.exists(csv_path):
+        return None
+    with open(csv_path, newline='') as f:
+        header = next(csv.reader(f))
+    return header[1+num_params:len(header)-len(status_columns)]
+
+
+# Run experiments of a distributed sweep until all of them are done (by this worker or by others).
+# - experiment: "module:function" string of the experiment function, to override the one in 'worker.json'
+# - max_exps: maximum number of experiments to run with this worker
+# Returns the number of experiments run by this worker.
+def run_worker(sweep_dir, experiment=None, max_exps=None):
+    config_path = os.path.join(sweep_dir, WORKER_FILENAME)
+    if not os.path.exists(config_path):
+        print("ERROR: '%s' doesn't exist. Call prepare_distributed_sweep() first." % config_path)
+        exit(-1)
+    with open(config_path) as f:
+        config = json.load(f)
+    param_dict = config["param_dict"]
+    start_index = config["start_index"]
+    lease_time = config["lease_time"]
+    csv_path = os.path.join(sweep_dir, config["result_csv_filename"]) if config["result_csv_filename"] else None
+    experiment_func = load_function(experiment if experiment else config["experiment"])
+    lease_dir = os.path.join(sweep_dir, LEASE_DIRNAME)
+    os.makedirs(lease_dir, exist_ok=True)
+    token = "%s-%d-%d" % (socket.gethostname(), os.getpid(), time.time_ns())
+
+    timeout = config.get("timeout")
+    retries = config.get("retries", 0)
+    retry_backoff = config.get("retry_backoff", 1.0)
+    on_error = config.get("on_error", "raise")
+    # With on_error="continue", the CSV has 2 more columns: 'status' and 'error' (see parameter_sweep())
+    status_columns = ["status", "error"] if on_error == "continue" else []
+
+    num_exp = get_num_exp(param_dict)
+    _worker_init(experiment_func, param_dict, sweep_dir, num_exp, dir_layout=config.get("dir_layout"))
+
+    # The rows of failed experiments have empty results, so they're kept until the names of the results are known
+    result_names = None
+    failed_rows = []
+
+    def write_failed_rows():
+        nonlocal failed_rows
+        names = result_names if result_names is not None else \
+            csv_get_result_names(csv_path, len(param_dict), status_columns)
+        if names is None:
+            return
+        for row in failed_rows:
+            csv_append_row(csv_path, ["exp_id"] + list(param_dict.keys()) + names + status_columns,
+                           row[:-2] + [""]*len(names) + row[-2:])
+        failed_rows = []
+
+    num_run = 0
+    num_failed = 0
+    cursor = 0  # Start looking for an available experiment after the last one claimed
+    t0 = time.time()
+    while max_exps is None or num_run < max_exps:
+        # Go through all experiments, and claim the first one available. Experiments claimed by other workers
+        # may be reclaimed later if their lease expires, so go through them again until all are done.
+        claimed = None
+        num_pending = 0
+        for k in range(num_exp):
+            index = (cursor + k) % num_exp
+            lease = Lease(lease_dir, start_index+index, token, lease_time)
+            if os.path.exists(lease.done_path):
+                continue
+            num_pending += 1
+            if lease.acquire():
+                claimed = (index, lease)
+                break
+        if claimed is None:
+            if num_pending == 0:
+                break
+            time.sleep(min(lease_time/4, 10))   # Wait for the other workers to finish, or for a lease to expire
+            continue
+
+        index, lease = claimed
+        cursor = index + 1
+        exp_id = start_index + index
+        if lease.num_attempts() > retries+1:
+            # The workers that claimed it before stopped while running it
+            status, value = "failed", None
+            error = "The %d workers that ran the experiment stopped" % (lease.num_attempts()-1)
+            multiple_print(sweep_dir, "ERROR: Experiment %d - %s." % (exp_id, error), f_output_ordered=False)
+        else:
+            try:
+                status, value, error = run_with_retries(lambda exp_id: _worker_run_experiment((exp_id, index)),
+                                                        (exp_id,), timeout, retries, retry_backoff, on_error)
+            except Exception as e:
+                # Marked as failed, so that the other workers don't run it again
+                lease.release(done=True, failure={"status": "timeout" if isinstance(e, ExperimentTimeout) else "failed",
+                                                  "error": traceback_last_line(traceback.format_exc())})
+                raise
+            except BaseException:
+                lease.release(done=False)
+                raise
+        if status != "ok" and on_error != "continue":
+            lease.release(done=True, failure={"status": status, "error": error})
+            print("ERROR: Experiment %d - %s" % (exp_id, error))
+            exit(-1)
+        if not lease.release(done=True, failure=None if status == "ok" else {"status": status, "error": error}):
+            multiple_print(sweep_dir, "WARNING: Experiment %d was reclaimed by another worker, its results are "
+                                      "discarded." % exp_id, f_output_ordered=False)
+            continue
+        num_run += 1
+        if status != "ok":
+            num_failed += 1
+            if csv_path is not None:
+                failed_rows.append([exp_id] + list(get_exp_dict(param_dict, index).values()) + [status, error])
+                write_failed_rows()
+            continue
+        exp_id, current_dict, result_dict, _, _ = value
+        if csv_path is not None and result_dict:
+            if result_names is None:
+                result_names = list(result_dict.keys())
+            csv_append_row(csv_path, ["exp_id"] + list(current_dict.keys()) + result_names + status_columns,
+                           [exp_id] + list(current_dict.values()) + list(result_dict.values())
+                           + (["ok", ""] if status_columns else []))
+            if failed_rows:
+                write_failed_rows()
+
+    if failed_rows:
+        write_failed_rows()
+        if failed_rows:
+            # No experiment succeeded yet: the CSV only has the parameters and the status
+            result_names = []
+            write_failed_rows()
+    if num_failed:
+        print("WARNING: %d experiments failed." % num_failed)
+    print("Worker %s: %d experiments run in %g seconds." % (token, num_run, time.time()-t0))
+    return num_run
@@ -0,0 +1,3 @@
+# test_sweep_specific_dict.py is a script to run by hand (it writes its sweep in the current folder), not a pytest
+# module: collecting it would run its sweep, and its experiment function would be taken for a test.
+collect_ignore = ["test_sweep_specific_dict.py"]
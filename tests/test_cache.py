@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+
+import sweetsweep
+from sweetsweep.cache import ResultCache
+
+
+def experiment(exp_id, param_dict, exp_dir):
+    with open(os.path.join(exp_dir, "out.txt"), "w") as f:
+        f.write(str(param_dict["a"]))
+    return {"y": int(param_dict["a"]) * 2}
+
+
+# Equal values of different types have the same key
+def test_key_of_equal_values(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cache.key(experiment, {"a": 3, "b": 0.5, "c": "x", "d": [1, 2]})
+    assert cache.key(experiment, {"a": np.int64(3), "b": np.float64(0.5), "c": np.str_("x"), "d": (1, 2)}) == key
+    assert cache.key(experiment, {"d": np.array([1, 2]), "c": "x", "b": 0.5, "a": 3}) == key
+    assert cache.key(experiment, {"a": 4, "b": 0.5, "c": "x", "d": [1, 2]}) != key
+    assert ResultCache(str(tmp_path), version="2").key(experiment, {"a": 3, "b": 0.5, "c": "x", "d": [1, 2]}) != key
+
+
+# A second sweep with NumPy values gets the results and files of the first one from the cache
+def test_cache_across_sweeps(tmp_path):
+    (tmp_path / "sweep1").mkdir()
+    (tmp_path / "sweep2").mkdir()
+    cache = ResultCache(str(tmp_path / "cache"))
+    sweetsweep.parameter_sweep({"a": [1, 2]}, experiment, str(tmp_path / "sweep1"), result_csv_filename="results.csv",
+                               cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+    cache = ResultCache(str(tmp_path / "cache"))
+    sweetsweep.parameter_sweep({"a": list(np.array([2, 3]))}, experiment, str(tmp_path / "sweep2"),
+                               result_csv_filename="results.csv", cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    with open(str(tmp_path / "sweep2" / "exp_0__a2" / "out.txt")) as f:
+        assert f.read() == "2"
@@ -0,0 +1,28 @@
+import os
+import csv
+import sys
+
+import sweetsweep
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def parse_score(exp_dir):
+    with open(os.path.join(exp_dir, "score.txt")) as f:
+        return {"score": float(f.read())}
+
+
+# The first command fails: with `result_names`, the CSV still has the column of the parser
+def test_command_failure_keeps_parser_columns(tmp_path):
+    script = "import sys; a = int(sys.argv[1]); open(sys.argv[2], 'w').write(str(a*2)); sys.exit(a == 1)"
+    command = [sys.executable, "-c", script, "{a}", "{exp_dir}/score.txt"]
+    sweetsweep.parameter_sweep_command({"a": [1, 2, 3]}, command, str(tmp_path), max_processes=1,
+                                       result_csv_filename="results.csv", parser=parse_score,
+                                       result_names=["score"])
+    rows = {row["a"]: row for row in read_csv(os.path.join(str(tmp_path), "results.csv"))}
+    assert {a: (row["returncode"], row["score"]) for a, row in rows.items()} == \
+        {"1": ("1", ""), "2": ("0", "4.0"), "3": ("0", "6.0")}
+    assert all(None not in row for row in rows.values())
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import sweetsweep
+from sweetsweep import DedupStore
+
+
+# 'config.txt' is the same in all experiments, 'result.txt' only depends on 'a'
+def experiment(exp_id, param_dict, exp_dir):
+    with open(os.path.join(exp_dir, "config.txt"), "w") as f:
+        f.write("same config\n" * 100)
+    with open(os.path.join(exp_dir, "result.txt"), "w") as f:
+        f.write("a=%s\n" % param_dict["a"])
+    with open(os.path.join(exp_dir, "id.txt"), "w") as f:
+        f.write("%d\n" % exp_id)
+    return {"y": exp_id}
+
+
+def exp_file(sweep_dir, exp_id, name):
+    dirs = [d for d in os.listdir(sweep_dir) if d.startswith("exp_%d__" % exp_id)]
+    assert len(dirs) == 1
+    return os.path.join(sweep_dir, dirs[0], name)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_sweep_dedup(tmp_path, parallel):
+    sweep_dir = str(tmp_path)
+    store = DedupStore(os.path.join(sweep_dir, ".store"))
+    param_dict = {"a": [1, 2], "b": [1, 2, 3]}
+    if parallel:
+        sweetsweep.parameter_sweep_parallel(param_dict, experiment, sweep_dir, max_workers=2, dedup=store)
+    else:
+        sweetsweep.parameter_sweep(param_dict, experiment, sweep_dir, dedup=store)
+
+    # Identical files share the same inode, different files don't
+    config_inodes = {os.stat(exp_file(sweep_dir, i, "config.txt")).st_ino for i in range(6)}
+    assert len(config_inodes) == 1
+    assert os.stat(exp_file(sweep_dir, 0, "config.txt")).st_nlink == 7   # 6 experiments and the store
+    # exp_ids 0-2 have a=1 and 3-5 have a=2
+    result_inodes = [os.stat(exp_file(sweep_dir, i, "result.txt")).st_ino for i in range(6)]
+    assert len(set(result_inodes[:3])) == 1 and len(set(result_inodes[3:])) == 1
+    assert result_inodes[0] != result_inodes[3]
+    assert len({os.stat(exp_file(sweep_dir, i, "id.txt")).st_ino for i in range(6)}) == 6
+
+    # The contents are intact
+    for i in range(6):
+        assert read(exp_file(sweep_dir, i, "config.txt")) == "same config\n" * 100
+        assert read(exp_file(sweep_dir, i, "result.txt")) == "a=%d\n" % (1 + i // 3)
+        assert read(exp_file(sweep_dir, i, "id.txt")) == "%d\n" % i
+
+    # 1 config, 2 results and 6 ids are stored, the others are duplicates. The parallel sweep also writes an
+    # empty log file in each experiment folder.
+    num_unique, num_duplicates = (10, 14) if parallel else (9, 9)
+    assert sum(1 for entry in store.iter_entries()) == num_unique
+    assert store.stats_str().startswith("Deduplication: %d unique files, %d duplicates replaced by hardlinks"
+                                        % (num_unique, num_duplicates))
+
+
+def test_min_size_and_clean(tmp_path):
+    exp_dirs = [tmp_path / "exp_0", tmp_path / "exp_1"]
+    for exp_dir in exp_dirs:
+        exp_dir.mkdir()
+        (exp_dir / "small.txt").write_text("x")
+        (exp_dir / "large.txt").write_text("y" * 1000)
+    store = DedupStore(str(tmp_path / ".store"), min_size=100)
+    assert store.dedup(str(exp_dirs[0])) == 0
+    assert store.dedup(str(exp_dirs[1])) == 1
+    assert os.stat(str(exp_dirs[0] / "large.txt")).st_ino == os.stat(str(exp_dirs[1] / "large.txt")).st_ino
+    assert os.stat(str(exp_dirs[0] / "small.txt")).st_ino != os.stat(str(exp_dirs[1] / "small.txt")).st_ino
+    # Already deduplicated files are left as they are
+    assert store.dedup(str(exp_dirs[1])) == 0
+
+    # The stored file is only removed once no experiment uses it
+    os.remove(str(exp_dirs[0] / "large.txt"))
+    assert store.clean() == 0
+    os.remove(str(exp_dirs[1] / "large.txt"))
+    assert store.clean() == 1000
+    assert list(store.iter_entries()) == []
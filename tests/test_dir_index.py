@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import sweetsweep
+from sweetsweep.common import load_dir_index, lookup_dir_index
+from sweetsweep.sweep import iterate_param_dicts
+
+
+def experiment(exp_id, param_dict, exp_dir):
+    with open(os.path.join(exp_dir, "params.txt"), "w") as f:
+        f.write("%s %s" % (param_dict["a"], param_dict["b"]))
+    return {"y": exp_id}
+
+
+def read_params(sweep_dir, exp_dir):
+    with open(os.path.join(sweep_dir, exp_dir, "params.txt")) as f:
+        return f.read()
+
+
+# With short folder names, the index gives the folder of each combination
+@pytest.mark.parametrize("dir_names", ["id", "hash"])
+def test_dir_index(tmp_path, dir_names):
+    sweep_dir = str(tmp_path)
+    param_dict = {"a": [1, 2, 3], "b": ["x", "y"]}
+    sweetsweep.parameter_sweep(param_dict, experiment, sweep_dir, dir_names=dir_names, dir_layout="id:2")
+    dir_index = load_dir_index(sweep_dir)
+    assert len(dir_index) == 6
+    for current_dict in iterate_param_dicts(param_dict):
+        exp_dir = lookup_dir_index(dir_index, param_dict, current_dict)
+        assert read_params(sweep_dir, exp_dir) == "%s %s" % (current_dict["a"], current_dict["b"])
+
+
+# When a sweep with stable ids is extended, the index is rebuilt for the new parameter values, and keeps the folders
+# of the previous combinations
+def test_dir_index_after_extension(tmp_path):
+    sweep_dir = str(tmp_path)
+    param_dict = {"a": [1, 2], "b": ["x", "y"]}
+    sweetsweep.parameter_sweep(param_dict, experiment, sweep_dir, dir_names="id", stable_ids=True)
+    dir_index = load_dir_index(sweep_dir)
+    old_dirs = {(d["a"], d["b"]): lookup_dir_index(dir_index, param_dict, d) for d in iterate_param_dicts(param_dict)}
+    del dir_index
+
+    extended_dict = {"a": [0, 1, 2, 3], "b": ["x", "y"]}
+    sweetsweep.parameter_sweep(extended_dict, experiment, sweep_dir, dir_names="id", stable_ids=True)
+    dir_index = load_dir_index(sweep_dir)
+    assert len(dir_index) == 8
+    for current_dict in iterate_param_dicts(extended_dict):
+        exp_dir = lookup_dir_index(dir_index, extended_dict, current_dict)
+        key = (current_dict["a"], current_dict["b"])
+        if key in old_dirs:
+            assert exp_dir == old_dirs[key]
+        assert read_params(sweep_dir, exp_dir) == "%s %s" % key
+    assert len(set(lookup_dir_index(dir_index, extended_dict, d) for d in iterate_param_dicts(extended_dict))) == 8
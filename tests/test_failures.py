@@ -0,0 +1,171 @@
+import os
+import csv
+import sys
+import json
+import time
+import collections
+import functools
+import subprocess
+
+import pytest
+
+import sweetsweep
+from sweetsweep.pool import WorkerPool
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def sleep_task(task):
+    if task == 1:
+        time.sleep(60)
+    return task
+
+
+def crash_task(task):
+    if task == 2:
+        os._exit(1)
+    return task
+
+
+# Fails the first time it's called for a task, using a marker file
+def flaky_task(marker_dir, task):
+    marker = os.path.join(marker_dir, "task_%d" % task)
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        raise ValueError("first attempt of task %d" % task)
+    return task
+
+
+def pid_task(task):
+    return os.getpid()
+
+
+def test_pool_timeout():
+    with WorkerPool(2, sleep_task, timeout=1) as pool:
+        outcomes = {task: status for task, status, value, attempts in pool.imap_unordered(range(4))}
+    assert outcomes == {0: "ok", 1: "timeout", 2: "ok", 3: "ok"}
+
+
+def test_pool_crash():
+    with WorkerPool(2, crash_task) as pool:
+        outcomes = {task: status for task, status, value, attempts in pool.imap_unordered(range(6))}
+    assert outcomes == {0: "ok", 1: "ok", 2: "failed", 3: "ok", 4: "ok", 5: "ok"}
+
+
+def test_pool_retries(tmp_path):
+    with WorkerPool(2, functools.partial(flaky_task, str(tmp_path)), retries=1, retry_backoff=0.01) as pool:
+        outcomes = {task: (status, value, attempts) for task, status, value, attempts in pool.imap_unordered(range(4))}
+    assert outcomes == {task: ("ok", task, 2) for task in range(4)}
+
+
+def test_pool_recycling():
+    with WorkerPool(2, pid_task, chunksize=64, max_tasks_per_worker=5) as pool:
+        pids = [value for task, status, value, attempts in pool.imap_unordered(range(200))]
+    assert len(pids) == 200
+    assert max(collections.Counter(pids).values()) <= 5
+
+
+def failing_experiment(exp_id, param_dict, exp_dir):
+    if param_dict["a"] in (1, 3):
+        raise ValueError("bad %d, with a comma" % exp_id)
+    return {"r": param_dict["a"]*10, "s": "x"}
+
+
+def sleeping_experiment(exp_id, param_dict, exp_dir):
+    if param_dict["a"] == 2:
+        time.sleep(60)
+    return {"r": param_dict["a"]}
+
+
+# Failed rows must have empty results, so that their status and error are in the right columns, whether they're
+# before the first success (a=1), or after the last one (a=3)
+@pytest.mark.parametrize("parallel", [False, True])
+def test_failed_rows_alignment(tmp_path, parallel):
+    param_dict = {"a": [1, 2, 3]}
+    if parallel:
+        sweetsweep.parameter_sweep_parallel(param_dict, failing_experiment, str(tmp_path), max_workers=1,
+                                            result_csv_filename="results.csv", on_error="continue")
+    else:
+        sweetsweep.parameter_sweep(param_dict, failing_experiment, str(tmp_path), result_csv_filename="results.csv",
+                                   on_error="continue")
+    rows = {row["a"]: row for row in read_csv(os.path.join(str(tmp_path), "results.csv"))}
+    assert len(rows) == 3
+    assert rows["2"]["r"] == "20" and rows["2"]["s"] == "x" and rows["2"]["status"] == "ok"
+    for a in ("1", "3"):
+        assert rows[a]["r"] == "" and rows[a]["s"] == ""
+        assert rows[a]["status"] == "failed"
+        assert rows[a]["error"].startswith("ValueError: bad")
+        assert None not in rows[a]  # No extra fields
+
+
+def test_failed_rows_without_success(tmp_path):
+    sweetsweep.parameter_sweep({"a": [1, 3]}, failing_experiment, str(tmp_path), result_csv_filename="results.csv",
+                               on_error="continue")
+    rows = read_csv(os.path.join(str(tmp_path), "results.csv"))
+    assert [row["status"] for row in rows] == ["failed", "failed"]
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_timeout(tmp_path, parallel):
+    kwargs = dict(result_csv_filename="results.csv", timeout=1, on_error="continue")
+    if parallel:
+        sweetsweep.parameter_sweep_parallel({"a": [1, 2, 3]}, sleeping_experiment, str(tmp_path), max_workers=2,
+                                            **kwargs)
+    else:
+        sweetsweep.parameter_sweep({"a": [1, 2, 3]}, sleeping_experiment, str(tmp_path), **kwargs)
+    rows = {row["a"]: row for row in read_csv(os.path.join(str(tmp_path), "results.csv"))}
+    assert {a: row["status"] for a, row in rows.items()} == {"1": "ok", "2": "timeout", "3": "ok"}
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_retries(tmp_path, parallel):
+    marker_dir = tmp_path / "markers"
+    marker_dir.mkdir()
+    sweep_dir = tmp_path / "sweep"
+    sweep_dir.mkdir()
+
+    def experiment(exp_id, param_dict, exp_dir):
+        return {"r": flaky_task(str(marker_dir), exp_id)}
+
+    kwargs = dict(result_csv_filename="results.csv", retries=1, retry_backoff=0.01)
+    if parallel:
+        sweetsweep.parameter_sweep_parallel({"a": [1, 2, 3]}, experiment, str(sweep_dir), max_workers=2, **kwargs)
+    else:
+        sweetsweep.parameter_sweep({"a": [1, 2, 3]}, experiment, str(sweep_dir), **kwargs)
+    rows = read_csv(os.path.join(str(sweep_dir), "results.csv"))
+    assert sorted(row["r"] for row in rows) == ["0", "1", "2"]
+
+
+# The viewer must read CSVs whose error messages contain commas. It runs in its own process, as it needs the Qt
+# backend of matplotlib, which can't be loaded once another backend was (e.g. by another test).
+VIEWER_SCRIPT = """
+import sys, json
+from sweetsweep import viewer
+app = viewer.QtWidgets.QApplication(sys.argv[:1])
+sys.argv = sys.argv[:1]
+w = viewer.Ui()
+w.lineEdit_mainFolder.setText(%r)
+print(json.dumps(w.allResultNames))
+"""
+
+
+def test_viewer_reads_errors_with_commas(tmp_path):
+    pytest.importorskip("PyQt5")
+    param_dict = {"a": [1, 2, 3]}
+    sweetsweep.parameter_sweep(param_dict, failing_experiment, str(tmp_path), result_csv_filename="results.csv",
+                               on_error="continue")
+    with open(os.path.join(str(tmp_path), "sweep.txt"), "w") as f:
+        json.dump(dict(param_dict, viewer_resultsCSV="results.csv"), f)
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", PYTHONPATH=os.pathsep.join([REPO_DIR] + sys.path))
+    env.pop("MPLBACKEND", None)
+    output = subprocess.run([sys.executable, "-c", VIEWER_SCRIPT % str(tmp_path)], env=env, capture_output=True,
+                            text=True, timeout=60)
+    assert output.returncode == 0, output.stderr
+    result_names = json.loads(output.stdout.strip().splitlines()[-1])
+    assert "r" in result_names
+    assert "error" in result_names
@@ -0,0 +1,65 @@
+import os
+import json
+
+import pytest
+
+import sweetsweep
+from sweetsweep.common import parse_dir_layout, get_layout_subdir, list_exp_dirs
+from sweetsweep.sweep import build_dir_name, iterate_param_dicts
+
+PARAM_DICT = {"alpha": [5, 10, 15], "beta": [0.1, 0.2], "gamma": ["Red", "Blue"]}
+
+
+def experiment(exp_id, param_dict, exp_dir):
+    with open(os.path.join(exp_dir, "exp_id.txt"), "w") as f:
+        f.write(str(exp_id))
+    return {"y": exp_id}
+
+
+def test_parse_dir_layout():
+    assert parse_dir_layout(None, PARAM_DICT) is None
+    assert parse_dir_layout("flat", PARAM_DICT) is None
+    assert parse_dir_layout("id", PARAM_DICT, start_index=3) == {"type": "id", "group_size": 1000, "start_index": 3}
+    assert parse_dir_layout("id:4", PARAM_DICT) == {"type": "id", "group_size": 4, "start_index": 0}
+    assert parse_dir_layout("param", PARAM_DICT) == {"type": "param", "param": "alpha"}
+    assert parse_dir_layout("param:gamma", PARAM_DICT, dir_names="hash") == {"type": "param", "param": "gamma",
+                                                                             "names": "hash"}
+    layout = parse_dir_layout("id:4", PARAM_DICT, dir_names="id")
+    assert parse_dir_layout(layout, PARAM_DICT) == layout
+    with pytest.raises(SystemExit):
+        parse_dir_layout("id:0", PARAM_DICT)
+    with pytest.raises(SystemExit):
+        parse_dir_layout("param:delta", PARAM_DICT)
+
+
+def test_get_layout_subdir():
+    current_dict = {"alpha": 10, "beta": 0.2, "gamma": "Red"}
+    assert get_layout_subdir(None, 12, 7, current_dict) == ""
+    assert get_layout_subdir(parse_dir_layout("id:4", PARAM_DICT), 12, 7, current_dict) == "exp_1"
+    assert get_layout_subdir(parse_dir_layout("id:4", PARAM_DICT), 1200, 7, current_dict) == "exp_001"
+    assert get_layout_subdir(parse_dir_layout("param:beta", PARAM_DICT), 12, 7, current_dict) == "beta0.2"
+
+
+# Each experiment is in the folder given by the layout, which is recorded in 'sweep.txt' and gives back the same
+# folders, and list_exp_dirs() finds the folders of a selection of parameter values
+@pytest.mark.parametrize("dir_layout", ["id:4", "param:beta"])
+def test_sweep_layout(tmp_path, dir_layout):
+    sweep_dir = str(tmp_path)
+    sweetsweep.parameter_sweep(PARAM_DICT, experiment, sweep_dir, result_csv_filename="results.csv",
+                               dir_layout=dir_layout)
+    with open(os.path.join(sweep_dir, "sweep.txt")) as f:
+        layout = json.load(f)["viewer_dirLayout"]
+    assert layout == parse_dir_layout(dir_layout, PARAM_DICT)
+    for exp_id, current_dict in enumerate(iterate_param_dicts(PARAM_DICT)):
+        exp_dir = build_dir_name(12, exp_id, current_dict, layout)
+        assert os.path.dirname(exp_dir) == get_layout_subdir(layout, 12, exp_id, current_dict)
+        with open(os.path.join(sweep_dir, exp_dir, "exp_id.txt")) as f:
+            assert f.read() == str(exp_id)
+
+    selection = {"alpha": [10], "beta": [0.2], "gamma": ["Red", "Blue"]}
+    dirs = list_exp_dirs(sweep_dir, layout, PARAM_DICT, selection)
+    selected = [build_dir_name(12, exp_id, current_dict, layout)
+                for exp_id, current_dict in enumerate(iterate_param_dicts(PARAM_DICT))
+                if current_dict["alpha"] == 10 and current_dict["beta"] == 0.2]
+    assert set(selected) <= set(dirs)
+    assert len(dirs) < 12
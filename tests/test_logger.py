@@ -0,0 +1,37 @@
+import os
+import time
+
+from sweetsweep.logger import Logger, LogFile
+
+
+# Log file that writes slowly, so that the queue of the logger fills up
+class SlowLogFile(LogFile):
+
+    def write(self, text):
+        time.sleep(0.001)
+        super().write(text)
+
+
+def print_lines(tmp_path, monkeypatch, **kwargs):
+    monkeypatch.setattr("sweetsweep.logger.LogFile", SlowLogFile)
+    path = os.path.join(str(tmp_path), "output.txt")
+    with Logger(path, max_queue=4, **kwargs) as logger:
+        for i in range(500):
+            print("line %d" % i)
+    with open(path) as f:
+        return logger, f.read()
+
+
+# By default, printing waits for the log file when the queue is full, so that no line is lost
+def test_logger_keeps_all_lines(tmp_path, monkeypatch, capsys):
+    logger, text = print_lines(tmp_path, monkeypatch)
+    assert text == "".join("line %d\n" % i for i in range(500))
+    assert logger.total_dropped == 0
+
+
+# With block=False, the lines that don't fit in the queue are dropped from the log file, and this is reported
+def test_logger_reports_dropped_lines(tmp_path, monkeypatch, capsys):
+    logger, text = print_lines(tmp_path, monkeypatch, block=False)
+    assert logger.total_dropped > 0
+    assert "messages were dropped from the log file]" in text
+    assert "WARNING: %d messages were dropped" % logger.total_dropped in capsys.readouterr().err
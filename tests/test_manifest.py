@@ -0,0 +1,76 @@
+import os
+
+import sweetsweep
+from sweetsweep.manifest import Manifest
+
+
+# Records the experiments that were run, in the sweep folder, so that it also works with worker processes
+def experiment(exp_id, param_dict, exp_dir):
+    with open(os.path.join(os.path.dirname(exp_dir), "calls.txt"), "a") as f:
+        f.write("%d %s %d\n" % (exp_id, param_dict["D"], param_dict["E"]))
+    return {"y": len(param_dict["D"]) * param_dict["E"]}
+
+
+def read_calls(sweep_dir):
+    path = os.path.join(sweep_dir, "calls.txt")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        calls = sorted(tuple(line.split()) for line in f)
+    os.remove(path)
+    return calls
+
+
+def read_lines(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def get_dirs(sweep_dir):
+    return {exp_id: entry["dir"] for exp_id, entry in Manifest(sweep_dir).by_id.items()}
+
+
+# Extending the sweep only runs the new combinations (and not the new redundant ones), and keeps the ids, folders and
+# CSV rows of the previous ones
+def test_extend_sweep_with_specific_dict(tmp_path):
+    sweep_dir = str(tmp_path)
+    specific_dict = {"E": {"D": ["A"]}}
+    kwargs = dict(result_csv_filename="results.csv", specific_dict=specific_dict, stable_ids=True)
+    sweetsweep.parameter_sweep({"D": ["A", "B"], "E": [1, 2]}, experiment, sweep_dir, **kwargs)
+    assert read_calls(sweep_dir) == [("0", "A", "1"), ("1", "A", "2"), ("2", "B", "1")]
+    rows = read_lines(os.path.join(sweep_dir, "results.csv"))
+    dirs = get_dirs(sweep_dir)
+    assert len(rows) == 5 and len(dirs) == 4
+
+    sweetsweep.parameter_sweep({"D": ["A", "B", "C"], "E": [1, 2, 3]}, experiment, sweep_dir, **kwargs)
+    assert read_calls(sweep_dir) == [("4", "A", "3"), ("6", "C", "1")]
+    new_rows = read_lines(os.path.join(sweep_dir, "results.csv"))
+    assert new_rows[:len(rows)] == rows
+    assert new_rows[len(rows):] == ['4,-1,"A",3,3', '5,2,"B",3', '6,-1,"C",1,1', '7,6,"C",2', '8,6,"C",3']
+    new_dirs = get_dirs(sweep_dir)
+    assert {exp_id: new_dirs[exp_id] for exp_id in dirs} == dirs
+    assert all(os.path.isdir(os.path.join(sweep_dir, d)) for d in new_dirs.values())
+
+    # Nothing new: nothing is run
+    sweetsweep.parameter_sweep({"D": ["A", "B", "C"], "E": [1, 2, 3]}, experiment, sweep_dir, **kwargs)
+    assert read_calls(sweep_dir) == []
+    assert read_lines(os.path.join(sweep_dir, "results.csv")) == new_rows
+
+
+def test_extend_parallel_sweep(tmp_path):
+    sweep_dir = str(tmp_path)
+    kwargs = dict(result_csv_filename="results.csv", stable_ids=True, max_workers=2)
+    sweetsweep.parameter_sweep_parallel({"D": ["A", "B"], "E": [1, 2]}, experiment, sweep_dir, **kwargs)
+    assert read_calls(sweep_dir) == [("0", "A", "1"), ("1", "A", "2"), ("2", "B", "1"), ("3", "B", "2")]
+    rows = read_lines(os.path.join(sweep_dir, "results.csv"))
+    dirs = get_dirs(sweep_dir)
+    assert len(rows) == 5 and len(dirs) == 4
+
+    sweetsweep.parameter_sweep_parallel({"D": ["A", "B", "C"], "E": [1, 2]}, experiment, sweep_dir, **kwargs)
+    assert read_calls(sweep_dir) == [("4", "C", "1"), ("5", "C", "2")]
+    new_rows = read_lines(os.path.join(sweep_dir, "results.csv"))
+    assert new_rows[:len(rows)] == rows
+    assert sorted(new_rows[len(rows):]) == ['4,"C",1,1', '5,"C",2,2']
+    new_dirs = get_dirs(sweep_dir)
+    assert {exp_id: new_dirs[exp_id] for exp_id in dirs} == dirs
+    assert all(os.path.isdir(os.path.join(sweep_dir, d)) for d in new_dirs.values())
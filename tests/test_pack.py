@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+import sweetsweep
+from sweetsweep.pack import pack_sweep, unpack_sweep, load_packed_sweep, PACK_INDEX_FILENAME
+
+
+def experiment(exp_id, param_dict, exp_dir):
+    with open(os.path.join(exp_dir, "result.txt"), "w") as f:
+        f.write("%s %s\n" % (param_dict["a"], param_dict["b"]) * 100)
+    with open(os.path.join(exp_dir, "image.bin"), "wb") as f:
+        f.write(bytes([exp_id]) * 1000)
+    return {"y": exp_id}
+
+
+# Contents of all files of the experiment folders, following symlinks
+def read_files(sweep_dir):
+    contents = {}
+    for root, dirs, filenames in os.walk(sweep_dir, followlinks=True):
+        rel_root = os.path.relpath(root, sweep_dir)
+        if rel_root == ".":
+            continue
+        for name in filenames:
+            with open(os.path.join(root, name), "rb") as f:
+                contents[os.path.join(rel_root, name)] = f.read()
+    return contents
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_pack_unpack(tmp_path, compress):
+    sweep_dir = str(tmp_path)
+    # 'b' only matters for a=1: the other experiments with b=2 are redundant, and link to their source folder
+    sweetsweep.parameter_sweep({"a": [1, 2, 3], "b": [1, 2]}, experiment, sweep_dir,
+                               result_csv_filename="results.csv", specific_dict={"b": {"a": [1]}})
+    contents = read_files(sweep_dir)
+    assert len(contents) == 12
+
+    # Small archives, so that the files are spread over several of them
+    assert pack_sweep(sweep_dir, archive_size=50, compress=compress, remove=True) == len(
+        [rel for rel in contents if not os.path.islink(os.path.join(sweep_dir, os.path.dirname(rel)))])
+    assert read_files(sweep_dir) == {}
+    assert len([name for name in os.listdir(sweep_dir) if name.endswith(".zip")]) > 1
+    assert os.path.exists(os.path.join(sweep_dir, "results.csv"))
+
+    packed = load_packed_sweep(sweep_dir)
+    for rel, data in contents.items():
+        assert packed.exists(rel)
+        assert packed.read(rel) == data
+    exp_dirs = sorted(set(os.path.dirname(rel) for rel in contents))
+    assert packed.list_dirs(1) == exp_dirs
+    assert packed.glob(os.path.join(exp_dirs[0], "*.txt")) == [os.path.join(exp_dirs[0], "result.txt")]
+    assert not packed.exists(os.path.join(exp_dirs[0], "missing.txt"))
+    packed.close()
+
+    unpack_sweep(sweep_dir)
+    assert read_files(sweep_dir) == contents
+    assert not os.path.exists(os.path.join(sweep_dir, PACK_INDEX_FILENAME))
+    assert not any(name.endswith(".zip") for name in os.listdir(sweep_dir))
+
+
+# Packing again only packs the new files, in a new archive
+def test_incremental_pack(tmp_path):
+    sweep_dir = str(tmp_path)
+    sweetsweep.parameter_sweep({"a": [1, 2], "b": [1]}, experiment, sweep_dir)
+    assert pack_sweep(sweep_dir) == 4
+    exp_dir = sorted(d for d in os.listdir(sweep_dir) if d.startswith("exp_"))[0]
+    with open(os.path.join(sweep_dir, exp_dir, "new.txt"), "w") as f:
+        f.write("new")
+    assert pack_sweep(sweep_dir) == 1
+    packed = load_packed_sweep(sweep_dir)
+    assert packed.read(os.path.join(exp_dir, "new.txt")) == b"new"
+    assert len(packed.archives) == 2
+    packed.close()
@@ -0,0 +1,95 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+import sweetsweep
+from sweetsweep.results import load_results, load_array_result
+
+PARAM_DICT = {"D": ["A", "B", "C"], "E": [1, 2, 3], "F": [0.5, 1.0]}
+
+
+def experiment(exp_id, param_dict, exp_dir):
+    if param_dict["D"] == "C" and param_dict["E"] == 2:
+        raise ValueError("failed, with a comma")
+    return {"loss": param_dict["E"] * param_dict["F"] + len(param_dict["D"]), "tag": "t%d" % exp_id}
+
+
+@pytest.fixture
+def sweep_dir(tmp_path):
+    sweep_dir = str(tmp_path)
+    with open(os.path.join(sweep_dir, "sweep.txt"), "w") as f:
+        json.dump(dict(PARAM_DICT, viewer_resultsCSV="results.csv"), f)
+    # 'E' only matters for D="A" and "C": the experiments with D="B" and E=2 or 3 are redundant
+    sweetsweep.parameter_sweep(PARAM_DICT, experiment, sweep_dir, result_csv_filename="results.csv",
+                               specific_dict={"E": {"D": ["A", "C"]}}, on_error="continue")
+    return sweep_dir
+
+
+def test_load_results(sweep_dir):
+    results = load_results(sweep_dir)
+    assert results.dims == ["D", "E", "F"]
+    assert results.shape == (3, 3, 2)
+    assert results.names == ["loss", "tag", "status", "error"]
+    loss = results["loss"]
+    assert loss.shape == (3, 3, 2)
+    assert loss.values[0].tolist() == [[1.5, 2.0], [2.0, 3.0], [2.5, 4.0]]
+    # Redundant experiments have the results of their source experiment
+    assert loss.values[1].tolist() == [[1.5, 2.0]]*3
+    assert results["tag"].values[1, 2, 0] == results["tag"].values[1, 0, 0]
+    # The failed experiments have no results
+    assert np.isnan(loss.values[2, 1]).all()
+    assert results["status"].values[2, 1].tolist() == ["failed", "failed"]
+    assert results["error"].values[2, 1, 0] == "ValueError: failed, with a comma"
+
+
+def test_select_and_reduce(sweep_dir):
+    results = load_results(sweep_dir)
+    loss = results.sel(D="A")["loss"]
+    assert loss.dims == ["E", "F"]
+    assert loss.values.tolist() == [[1.5, 2.0], [2.0, 3.0], [2.5, 4.0]]
+    loss_f1 = results.sel(D=["A", "C"], F=1.0)["loss"]
+    assert loss_f1.dims == ["D", "E"]
+    assert np.array_equal(loss_f1.values, [[2.0, 3.0, 4.0], [2.0, np.nan, 4.0]], equal_nan=True)
+    assert loss.mean("F").values.tolist() == [1.75, 2.5, 3.25]
+    assert loss.mean() == pytest.approx(2.5)
+    # NaN are ignored by the reductions
+    c_loss = results["loss"].sel(D="C")
+    assert c_loss.mean("E").values.tolist() == [2.0, 3.0]
+    assert c_loss.count().tolist() == 4
+    assert results["loss"].min(["E", "F"]).values.tolist() == [1.5, 1.5, 1.5]
+    # Best value of a parameter for each value of the others
+    assert results["loss"].argmin("D").values.tolist() == [["A", "A"], ["B", "B"], ["B", "B"]]
+    assert results["loss"].argmax("F").values.tolist() == [[1.0]*3, [1.0]*3, [1.0, 0.5, 1.0]]
+
+
+def array_experiment(exp_id, param_dict, exp_dir):
+    return {"curve": np.arange(4) * param_dict["a"] + param_dict["b"], "final": np.array(exp_id * 1.5)}
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_load_array_result(tmp_path, parallel):
+    sweep_dir = str(tmp_path)
+    param_dict = {"a": [1, 2], "b": [1, 2]}
+    if parallel:
+        sweetsweep.parameter_sweep_parallel(param_dict, array_experiment, sweep_dir, max_workers=2,
+                                            result_csv_filename="results.csv")
+    else:
+        # 'b' only matters for a=1: experiment 3 (a=2, b=2) is redundant with experiment 2 (a=2, b=1)
+        sweetsweep.parameter_sweep(param_dict, array_experiment, sweep_dir, result_csv_filename="results.csv",
+                                   specific_dict={"b": {"a": [1]}})
+
+    # The CSV holds the paths of the arrays, and the values of 0-d arrays
+    with open(os.path.join(sweep_dir, "results.csv")) as f:
+        text = f.read()
+    assert "result_curve.npy" in text
+    assert "result_final.npy" not in text
+
+    curves = load_array_result(sweep_dir, "curve")
+    assert curves.exp_ids() == [0, 1, 2, 3]
+    assert curves[0].tolist() == [1, 2, 3, 4]
+    assert curves[2].tolist() == [1, 3, 5, 7]
+    assert curves[3].tolist() == ([1, 3, 5, 7] if not parallel else [2, 4, 6, 8])
+    assert curves.stack().shape == (4, 4)
+    assert curves.stack([0, 1]).tolist() == [[1, 2, 3, 4], [2, 3, 4, 5]]
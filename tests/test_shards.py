@@ -0,0 +1,58 @@
+import os
+import csv
+import multiprocessing
+
+import sweetsweep
+from sweetsweep.shards import get_shard_exp_ids
+
+PARAM_DICT = {"a": [1, 2, 3, 4], "b": [1, 2, 3, 4]}
+
+
+def experiment(exp_id, param_dict, exp_dir):
+    return {"y": param_dict["a"] * param_dict["b"]}
+
+
+def run_shard(sweep_dir, shard, num_shards, barrier):
+    exp_ids = get_shard_exp_ids(16, shard, num_shards)
+    barrier.wait()  # Start all shards at the same time
+    sweetsweep.parameter_sweep_parallel(PARAM_DICT, experiment, sweep_dir, max_workers=1, exp_ids=exp_ids,
+                                        result_csv_filename="results.csv")
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_shard_exp_ids():
+    shards = [get_shard_exp_ids(10, k, 3) for k in range(3)]
+    assert [list(r) for r in shards] == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    strided = [list(get_shard_exp_ids(10, k, 3, start_index=5, strided=True)) for k in range(3)]
+    assert strided == [[5, 8, 11, 14], [6, 9, 12], [7, 10, 13]]
+
+
+# Shards running at the same time append to the same CSV and timings files, which must have a single header
+def test_concurrent_shards(tmp_path):
+    sweep_dir = str(tmp_path)
+    for attempt in range(3):
+        for name in ("results.csv", "timings.csv"):
+            if os.path.exists(os.path.join(sweep_dir, name)):
+                os.remove(os.path.join(sweep_dir, name))
+        num_shards = 4
+        barrier = multiprocessing.Barrier(num_shards)
+        processes = [multiprocessing.Process(target=run_shard, args=(sweep_dir, k, num_shards, barrier))
+                     for k in range(num_shards)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        rows = read_csv(os.path.join(sweep_dir, "results.csv"))
+        assert rows[0] == ["exp_id", "a", "b", "y"]
+        assert sorted(int(row[0]) for row in rows[1:]) == list(range(16))
+        for row in rows[1:]:
+            assert float(row[3]) == float(row[1]) * float(row[2])
+        timings = read_csv(os.path.join(sweep_dir, "timings.csv"))
+        assert timings[0] == ["a", "b", "time"]
+        assert len(timings) == 17
@@ -0,0 +1,76 @@
+import os
+import time
+import signal
+import multiprocessing
+
+from sweetsweep.stages import Stage
+
+
+def square(stage_params):
+    return stage_params["x"]**2
+
+
+def hang(stage_params):
+    time.sleep(60)
+
+
+def get_lock_path(cache_dir):
+    locks = [name for name in os.listdir(cache_dir) if name.endswith(".lock")]
+    return os.path.join(cache_dir, locks[0]) if locks else None
+
+
+# The lock of a process killed while computing an output is reclaimed by the next process, without waiting for it
+# to expire
+def test_lock_of_killed_process_is_reclaimed(tmp_path):
+    cache_dir = str(tmp_path)
+    process = multiprocessing.Process(target=Stage(hang, ["x"], name="square", cache_dir=cache_dir).get,
+                                      args=({"x": 3},))
+    process.start()
+    t0 = time.time()
+    while get_lock_path(cache_dir) is None or os.path.getsize(get_lock_path(cache_dir)) == 0:
+        assert time.time() - t0 < 10
+        time.sleep(0.05)
+    os.kill(process.pid, signal.SIGKILL)
+    process.join()
+
+    stage = Stage(square, ["x"], name="square", cache_dir=cache_dir, lock_timeout=3600)
+    t0 = time.time()
+    assert stage.get({"x": 3}) == 9
+    assert time.time() - t0 < 5
+    assert get_lock_path(cache_dir) is None
+
+
+# A lock held by a process on another machine is reclaimed when it's not refreshed anymore
+def test_expired_lock_is_reclaimed(tmp_path):
+    cache_dir = str(tmp_path)
+    stage = Stage(square, ["x"], cache_dir=cache_dir, lock_timeout=1)
+    stage.get({"x": 2})
+    pkl_path = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".pkl")][0]
+    os.remove(pkl_path)
+    lock_path = pkl_path + ".lock"
+    with open(lock_path, "w") as f:
+        f.write("another-host:1")
+    stage = Stage(square, ["x"], cache_dir=cache_dir, lock_timeout=1)
+    t0 = time.time()
+    assert stage.get({"x": 2}) == 4
+    assert 0.9 < time.time() - t0 < 5
+    assert not os.path.exists(lock_path)
+
+
+# The lock of a live process is refreshed while it computes, so it doesn't expire
+def test_lock_is_refreshed(tmp_path):
+    cache_dir = str(tmp_path)
+
+    def slow_square(stage_params):
+        time.sleep(1.5)
+        return square(stage_params)
+
+    process = multiprocessing.Process(target=Stage(slow_square, ["x"], name="square", cache_dir=cache_dir,
+                                                   lock_timeout=0.5).get, args=({"x": 5},))
+    process.start()
+    while get_lock_path(cache_dir) is None:
+        time.sleep(0.05)
+    stage = Stage(square, ["x"], name="square", cache_dir=cache_dir, lock_timeout=0.5)
+    assert stage.get({"x": 5}) == 25
+    process.join()
+    assert stage.misses == 0 and stage.disk_hits == 1
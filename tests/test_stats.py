@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from sweetsweep.stats import sweep_stats
+
+HEADER = "exp_id,src_exp_id,D,E,loss"
+# Experiments 3 and 5 are redundant with experiment 2, 7 and 8 with experiment 6
+ROWS = [(0, -1, "A", 1, 0.5), (1, -1, "A", 2, 0.2), (2, -1, "B", 1, 0.9), (3, 2, "B", 2, None),
+        (4, -1, "A", 3, 0.7), (5, 2, "B", 3, None), (6, -1, "C", 1, 0.1), (7, 6, "C", 2, None), (8, 6, "C", 3, None)]
+
+
+def write_csv(path, rows):
+    with open(path, "w") as f:
+        f.write(HEADER + "\n")
+        for exp_id, src_exp_id, d, e, loss in rows:
+            f.write('%d,%d,"%s",%d%s\n' % (exp_id, src_exp_id, d, e, "" if loss is None else ",%g" % loss))
+
+
+# Same sweep, with the rows of the redundant experiments replaced by copies of the rows of their source experiment
+def expand_aliases(rows):
+    losses = {row[0]: row[4] for row in rows}
+    return [(exp_id, -1, d, e, losses[src_exp_id] if src_exp_id != -1 else loss)
+            for exp_id, src_exp_id, d, e, loss in rows]
+
+
+@pytest.mark.parametrize("by", [None, ["D"], ["E"], ["D", "E"]])
+@pytest.mark.parametrize("maximize", [False, True])
+def test_aliases_weighted_like_copies(tmp_path, by, maximize):
+    aliased_path = os.path.join(str(tmp_path), "aliased.csv")
+    expanded_path = os.path.join(str(tmp_path), "expanded.csv")
+    write_csv(aliased_path, ROWS)
+    write_csv(expanded_path, expand_aliases(ROWS))
+    # Small chunks, so that sources and aliases are in different chunks
+    aliased = sweep_stats(str(tmp_path), metrics=["loss"], by=by, maximize=maximize,
+                          result_csv_filename="aliased.csv", chunk_size=2)
+    expanded = sweep_stats(str(tmp_path), metrics=["loss"], by=by, maximize=maximize,
+                           result_csv_filename="expanded.csv", chunk_size=2)
+
+    assert aliased["counts"]["rows"] == 9
+    assert aliased["counts"]["run"] == 5 and aliased["counts"]["redundant"] == 4
+    sources = {str(row[0]): str(row[1] if row[1] != -1 else row[0]) for row in ROWS}
+    assert set(aliased["groups"].groups) == set(expanded["groups"].groups)
+    for key, group in expanded["groups"].groups.items():
+        n, total, minimum, maximum, best_exp_id, best = group["loss"]
+        a_n, a_total, a_minimum, a_maximum, a_best_exp_id, a_best = aliased["groups"].groups[key]["loss"]
+        assert a_n == n
+        assert a_total/a_n == pytest.approx(total/n)
+        assert (a_minimum, a_maximum, a_best) == (minimum, maximum, best)
+        # The best experiment is given by the id of the experiment that was run
+        assert a_best_exp_id == sources[best_exp_id]
+
+
+def test_alias_group_values(tmp_path):
+    write_csv(os.path.join(str(tmp_path), "results.csv"), ROWS)
+    stats = sweep_stats(str(tmp_path), metrics=["loss"], by=["E"], result_csv_filename="results.csv")
+    groups = stats["groups"].groups
+    # E=2: experiments 1 (0.2), 3 (0.9 from 2) and 7 (0.1 from 6)
+    n, total, minimum, maximum, best_exp_id, best = groups["2"]["loss"]
+    assert n == 3 and total/n == pytest.approx(0.4)
+    assert (minimum, maximum, best_exp_id) == (0.1, 0.9, "6")
+    assert np.isclose(groups["3"]["loss"][1], 0.7 + 0.9 + 0.1)
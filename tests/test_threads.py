@@ -0,0 +1,26 @@
+import multiprocessing
+
+import pytest
+
+from sweetsweep import threads
+
+
+@pytest.mark.parametrize("installed", [False, True])
+def test_thread_limits_warning(monkeypatch, installed):
+    monkeypatch.setattr(threads, "has_threadpoolctl", lambda: installed)
+    warning = threads.get_thread_limits_warning(2, "thread")
+    assert (warning is None) == installed
+    # Forked workers inherit the libraries loaded by the main process, but spawned ones load them again
+    monkeypatch.setattr(multiprocessing, "get_start_method", lambda: "fork")
+    assert (threads.get_thread_limits_warning(2, "process") is None) == installed
+    monkeypatch.setattr(multiprocessing, "get_start_method", lambda: "spawn")
+    assert threads.get_thread_limits_warning(2, "process") is None
+    assert threads.get_thread_limits_warning(0, "thread") is None
+
+
+def test_choose_workers_threads(monkeypatch):
+    monkeypatch.setattr(threads, "get_available_cpus", lambda: list(range(8)))
+    assert threads.choose_workers_threads(100) == (8, 1)
+    assert threads.choose_workers_threads(2) == (2, 4)
+    assert threads.choose_workers_threads(100, threads_per_worker=2) == (4, 2)
+    assert threads.get_core_sets(2, 3) == [[0, 1, 2], [3, 4, 5]]
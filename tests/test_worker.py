@@ -0,0 +1,102 @@
+import os
+import csv
+import sys
+import json
+import time
+import subprocess
+
+from sweetsweep.worker import prepare_distributed_sweep, LEASE_DIRNAME
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def experiment(exp_id, param_dict, exp_dir):
+    time.sleep(0.05)
+    return {"y": param_dict["a"] * param_dict["b"]}
+
+
+def failing_experiment(exp_id, param_dict, exp_dir):
+    if exp_id == 5:
+        raise ValueError("bad experiment")
+    return experiment(exp_id, param_dict, exp_dir)
+
+
+def crashing_experiment(exp_id, param_dict, exp_dir):
+    if exp_id == 5:
+        os._exit(1)
+    return experiment(exp_id, param_dict, exp_dir)
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def start_worker(sweep_dir):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, os.environ.get("PYTHONPATH", "")]))
+    return subprocess.Popen([sys.executable, "-m", "sweetsweep", "worker", sweep_dir], env=env,
+                            stdout=subprocess.DEVNULL)
+
+
+# Several workers run each experiment exactly once, including one whose lease was held by a worker that died
+def test_workers_run_each_experiment_once(tmp_path):
+    sweep_dir = str(tmp_path)
+    param_dict = {"a": [1, 2, 3, 4], "b": [1, 2, 3]}
+    prepare_distributed_sweep(param_dict, "%s:experiment" % os.path.abspath(__file__), sweep_dir,
+                              result_csv_filename="results.csv", lease_time=1)
+    # Lease of a dead worker, that isn't refreshed anymore
+    lease_path = os.path.join(sweep_dir, LEASE_DIRNAME, "5.lease")
+    with open(lease_path, "w") as f:
+        f.write("dead-worker")
+
+    workers = [start_worker(sweep_dir) for _ in range(3)]
+    for worker in workers:
+        assert worker.wait(timeout=120) == 0
+
+    with open(os.path.join(sweep_dir, "results.csv"), newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(int(row["exp_id"]) for row in rows) == list(range(12))
+    for row in rows:
+        assert float(row["y"]) == float(row["a"]) * float(row["b"])
+    assert sorted(os.listdir(os.path.join(sweep_dir, LEASE_DIRNAME))) == sorted("%d.done" % i for i in range(12))
+
+
+# A failing experiment is marked as done with its error, and the workers go on with the other experiments
+def test_workers_continue_after_failure(tmp_path):
+    sweep_dir = str(tmp_path)
+    prepare_distributed_sweep({"a": [1, 2, 3, 4], "b": [1, 2, 3]}, "%s:failing_experiment" % os.path.abspath(__file__),
+                              sweep_dir, result_csv_filename="results.csv", lease_time=1, on_error="continue")
+    workers = [start_worker(sweep_dir) for _ in range(3)]
+    assert [worker.wait(timeout=120) for worker in workers] == [0, 0, 0]
+
+    rows = {int(row["exp_id"]): row for row in read_csv(os.path.join(sweep_dir, "results.csv"))}
+    assert sorted(rows) == list(range(12))
+    assert rows[5]["status"] == "failed" and rows[5]["y"] == "" and rows[5]["error"] == "ValueError: bad experiment"
+    assert all(row["status"] == "ok" for exp_id, row in rows.items() if exp_id != 5)
+    with open(os.path.join(sweep_dir, LEASE_DIRNAME, "5.done")) as f:
+        assert json.load(f) == {"status": "failed", "error": "ValueError: bad experiment"}
+
+
+# With on_error="raise", only the worker that ran the failing experiment stops
+def test_workers_raise(tmp_path):
+    sweep_dir = str(tmp_path)
+    prepare_distributed_sweep({"a": [1, 2, 3, 4], "b": [1, 2, 3]}, "%s:failing_experiment" % os.path.abspath(__file__),
+                              sweep_dir, result_csv_filename="results.csv", lease_time=1)
+    workers = [start_worker(sweep_dir) for _ in range(3)]
+    assert sorted(worker.wait(timeout=120) != 0 for worker in workers) == [False, False, True]
+    rows = read_csv(os.path.join(sweep_dir, "results.csv"))
+    assert sorted(int(row["exp_id"]) for row in rows) == [i for i in range(12) if i != 5]
+    assert os.path.exists(os.path.join(sweep_dir, LEASE_DIRNAME, "5.done"))
+
+
+# An experiment that kills its workers is failed after retries+1 attempts
+def test_experiment_killing_workers(tmp_path):
+    sweep_dir = str(tmp_path)
+    prepare_distributed_sweep({"a": [1, 2, 3, 4], "b": [1, 2, 3]}, "%s:crashing_experiment" % os.path.abspath(__file__),
+                              sweep_dir, result_csv_filename="results.csv", lease_time=1, retries=1,
+                              on_error="continue")
+    workers = [start_worker(sweep_dir) for _ in range(3)]
+    assert sorted(worker.wait(timeout=120) != 0 for worker in workers) == [False, True, True]
+    rows = {int(row["exp_id"]): row for row in read_csv(os.path.join(sweep_dir, "results.csv"))}
+    assert sorted(rows) == list(range(12))
+    assert rows[5]["status"] == "failed"